@@ -0,0 +1,155 @@
+"""
+Prometheus metrics for Customer Health API
+
+Hot-path hooks only touch pre-registered prometheus_client metrics (a lock
+and a few additions, a few microseconds against millisecond queries):
+
+  - request latency per route template, via the HTTP middleware in main.py
+  - duration and row count of every scoring query, via engine cursor events;
+    queries opt in with execution_options(metrics_factor=..., metrics_query=...)
+  - scoring pass duration per source and scope, and snapshots written
+  - events ingested / rejected and ingest batch duration
+  - score changes pushed, stream subscribers and drops for slow subscribers
+
+Pool, cache and replica routing figures already exist as counters elsewhere
+and are read only when /metrics is scraped. Metrics are per process; with
+several uvicorn workers, scrape each one (or run a single worker per pod).
+Set METRICS_ENABLED=false to skip the request and query hooks entirely.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+# Scoring queries run from ~1 ms (per customer) to tens of seconds (bulk passes)
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template',
+    ['method', 'route', 'status']
+)
+FACTOR_QUERY_SECONDS = Histogram(
+    'health_factor_query_duration_seconds', 'Scoring query duration by health factor',
+    ['factor', 'query'], buckets=QUERY_BUCKETS
+)
+FACTOR_QUERY_ROWS = Histogram(
+    'health_factor_query_rows', 'Rows returned by scoring queries by health factor',
+    ['factor', 'query'], buckets=ROW_BUCKETS
+)
+SCORING_SECONDS = Histogram(
+    'health_score_duration_seconds', 'Health score computation time (scope: customer or bulk)',
+    ['source', 'scope'], buckets=QUERY_BUCKETS
+)
+SNAPSHOTS_WRITTEN = Counter('health_score_snapshots_written_total', 'Health score snapshots written')
+SCORE_CHANGES_NOTIFIED = Counter('health_score_changes_notified_total', 'Score/label changes sent to NOTIFY')
+SCORE_STREAM_SUBSCRIBERS = Gauge('health_score_stream_subscribers', 'Connected score change subscribers')
+SCORE_STREAM_DROPPED = Counter('health_score_stream_dropped_total', 'Changes dropped for slow subscribers')
+EVENTS_INGESTED = Counter('events_ingested_total', 'Events written', ['path'])
+EVENTS_REJECTED = Counter('events_rejected_total', 'Events rejected by validation', ['path'])
+INGEST_BATCH_SECONDS = Histogram(
+    'event_ingest_batch_duration_seconds', 'Time to validate, write and commit one ingest batch',
+    ['path'], buckets=QUERY_BUCKETS
+)
+
+
+def metrics_enabled() -> bool:
+    return os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+
+def instrument_query_metrics(engine) -> None:
+    """Time statements tagged with metrics_factor on this engine (sync or async)."""
+    if not metrics_enabled():
+        return
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and 'metrics_factor' in context.execution_options:
+            context.metrics_started_at = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def observe(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, 'metrics_started_at', None)
+        if started_at is None:
+            return
+        options = context.execution_options
+        labels = (options['metrics_factor'], options.get('metrics_query', options['metrics_factor']))
+        FACTOR_QUERY_SECONDS.labels(*labels).observe(time.perf_counter() - started_at)
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            FACTOR_QUERY_ROWS.labels(*labels).observe(cursor.rowcount)
+
+
+@contextmanager
+def observe_scoring(source: str, scope: str) -> Iterator[None]:
+    """Time a scoring pass (scope 'customer' or 'bulk')."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        SCORING_SECONDS.labels(source, scope).observe(time.perf_counter() - started_at)
+
+
+def record_ingest(path: str, inserted: int, rejected: int, seconds: float) -> None:
+    EVENTS_INGESTED.labels(path).inc(inserted)
+    if rejected:
+        EVENTS_REJECTED.labels(path).inc(rejected)
+    INGEST_BATCH_SECONDS.labels(path).observe(seconds)
+
+
+class StatsCollector:
+    """Exports the pool, score cache and replica routing counters at scrape time."""
+
+    POOL_GAUGES = ('size', 'checked_in', 'checked_out', 'overflow', 'max_overflow', 'wait_seconds_max')
+    POOL_COUNTERS = ('connects', 'checkouts', 'checkins', 'invalidations', 'soft_invalidations',
+                     'timeouts', 'wait_count', 'wait_seconds_total')
+    CACHE_GAUGES = ('size', 'maxsize', 'hit_rate')
+    CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')
+
+    def describe(self):
+        # Without describe() the registry calls collect() at registration, while
+        # app.database (which imports this module) is still initializing
+        return []
+
+    def collect(self):
+        from ..database import read_router
+        from ..db.pool import get_pool_stats
+        from ..services.score_cache import get_score_cache
+
+        pool_stats = get_pool_stats()
+        for name in self.POOL_GAUGES:
+            family = GaugeMetricFamily(f'db_pool_{name}', f'Connection pool {name}', labels=['engine'])
+            for engine_name, stats in pool_stats.items():
+                family.add_metric([engine_name], stats[name])
+            yield family
+        for name in self.POOL_COUNTERS:
+            family = CounterMetricFamily(f'db_pool_{name}', f'Connection pool {name}', labels=['engine'])
+            for engine_name, stats in pool_stats.items():
+                family.add_metric([engine_name], stats[name])
+            yield family
+
+        cache_stats = get_score_cache().stats()
+        for name in self.CACHE_GAUGES:
+            if cache_stats.get(name) is not None:
+                yield GaugeMetricFamily(f'health_cache_{name}', f'Score cache {name}', value=cache_stats[name])
+        for name in self.CACHE_COUNTERS:
+            if cache_stats.get(name) is not None:
+                yield CounterMetricFamily(f'health_cache_{name}', f'Score cache {name}', value=cache_stats[name])
+
+        family = CounterMetricFamily('db_read_routing', 'Reads routed to replicas or the primary',
+                                     labels=['outcome'])
+        for outcome, count in read_router.stats.items():
+            family.add_metric([outcome], count)
+        yield family
+
+
+REGISTRY.register(StatsCollector())
+
+
+def render_metrics():
+    """Body and content type for the /metrics endpoint."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
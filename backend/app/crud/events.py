@@ -0,0 +1,104 @@
+"""
+Event queries for Customer Health API
+
+Keyset pagination over a customer's events ordered newest first by (ts, id),
+plus a streaming variant that reads from a server-side cursor.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(ts: datetime, event_id: str) -> str:
+    """Opaque cursor pointing just past the given (ts, id)."""
+    raw = json.dumps([ts.isoformat(), str(event_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, event_id = json.loads(raw)
+        return datetime.fromisoformat(ts), str(event_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def event_to_dict(row: Any) -> Dict[str, Any]:
+    return {
+        "id": str(row.id),
+        "customer_id": row.customer_id,
+        "event_type": row.event_type,
+        "ts": row.ts.isoformat(),
+        "event_metadata": row.event_metadata
+    }
+
+
+def _events_query(customer_id: str, event_types: Optional[List[str]], start: Optional[datetime],
+                  end: Optional[datetime], cursor: Optional[str], limit: Optional[int]):
+    conditions = ["customer_id = :customer_id"]
+    params: Dict[str, Any] = {"customer_id": customer_id}
+    if event_types:
+        conditions.append("event_type = ANY(:event_types)")
+        params["event_types"] = event_types
+    if start is not None:
+        conditions.append("ts >= :start")
+        params["start"] = start
+    if end is not None:
+        conditions.append("ts <= :end")
+        params["end"] = end
+    if cursor:
+        params["cursor_ts"], params["cursor_id"] = decode_cursor(cursor)
+        conditions.append("(ts, id) < (:cursor_ts, :cursor_id)")
+    sql = f"""
+        SELECT id, customer_id, event_type, ts, event_metadata
+        FROM events
+        WHERE {' AND '.join(conditions)}
+        ORDER BY ts DESC, id DESC
+    """
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    return text(sql), params
+
+
+def list_customer_events(db: Session, customer_id: str, limit: int = 100,
+                         cursor: Optional[str] = None, event_types: Optional[List[str]] = None,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Return one page of events (newest first) and the cursor for the next page.
+
+    Fetches limit + 1 rows to know whether another page exists without a COUNT.
+    """
+    query, params = _events_query(customer_id, event_types, start, end, cursor, limit + 1)
+    rows = db.execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "events": [event_to_dict(row) for row in rows],
+        "next_cursor": encode_cursor(rows[-1].ts, rows[-1].id) if has_more else None
+    }
+
+
+def stream_customer_events(db: Session, customer_id: str, event_types: Optional[List[str]] = None,
+                           start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           cursor: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every matching event from a server-side cursor, STREAM_BATCH_SIZE rows at a time.
+
+    Memory stays flat regardless of how many events the customer has.
+    """
+    query, params = _events_query(customer_id, event_types, start, end, cursor, None)
+    result = db.connection().execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(query, params)
+    try:
+        for row in result:
+            yield event_to_dict(row)
+    finally:
+        result.close()
@@ -0,0 +1,266 @@
+"""
+Monthly partitions of the events table
+
+events is range-partitioned on ts into one partition per calendar month
+(events_YYYY_MM, bounds in UTC) plus events_default, which catches rows outside
+every partition so inserts never fail. This module:
+
+  - creates partitions ahead of time (and moves any rows that already landed in
+    events_default for that month into the new partition)
+  - detaches partitions older than the retention period, exports them to
+    gzip-compressed CSV files and drops them
+
+Scores are unaffected by retention as long as it is longer than the scoring
+window plus the API growth look-back; history served from
+customer_daily_rollups survives archiving.
+
+    python -m app.db.partitions maintain --months-ahead 3
+    python -m app.db.partitions archive --retention-months 24 --archive-dir /var/lib/customer_health/archive
+    python -m app.db.partitions list
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^events_(\d{4})_(\d{2})$")
+DEFAULT_PARTITION = "events_default"
+
+# Held until commit by whoever creates partitions (every API worker at startup, cron)
+PARTITION_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('events:partitions'))")
+
+
+def get_partition_settings() -> Dict[str, Any]:
+    """Partition maintenance settings read from EVENT_* environment variables."""
+    return {
+        'months_ahead': int(os.getenv('EVENT_PARTITION_MONTHS_AHEAD', '3')),
+        # 0 keeps every partition
+        'retention_months': int(os.getenv('EVENT_RETENTION_MONTHS', '0')),
+        'archive_dir': os.getenv('EVENT_ARCHIVE_DIR', 'archive')
+    }
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"events_{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _bounds(month: date) -> Dict[str, str]:
+    return {'lo': f"{month.isoformat()} 00:00:00+00", 'hi': f"{add_months(month, 1).isoformat()} 00:00:00+00"}
+
+
+def list_event_partitions(db: Session) -> List[Dict[str, Any]]:
+    """Attached monthly partitions, oldest first, with row estimates and on-disk size."""
+    rows = db.execute(text("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'events'::regclass
+    """)).fetchall()
+    partitions = []
+    for name, rows_estimate, total_bytes in rows:
+        month = partition_month(name)
+        partitions.append({
+            'name': name,
+            'month': month.isoformat() if month else None,
+            'rows_estimate': max(rows_estimate, 0),
+            'total_bytes': total_bytes
+        })
+    return sorted(partitions, key=lambda p: (p['month'] is None, p['month'] or ''))
+
+
+def events_partitioned(db: Session) -> bool:
+    """Whether events is a partitioned table (migration 0003 has run)."""
+    return db.execute(text("SELECT relkind FROM pg_class WHERE oid = 'events'::regclass")).scalar() == 'p'
+
+
+def create_event_partition(db: Session, month: date) -> bool:
+    """
+    Create the partition for one month if it does not exist. Returns True if created.
+
+    Rows for that month already sitting in events_default are moved into the new
+    partition first; Postgres refuses to attach a range the default partition overlaps.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    exists = db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+    if exists:
+        return False
+
+    bounds = _bounds(month)
+    stray_rows = db.execute(text(f"""
+        SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE ts >= :lo AND ts < :hi)
+    """), bounds).scalar()
+    if not stray_rows:
+        db.execute(text(f"""
+            CREATE TABLE {name} PARTITION OF events
+            FOR VALUES FROM ('{bounds['lo']}') TO ('{bounds['hi']}')
+        """))
+    else:
+        db.execute(text(f"CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        db.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE ts >= :lo AND ts < :hi RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """), bounds)
+        db.execute(text(f"""
+            ALTER TABLE events ATTACH PARTITION {name}
+            FOR VALUES FROM ('{bounds['lo']}') TO ('{bounds['hi']}')
+        """))
+    logger.info("Created events partition %s", name)
+    return True
+
+
+def ensure_event_partitions(db: Session, start: Optional[date] = None, end: Optional[date] = None,
+                            months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Create every missing monthly partition from start's month to end's month.
+
+    Defaults to the current month through months_ahead months from now. Returns
+    the names of partitions created; the caller commits. Concurrent callers are
+    serialized until that commit, so the later ones find the partitions created
+    instead of failing to create them again.
+    """
+    if not events_partitioned(db):
+        logger.warning("events is not partitioned; run `alembic upgrade head`")
+        return []
+    db.execute(PARTITION_LOCK_SQL)
+    today = datetime.now(timezone.utc).date()
+    if months_ahead is None:
+        months_ahead = get_partition_settings()['months_ahead']
+    month = month_start(start or today)
+    last = month_start(end) if end else add_months(month_start(today), months_ahead)
+    created = []
+    while month <= last:
+        if create_event_partition(db, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def _detached_partitions(db: Session) -> List[str]:
+    """Monthly tables left detached by an interrupted archive run."""
+    rows = db.execute(text("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'r'
+          AND n.nspname = current_schema()
+          AND c.relname ~ '^events_[0-9]{4}_[0-9]{2}$'
+          AND NOT c.relispartition
+    """)).fetchall()
+    return [row[0] for row in rows]
+
+
+def _export_table(db: Session, name: str, archive_dir: str) -> str:
+    """COPY a table into archive_dir/<name>.csv.gz (written to a temp file, then renamed)."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = path + ".tmp"
+    cursor = db.connection().connection.cursor()
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as f:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    finally:
+        cursor.close()
+    # The table is dropped right after this returns; make sure the archive is on disk
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def archive_event_partitions(db: Session, retention_months: Optional[int] = None,
+                             archive_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Detach, export and drop monthly partitions that ended before the retention cutoff.
+
+    Each partition is detached and committed first (a short lock on events), so the
+    slow export never blocks readers or writers. Tables left detached by a failed
+    run are picked up again on the next one. Returns one entry per archived partition.
+    """
+    settings = get_partition_settings()
+    retention_months = settings['retention_months'] if retention_months is None else retention_months
+    archive_dir = archive_dir or settings['archive_dir']
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(datetime.now(timezone.utc).date()), -retention_months)
+    for partition in list_event_partitions(db):
+        month = partition_month(partition['name'])
+        if month is not None and add_months(month, 1) <= cutoff:
+            db.execute(text(f"ALTER TABLE events DETACH PARTITION {partition['name']}"))
+            db.commit()
+            logger.info("Detached events partition %s", partition['name'])
+
+    archived = []
+    for name in sorted(_detached_partitions(db)):
+        if add_months(partition_month(name), 1) > cutoff:
+            continue
+        rows = db.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar()
+        path = _export_table(db, name, archive_dir)
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        logger.info("Archived %s (%d rows) to %s", name, rows, path)
+        archived.append({'name': name, 'rows': rows, 'path': path})
+    return archived
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.db.partitions", description="Maintain events partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    maintain = subparsers.add_parser("maintain", help="Create missing partitions")
+    maintain.add_argument("--start", type=date.fromisoformat, help="First month to create (default: current)")
+    maintain.add_argument("--end", type=date.fromisoformat, help="Last month to create")
+    maintain.add_argument("--months-ahead", type=int, help="Months after the current one (default: env)")
+    archive = subparsers.add_parser("archive", help="Archive partitions past the retention period")
+    archive.add_argument("--retention-months", type=int, help="Months of events to keep (default: env)")
+    archive.add_argument("--archive-dir", help="Directory for .csv.gz exports (default: env)")
+    subparsers.add_parser("list", help="Show partitions and their sizes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    db = SessionLocal()
+    try:
+        db.execute(text("SET statement_timeout = 0"))
+        if args.command == "maintain":
+            result: Any = ensure_event_partitions(db, args.start, args.end, args.months_ahead)
+            db.commit()
+        elif args.command == "archive":
+            result = archive_event_partitions(db, args.retention_months, args.archive_dir)
+        else:
+            result = list_event_partitions(db)
+    finally:
+        db.close()
+    json.dump(result, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
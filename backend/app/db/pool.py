@@ -0,0 +1,139 @@
+"""
+Connection pool configuration and instrumentation for Customer Health API
+"""
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def get_pool_settings() -> Dict[str, Any]:
+    """Pool sizing read from DB_POOL_* environment variables."""
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+
+
+def get_statement_timeout_ms() -> int:
+    """Per-statement timeout applied to every connection (0 disables it)."""
+    return int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+
+
+class PoolMetrics:
+    """Thread-safe counters for one connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'timeouts': self.timeouts,
+                'wait_count': self.wait_count,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_avg': round(self.wait_seconds_total / self.wait_count, 6) if self.wait_count else 0.0,
+                'wait_seconds_max': round(self.wait_seconds_max, 6)
+            }
+
+
+class _WaitTimingMixin:
+    """Times how long callers wait to get a connection out of the pool."""
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the counters across it
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_WaitTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+_instrumented_engines: Dict[str, Any] = {}
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Attach pool event counters to an engine (sync or async) and register it for reporting."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    def counter(attr):
+        def listener(*args):
+            sync_engine.pool.metrics.incr(attr)
+        return listener
+
+    event.listen(sync_engine, 'connect', counter('connects'))
+    event.listen(sync_engine, 'checkout', counter('checkouts'))
+    event.listen(sync_engine, 'checkin', counter('checkins'))
+    event.listen(sync_engine, 'invalidate', counter('invalidations'))
+    event.listen(sync_engine, 'soft_invalidate', counter('soft_invalidations'))
+    _instrumented_engines[name] = sync_engine
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Current gauges and cumulative counters for every instrumented pool."""
+    stats = {}
+    for name, sync_engine in _instrumented_engines.items():
+        pool = sync_engine.pool
+        stats[name] = {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(0, pool.overflow()),
+            'max_overflow': pool._max_overflow,
+            **pool.metrics.snapshot()
+        }
+    return stats
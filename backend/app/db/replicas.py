@@ -0,0 +1,239 @@
+"""
+Read replica routing for Customer Health API
+
+Read-only endpoints and snapshot scoring can be served by streaming replicas
+listed in DATABASE_REPLICA_URLS (comma-separated); writes always go to the
+primary. Replicas are used round-robin.
+
+Read-your-writes: after events commit, the primary's WAL position (LSN) is
+sent back to the client in the X-Write-LSN header and the write_lsn cookie.
+A read that carries it (header or cookie) only uses a replica that has
+replayed past that position; until then it falls back to the primary. Because
+the position travels with the client, this holds whichever worker serves the
+read. The position is also recorded per customer in this process
+(WriteMarks), which covers clients that drop the header and cookie as long as
+the same worker serves the read. Both expire after DB_READ_YOUR_WRITES_SECONDS;
+a mark is not dropped when one replica catches up, as the next read may be
+sent to another replica that has not.
+
+Pointing a replica URL at the primary itself (or at any server that is not in
+recovery) is a valid "simulated replica": it always reports itself caught up.
+"""
+import itertools
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+WRITE_LSN_HEADER = "X-Write-LSN"
+WRITE_LSN_COOKIE = "write_lsn"
+LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+CURRENT_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+# A server that is not a standby has everything it will ever serve
+REPLAYED_SQL = text("""
+    SELECT COALESCE(
+        CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END
+            >= CAST(:lsn AS pg_lsn),
+        false
+    )
+""")
+
+
+def get_replica_urls() -> List[str]:
+    """Replica database URLs from DATABASE_REPLICA_URLS (empty when replicas are not configured)."""
+    return [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+def get_read_your_writes_seconds() -> float:
+    """How long a customer's write mark is honoured before replicas are trusted again."""
+    return float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '300'))
+
+
+def lsn_value(lsn: str) -> int:
+    """Position of a pg_lsn text value ('16/B374D848'), for comparing two of them."""
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def latest_lsn(*lsns: Optional[str]) -> Optional[str]:
+    """The furthest of the given positions (None when none is given)."""
+    known = [lsn for lsn in lsns if lsn]
+    return max(known, key=lsn_value) if known else None
+
+
+def client_write_lsn(request: Request) -> Optional[str]:
+    """The write position the client sent back (header, else cookie); malformed values are ignored."""
+    lsn = request.headers.get(WRITE_LSN_HEADER) or request.cookies.get(WRITE_LSN_COOKIE)
+    return lsn if lsn and LSN_PATTERN.match(lsn) else None
+
+
+def set_write_lsn(response: Response, lsn: Optional[str]) -> None:
+    """Hand the position of a committed write to the client, so its next reads can wait for it."""
+    if lsn is None:
+        return
+    response.headers[WRITE_LSN_HEADER] = lsn
+    response.set_cookie(WRITE_LSN_COOKIE, lsn, max_age=int(get_read_your_writes_seconds()),
+                        httponly=True, samesite="lax")
+
+
+class WriteMarks:
+    """Thread-safe customer_id -> (LSN, expiry) of each customer's latest committed write."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else get_read_your_writes_seconds()
+        self._lock = threading.Lock()
+        self._marks: Dict[str, Tuple[str, float]] = {}
+
+    def record(self, customer_ids: Iterable[str], lsn: str) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for customer_id in customer_ids:
+                self._marks[customer_id] = (lsn, expires_at)
+
+    def pending(self, customer_id: str) -> Optional[str]:
+        """LSN a replica must have replayed to serve this customer, or None."""
+        with self._lock:
+            mark = self._marks.get(customer_id)
+            if mark is None:
+                return None
+            if mark[1] < time.monotonic():
+                del self._marks[customer_id]
+                return None
+            return mark[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._marks)
+
+
+class ReadRouter:
+    """
+    Chooses the session factory for a read: the next replica, or the primary
+    when no replica is configured or the chosen one is behind the client's or
+    the customer's last write (or unreachable).
+    """
+
+    def __init__(self, primary: Callable[[], Any], replicas: List[Callable[[], Any]], marks: WriteMarks):
+        self.primary = primary
+        self.replicas = replicas
+        self.marks = marks
+        self._cycle = itertools.cycle(replicas) if replicas else None
+        self._lock = threading.Lock()
+        self.stats = {'replica_reads': 0, 'primary_reads': 0, 'replica_behind': 0, 'replica_errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def _next_replica(self) -> Callable[[], Any]:
+        with self._lock:
+            return next(self._cycle)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _use_primary(self, reason: Optional[str] = None):
+        if reason:
+            self._count(reason)
+        self._count('primary_reads')
+        return self.primary()
+
+    def _required_lsn(self, customer_id: Optional[str], client_lsn: Optional[str]) -> Optional[str]:
+        """
+        The position a replica must have replayed: the later of the client's and the customer's write.
+
+        The customer's mark is kept until it expires even after a replica has caught up,
+        since the next read may go to another replica that has not.
+        """
+        mark = self.marks.pending(customer_id) if customer_id else None
+        return latest_lsn(mark, client_lsn)
+
+    def session(self, customer_id: Optional[str] = None, client_lsn: Optional[str] = None) -> Session:
+        """Open a sync session for a read, honouring the client's write position and the customer's mark."""
+        if not self.enabled:
+            return self.primary()
+        db = self._next_replica()()
+        lsn = self._required_lsn(customer_id, client_lsn)
+        if lsn is not None:
+            try:
+                caught_up = db.execute(REPLAYED_SQL, {'lsn': lsn}).scalar()
+            except DBAPIError:
+                db.close()
+                return self._use_primary('replica_errors')
+            db.rollback()
+            if not caught_up:
+                db.close()
+                return self._use_primary('replica_behind')
+        self._count('replica_reads')
+        return db
+
+    async def async_session(self, customer_id: Optional[str] = None,
+                            client_lsn: Optional[str] = None) -> AsyncSession:
+        """Async session(): open an AsyncSession for a read, honouring the client's and customer's writes."""
+        if not self.enabled:
+            return self.primary()
+        db = self._next_replica()()
+        lsn = self._required_lsn(customer_id, client_lsn)
+        if lsn is not None:
+            try:
+                caught_up = (await db.execute(REPLAYED_SQL, {'lsn': lsn})).scalar()
+            except DBAPIError:
+                await db.close()
+                return self._use_primary('replica_errors')
+            await db.rollback()
+            if not caught_up:
+                await db.close()
+                return self._use_primary('replica_behind')
+        self._count('replica_reads')
+        return db
+
+    def session_at(self, lsn: str) -> Optional[Session]:
+        """A replica session that has replayed past lsn, or None if the replica is behind."""
+        if not self.enabled:
+            return None
+        db = self._next_replica()()
+        try:
+            caught_up = db.execute(REPLAYED_SQL, {'lsn': lsn}).scalar()
+        except DBAPIError:
+            db.close()
+            self._count('replica_errors')
+            return None
+        if not caught_up:
+            db.close()
+            self._count('replica_behind')
+            return None
+        db.rollback()
+        self._count('replica_reads')
+        return db
+
+
+write_marks = WriteMarks()
+
+
+def current_wal_lsn(db: Session) -> str:
+    """The primary's current WAL position."""
+    return db.execute(CURRENT_LSN_SQL).scalar()
+
+
+def record_customer_writes(db: Session, customer_ids: Iterable[str]) -> Optional[str]:
+    """
+    Remember the primary's WAL position for customers whose events just committed.
+
+    Returns the position, for set_write_lsn (None when no replica is configured).
+    """
+    customer_ids = list(customer_ids)
+    if not customer_ids or not get_replica_urls():
+        return None
+    lsn = current_wal_lsn(db)
+    write_marks.record(customer_ids, lsn)
+    db.rollback()
+    return lsn
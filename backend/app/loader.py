@@ -0,0 +1,424 @@
+"""
+Bulk loader for customers and events
+
+Streams large CSV or Parquet files into Postgres in chunks:
+
+    python -m app.loader customers customers.csv
+    python -m app.loader events events.csv --workers 4 --chunk-size 100000
+    python -m app.loader events history.parquet --checkpoint history.state.json
+
+Each chunk is validated and normalized (ISO timestamps in UTC, metadata as JSON
+objects with the typed event fields extracted), COPYed into a temporary staging
+table and merged with
+INSERT ... ON CONFLICT, then committed on its own. The monthly events
+partitions a chunk needs are created before it is written, so loaded rows
+never pass through events_default. Completed chunk numbers are
+recorded in a checkpoint file, so rerunning after a failure skips finished
+chunks; events without an id get a deterministic one from (file, row), so
+reloading a chunk never duplicates events. Memory is bounded by
+chunk_size x (workers + 1) rows.
+
+The checkpoint also records the customers and the time range every finished
+chunk touched, and keeps them until the derived tables (rollups, ledgers,
+ticket states, sketches) have been rebuilt, so a resumed load still rebuilds
+them for chunks written by the interrupted run. The time range is turned into
+days with DATE(ts) in the database session time zone, the way the derived
+tables bucket events.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from .database import SessionLocal, engine
+from .db.partitions import add_months, ensure_event_partitions, month_start
+from .services.event_fields import extract_event_fields
+from .services.ingestion import EVENT_COLUMNS
+from .services.invoice_ledger import rebuild_invoice_ledger
+from .services.rollups import refresh_rollups_for_range
+from .services.score_snapshots import mark_scores_stale
+from .services.segment_analytics import rebuild_segment_sketches
+from .services.ticket_states import rebuild_ticket_states
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_FIELDS = ("id", "name", "segment", "created_at")
+
+
+class RowError(ValueError):
+    pass
+
+
+# READING
+def read_chunks(path: str, chunk_size: int, file_format: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of at most chunk_size row dicts from a CSV or Parquet file."""
+    file_format = file_format or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    if file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet support requires pyarrow (pip install pyarrow)")
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# NORMALIZATION
+def normalize_timestamp(value: Any, field: str, required: bool = True) -> Optional[datetime]:
+    """Parse a timestamp into an aware UTC datetime (naive values are taken as UTC)."""
+    if value is None or value == "":
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, date):
+        ts = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            ts = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            raise RowError(f"invalid {field} timestamp: {value!r}")
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def normalize_metadata(value: Any) -> Optional[Dict[str, Any]]:
+    """Return metadata as a JSON object (None when empty)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError("event_metadata is not valid JSON")
+    if not isinstance(value, dict):
+        raise RowError("event_metadata must be a JSON object")
+    return value
+
+
+def normalize_customer(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    customer_id = (row.get("id") or "").strip()
+    name = (row.get("name") or "").strip()
+    segment = (row.get("segment") or "").strip()
+    if not customer_id or not name or not segment:
+        raise RowError("id, name and segment are required")
+    created_at = normalize_timestamp(row.get("created_at"), "created_at", required=False)
+    return (customer_id, name, segment, created_at.isoformat() if created_at else None)
+
+
+def normalize_event(row: Dict[str, Any], source: str, row_number: int) -> Tuple[Any, ...]:
+    customer_id = (row.get("customer_id") or "").strip()
+    event_type = (row.get("event_type") or "").strip()
+    if not customer_id or not event_type:
+        raise RowError("customer_id and event_type are required")
+    event_id = str(row.get("id") or "").strip() or str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{row_number}"))
+    ts = normalize_timestamp(row.get("ts"), "ts")
+    metadata = normalize_metadata(row.get("event_metadata", row.get("metadata")))
+    fields = extract_event_fields(metadata)
+    return (
+        event_id, customer_id, event_type, ts.isoformat(),
+        json.dumps(metadata, separators=(",", ":"), default=str) if metadata is not None else None,
+        *fields.values()
+    )
+
+
+# WRITING
+def _copy_rows(cursor, table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]) -> None:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def load_customer_rows(rows: List[Tuple[Any, ...]]) -> int:
+    """Upsert customers through a staging table. Returns rows written."""
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute("CREATE TEMP TABLE customers_staging (LIKE customers INCLUDING DEFAULTS) ON COMMIT DROP")
+        _copy_rows(cursor, "customers_staging", CUSTOMER_FIELDS, rows)
+        cursor.execute("""
+            INSERT INTO customers (id, name, segment, created_at)
+            SELECT DISTINCT ON (id) id, name, segment, created_at FROM customers_staging
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name,
+                segment = EXCLUDED.segment,
+                created_at = COALESCE(EXCLUDED.created_at, customers.created_at)
+        """)
+        written = cursor.rowcount
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def load_event_rows(rows: List[Tuple[Any, ...]]) -> Tuple[int, int, Set[str]]:
+    """
+    Insert events through a staging table, skipping ids that already exist and
+    rows whose customer is unknown. Returns (inserted, unknown_customer_rows, customer_ids),
+    where customer_ids covers every row with a known customer, including rows an
+    interrupted earlier run had already inserted.
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute("CREATE TEMP TABLE events_staging (LIKE events) ON COMMIT DROP")
+        _copy_rows(cursor, "events_staging", EVENT_COLUMNS, rows)
+        cursor.execute("""
+            SELECT COUNT(*) FROM events_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM customers c WHERE c.id = s.customer_id)
+        """)
+        unknown = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT DISTINCT s.customer_id FROM events_staging s
+            JOIN customers c ON c.id = s.customer_id
+        """)
+        customer_ids = {row[0] for row in cursor.fetchall()}
+        cursor.execute(f"""
+            INSERT INTO events ({', '.join(EVENT_COLUMNS)})
+            SELECT {', '.join('s.' + column for column in EVENT_COLUMNS)}
+            FROM events_staging s
+            JOIN customers c ON c.id = s.customer_id
+            ON CONFLICT DO NOTHING
+        """)
+        inserted = cursor.rowcount
+        conn.commit()
+        return inserted, unknown, customer_ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# CHECKPOINTS
+class Checkpoint:
+    """
+    Completed chunk numbers for one (kind, file, chunk size), persisted as JSON,
+    plus the customers and event time range whose derived state is still to be rebuilt.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        self.done: Set[int] = set()
+        self.customers: Set[str] = set()
+        self.ts_range: List[Optional[datetime]] = [None, None]
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("key") == key:
+                self.done = set(state.get("done", []))
+                self.customers = set(state.get("customers", []))
+                self.ts_range = [datetime.fromisoformat(ts) if ts else None
+                                 for ts in state.get("ts_range", [None, None])]
+            else:
+                logger.warning("Ignoring checkpoint %s written for a different load", path)
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "key": self.key,
+                "done": sorted(self.done),
+                "customers": sorted(self.customers),
+                "ts_range": [ts.isoformat() if ts else None for ts in self.ts_range]
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def mark_done(self, chunk_number: int, customer_ids: Set[str] = frozenset(),
+                  first_ts: Optional[datetime] = None, last_ts: Optional[datetime] = None) -> None:
+        """Record a committed chunk together with the customers and time range it touched."""
+        with self._lock:
+            self.done.add(chunk_number)
+            self.customers.update(customer_ids)
+            if first_ts is not None:
+                self.ts_range[0] = first_ts if self.ts_range[0] is None else min(self.ts_range[0], first_ts)
+                self.ts_range[1] = last_ts if self.ts_range[1] is None else max(self.ts_range[1], last_ts)
+            self._save()
+
+    def mark_derived_refreshed(self) -> None:
+        """Forget the pending customers and range once their derived state has been rebuilt."""
+        with self._lock:
+            self.customers = set()
+            self.ts_range = [None, None]
+            self._save()
+
+
+def ensure_partitions_for_range(first_ts: datetime, last_ts: datetime, known_months: Set[date],
+                                lock: threading.Lock) -> None:
+    """
+    Create the monthly events partitions covering first_ts..last_ts (UTC months,
+    as partitions are bounded) unless this load already ensured them.
+    known_months is shared by the load's writers and guarded by lock.
+    """
+    first_day, last_day = first_ts.astimezone(timezone.utc).date(), last_ts.astimezone(timezone.utc).date()
+    months = set()
+    month = month_start(first_day)
+    while month <= last_day:
+        months.add(month)
+        month = add_months(month, 1)
+    with lock:
+        if months <= known_months:
+            return
+    db = SessionLocal()
+    try:
+        # Months with rows already in events_default are moved into their new partition
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        ensure_event_partitions(db, first_day, last_day)
+        db.commit()
+    finally:
+        db.close()
+    with lock:
+        known_months.update(months)
+
+
+def session_days(db, first_ts: datetime, last_ts: datetime) -> Tuple[date, date]:
+    """Days of two timestamps as DATE(ts) computes them in the session time zone."""
+    row = db.execute(text("SELECT DATE(CAST(:first_ts AS timestamptz)), DATE(CAST(:last_ts AS timestamptz))"),
+                     {"first_ts": first_ts, "last_ts": last_ts}).one()
+    return row[0], row[1]
+
+
+# DRIVER
+def run_load(kind: str, path: str, chunk_size: int = 50000, workers: int = 1,
+             file_format: Optional[str] = None, checkpoint_path: Optional[str] = None,
+             max_errors: int = 100, refresh_derived: bool = True) -> Dict[str, Any]:
+    """Load a customers or events file; returns summary counters."""
+    checkpoint = Checkpoint(
+        checkpoint_path or f"{path}.{kind}.checkpoint.json",
+        f"{kind}:{os.path.abspath(path)}:{chunk_size}"
+    )
+    source = os.path.basename(path)
+    stats = {"rows": 0, "written": 0, "invalid": 0, "unknown_customer": 0, "skipped_chunks": 0, "errors": []}
+    stats_lock = threading.Lock()
+    partition_months: Set[date] = set()
+    partitions_lock = threading.Lock()
+
+    def process(chunk_number: int, chunk: List[Dict[str, Any]]) -> None:
+        rows = []
+        errors = []
+        chunk_times = []
+        for offset, row in enumerate(chunk):
+            row_number = chunk_number * chunk_size + offset
+            try:
+                if kind == "customers":
+                    rows.append(normalize_customer(row))
+                else:
+                    event = normalize_event(row, source, row_number)
+                    rows.append(event)
+                    chunk_times.append(datetime.fromisoformat(event[3]))
+            except RowError as e:
+                errors.append({"row": row_number, "error": str(e)})
+
+        unknown = 0
+        customer_ids: Set[str] = set()
+        if kind == "customers":
+            written = load_customer_rows(rows) if rows else 0
+        elif rows:
+            ensure_partitions_for_range(min(chunk_times), max(chunk_times), partition_months, partitions_lock)
+            written, unknown, customer_ids = load_event_rows(rows)
+        else:
+            written = 0
+        checkpoint.mark_done(chunk_number, customer_ids,
+                             min(chunk_times, default=None), max(chunk_times, default=None))
+
+        with stats_lock:
+            stats["rows"] += len(chunk)
+            stats["written"] += written
+            stats["invalid"] += len(errors)
+            stats["unknown_customer"] += unknown
+            stats["errors"].extend(errors[:max_errors - len(stats["errors"])])
+        logger.info("chunk %d: %d rows, %d written, %d invalid", chunk_number, len(chunk), written, len(errors))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for chunk_number, chunk in enumerate(read_chunks(path, chunk_size, file_format)):
+            if chunk_number in checkpoint.done:
+                stats["skipped_chunks"] += 1
+                continue
+            # Bound memory: never read more than `workers` chunks ahead of the writers
+            while len(in_flight) >= workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+            in_flight.add(executor.submit(process, chunk_number, chunk))
+        for future in in_flight:
+            future.result()
+
+    # Includes chunks finished by an interrupted earlier run whose derived state was not rebuilt
+    touched_customers = set(checkpoint.customers)
+    first_ts, last_ts = checkpoint.ts_range
+
+    if kind == "events" and refresh_derived and touched_customers:
+        # Rebuild the rollups and daily sketches for the loaded days and the customers'
+        # invoice ledgers and ticket states, and queue the customers for rescoring
+        db = SessionLocal()
+        try:
+            db.execute(text("SET LOCAL statement_timeout = 0"))
+            start_day, end_day = session_days(db, first_ts, last_ts)
+            refresh_rollups_for_range(db, start_day, end_day, sorted(touched_customers))
+            rebuild_invoice_ledger(db, sorted(touched_customers))
+            rebuild_ticket_states(db, sorted(touched_customers))
+            rebuild_segment_sketches(db, sorted(touched_customers), start_day, end_day)
+            mark_scores_stale(db, touched_customers)
+            db.commit()
+        finally:
+            db.close()
+        checkpoint.mark_derived_refreshed()
+
+    stats["customers_affected"] = len(touched_customers)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.loader", description="Bulk load customers or events")
+    parser.add_argument("kind", choices=["customers", "events"])
+    parser.add_argument("path", help="CSV or Parquet file")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=1, help="Chunks written in parallel")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.<kind>.checkpoint.json)")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="Do not refresh rollups, sketches, invoice ledgers and ticket states or mark scores stale after loading")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stats = run_load(args.kind, args.path, chunk_size=args.chunk_size, workers=args.workers,
+                     file_format=args.format, checkpoint_path=args.checkpoint,
+                     refresh_derived=not args.skip_derived)
+    json.dump(stats, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, Body
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import Optional, Dict, Any
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, Any, List
+import json
 from pydantic import BaseModel
+import asyncio
 import os
+import time
 
-from .database import get_db
+from .core.metrics import REQUEST_LATENCY, metrics_enabled, record_ingest, render_metrics
+from .crud.events import decode_cursor, list_customer_events, stream_customer_events
+from .database import (
+    DATABASE_URL, get_db, get_async_db, get_read_db, get_async_read_db, SessionLocal, read_router
+)
+from .db.partitions import ensure_event_partitions
+from .db.pool import get_pool_stats
+from .db.replicas import client_write_lsn, latest_lsn, set_write_lsn
 from .models import Customer, Event
-from .services.health_scoring import calculate_customer_health_score
+from .services.ingestion import (
+    after_events_committed,
+    apply_event_side_effects,
+    ingest_events,
+    parse_event_timestamp,
+)
+from .services.event_fields import extract_event_fields
+from .services.health_scoring import get_period_dates
+from .services.reweighting import reweight_customers
+from .services.score_cache import get_score_cache
+from .services.score_export import EXPORT_FORMATS, check_export_format, stream_score_export
+from .services.score_history import get_customer_score_history, get_segment_score_history
+from .services.score_snapshots import (
+    HealthScoreWorker,
+    get_score_snapshot,
+    query_score_snapshots,
+    refresh_customer_score_async,
+    score_push_enabled,
+    summarize_score_snapshots,
+)
+from .services.score_stream import (
+    ScoreChangeListener,
+    ScoreUpdateScheduler,
+    format_sse,
+    score_broker,
+    set_score_update_scheduler,
+)
+from .services.segment_analytics import get_segment_analytics
 
 class EventCreate(BaseModel):
     event_type: str
@@ -23,92 +62,312 @@ frontend_build_path = os.path.join(os.path.dirname(__file__), "../../../frontend
 if os.path.exists(frontend_build_path):
     app.mount("/static", StaticFiles(directory=os.path.join(frontend_build_path, "static")), name="static")
 
+# Background recomputation of health score snapshots
+health_score_worker = HealthScoreWorker(SessionLocal, read_router=read_router)
+
+# Score change push: coalesced rescoring after new events, and one LISTEN connection feeding SSE subscribers
+score_update_scheduler = ScoreUpdateScheduler(SessionLocal, read_router=read_router)
+score_change_listener = ScoreChangeListener(DATABASE_URL, score_broker)
+SSE_KEEPALIVE_SECONDS = 15
+
+if metrics_enabled():
+    @app.middleware("http")
+    async def observe_request_latency(request: Request, call_next):
+        started_at = time.perf_counter()
+        response = await call_next(request)
+        # Label by route template so /api/customers/{id}/health is one series, not one per customer
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            request.method, route.path if route is not None else "unmatched", str(response.status_code)
+        ).observe(time.perf_counter() - started_at)
+        return response
+
+@app.on_event("startup")
+def start_health_score_worker():
+    if os.getenv("HEALTH_SCORE_WORKER_ENABLED", "true").lower() == "true":
+        health_score_worker.start()
+
+@app.on_event("startup")
+def create_event_partitions():
+    # Partitions for the coming months; `python -m app.db.partitions maintain` does the same from cron.
+    # Every worker runs this; ensure_event_partitions serializes them with an advisory lock.
+    db = SessionLocal()
+    try:
+        ensure_event_partitions(db)
+        db.commit()
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_score_push():
+    if score_push_enabled():
+        score_update_scheduler.start()
+        set_score_update_scheduler(score_update_scheduler)
+        score_change_listener.start()
+
+@app.on_event("shutdown")
+def stop_health_score_worker():
+    health_score_worker.stop(timeout=10)
+
+@app.on_event("shutdown")
+async def stop_score_push():
+    set_score_update_scheduler(None)
+    await run_in_threadpool(score_update_scheduler.stop, 10)
+    await score_change_listener.stop()
+
 @app.get("/")
 def read_root():
     return {"message": "Customer Health API is running"}
 
+CUSTOMERS_PAGE_SIZE = 50
+
 @app.get("/api/customers")
-def get_customers(db: Session = Depends(get_db)):
+async def get_customers(response: Response,
+                        segment: Optional[str] = None,
+                        label: Optional[str] = None,
+                        min_score: Optional[float] = Query(None, ge=0, le=100),
+                        max_score: Optional[float] = Query(None, ge=0, le=100),
+                        sort: str = "id",
+                        order: str = "asc",
+                        page: int = Query(1, ge=1),
+                        limit: int = Query(CUSTOMERS_PAGE_SIZE, ge=1, le=500),
+                        name: Optional[str] = None,
+                        read_db: AsyncSession = Depends(get_async_read_db)):
     """
     Return customers from database with comprehensive 5-factor health scores.
     Uses all factors: login frequency, feature adoption, support tickets, payment health, and API usage.
     Scores calculated for last 30 days (Sep 2024) with configurable weights.
+    Scores are served from the health_scores snapshot; `stale` and `age_seconds`
+    report how current each one is. Customers the background worker has not
+    scored yet are listed as stale with a null score.
+
+    Filtering (segment, label, min_score/max_score, name substring), sorting (sort: id, name,
+    segment, score, label or last_updated; order: asc/desc) and paging (page,
+    limit) run in the database. Pages hold CUSTOMERS_PAGE_SIZE customers unless
+    limit asks for another size (at most 500). The number of matching customers
+    is sent in X-Total-Count.
     """
-    # Fetch all customers from database
-    customers = db.query(Customer).all()
-    
-    # Transform to API response format with comprehensive health scores
-    customer_list = []
-    for customer in customers:
-        # Calculate comprehensive 5-factor health score
-        health_data = calculate_customer_health_score(db, customer)
-        
-        customer_data = {
-            "id": str(customer.id),
-            "name": customer.name,
-            "segment": customer.segment,
-            "score": health_data["score"],
-            "label": health_data["label"]
-        }
-        customer_list.append(customer_data)
-    
-    return customer_list
+    offset = (page - 1) * limit
+    try:
+        customers, total = await read_db.run_sync(
+            query_score_snapshots, segment, label, min_score, max_score, sort, order, limit, offset, name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return customers
+
+@app.get("/api/customers/summary")
+async def get_customers_summary(segment: Optional[str] = None,
+                                label: Optional[str] = None,
+                                min_score: Optional[float] = Query(None, ge=0, le=100),
+                                max_score: Optional[float] = Query(None, ge=0, le=100),
+                                read_db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Return aggregate health for the customers matching the same filters as
+    /api/customers: count and average score, label distribution and a score
+    histogram, overall and per segment, computed in one query. Customers not
+    scored yet are left out.
+    """
+    try:
+        return await read_db.run_sync(summarize_score_snapshots, segment, label, min_score, max_score)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/customers/{id}/health")
-def get_customer_health(id: str, db: Session = Depends(get_db)):
+async def get_customer_health(id: str, fresh: bool = False, db: AsyncSession = Depends(get_async_db),
+                              read_db: AsyncSession = Depends(get_async_read_db)):
     """
     Return the detailed health score breakdown for a specific customer.
+    Served from the health_scores snapshot (stale with a null score until the
+    customer is first scored); pass fresh=true to recompute it first. Fresh
+    reads of a customer without new events are answered from the score cache
+    within HEALTH_CACHE_TTL_SECONDS instead of rescoring.
+    """
+    if fresh:
+        if await refresh_customer_score_async(db, id) is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        await db.commit()
+        # A replica may not have the snapshot that was just written
+        snapshot = await db.run_sync(get_score_snapshot, id)
+    else:
+        snapshot = await read_db.run_sync(get_score_snapshot, id)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    return snapshot
+
+HISTORY_INTERVALS = {"daily": 1, "weekly": 7}
+
+def parse_history_range(start: Optional[str], end: Optional[str], interval: str):
+    """Validate history query params; defaults to the 30 days ending with the scoring period."""
+    if interval not in HISTORY_INTERVALS:
+        raise HTTPException(status_code=400, detail="interval must be 'daily' or 'weekly'")
+    try:
+        end_day = date.fromisoformat(end) if end else get_period_dates(30)[1].date()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    return start_day, end_day, HISTORY_INTERVALS[interval]
+
+@app.get("/api/customers/{id}/health/history")
+def get_customer_health_history(id: str, start: Optional[str] = None, end: Optional[str] = None,
+                                interval: str = "daily", window_days: int = Query(30, ge=1, le=365),
+                                db: Session = Depends(get_read_db)):
     """
+    Return the customer's health score over time: one point per day (or week) from
+    start to end, each scoring the window_days window ending that day.
+    """
+    start_day, end_day, step_days = parse_history_range(start, end, interval)
     customer = db.query(Customer).filter(Customer.id == id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-        
-    health_data = calculate_customer_health_score(db, customer)
+    
+    try:
+        series = get_customer_score_history(db, id, start_day, end_day, window_days, step_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "customer_id": id,
+        "customer_name": customer.name,
+        "interval": interval,
+        "window_days": window_days,
+        "points": series
+    }
 
+@app.get("/api/segments/{segment}/health/history")
+def get_segment_health_history(segment: str, start: Optional[str] = None, end: Optional[str] = None,
+                               interval: str = "daily", window_days: int = Query(30, ge=1, le=365),
+                               db: Session = Depends(get_read_db)):
+    """
+    Return a segment's health over time: per point, the average/min/max score and
+    label counts across the segment's customers.
+    """
+    start_day, end_day, step_days = parse_history_range(start, end, interval)
+    try:
+        series = get_segment_score_history(db, segment, start_day, end_day, window_days, step_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if series is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
     return {
-        "id": str(customer.id),
-        "name": customer.name,
-        "segment": customer.segment,
-        "score": health_data["score"],
-        "label": health_data["label"],
-        "last_updated": health_data["last_updated"],
-        "breakdown": health_data["breakdown"]
+        "segment": segment,
+        "interval": interval,
+        "window_days": window_days,
+        "points": series
     }
 
+@app.get("/api/export/scores")
+def export_scores(request: Request, format: str = "csv", segment: Optional[str] = None,
+                  label: Optional[str] = None):
+    """
+    Stream every customer's live health score and full factor breakdown as CSV,
+    NDJSON or Parquet, optionally only one segment and/or label. Customers are
+    scored in chunks with bulk scoring, so memory stays flat and rows are sent
+    as each chunk is scored.
+    """
+    try:
+        check_export_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def generate():
+        # The stream outlives the request, so it owns its session
+        stream_db = read_router.session(client_lsn=client_write_lsn(request))
+        try:
+            yield from stream_score_export(stream_db, format, segment, label)
+        finally:
+            stream_db.close()
+    return StreamingResponse(generate(), media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="health_scores.{format}"'})
+
+@app.get("/api/analytics/segments")
+def get_segment_analytics_report(start: Optional[str] = None, end: Optional[str] = None,
+                                 interval: str = "month", segment: Optional[str] = None,
+                                 db: Session = Depends(get_read_db)):
+    """
+    Return per segment and period: API response time percentiles, distinct endpoints
+    and features used, and the distribution of login days per customer. Percentiles
+    and distinct counts come from merged daily sketches; see error_bounds.
+    """
+    try:
+        end_day = date.fromisoformat(end) if end else get_period_dates(30)[1].date()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=89)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    try:
+        return get_segment_analytics(db, start_day, end_day, interval, segment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class ReweightRequest(BaseModel):
+    weights: Optional[Dict[str, float]] = None
+    thresholds: Optional[Dict[str, float]] = None
+    segment: Optional[str] = None
+    changed_limit: int = 50
+
+@app.post("/api/scores/reweight")
+def reweight_scores(request: ReweightRequest, db: Session = Depends(get_read_db)):
+    """
+    What-if scoring: re-score and re-label every customer from their stored factor
+    scores with the given weights and/or label thresholds (missing entries keep the
+    configured values). Nothing is written; stored scores are unchanged.
+    """
+    if not 0 <= request.changed_limit <= 1000:
+        raise HTTPException(status_code=400, detail="changed_limit must be between 0 and 1000")
+    start = time.perf_counter()
+    try:
+        result = reweight_customers(db, request.weights, request.thresholds, request.segment,
+                                    request.changed_limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
 class EventCreate(BaseModel):
     event_type: str
     ts: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
 @app.post("/api/customers/{id}/events")
-def create_customer_event(id: str, event_data: EventCreate, db: Session = Depends(get_db)):
+def create_customer_event(id: str, event_data: EventCreate, response: Response, db: Session = Depends(get_db)):
     """
     Create a new customer event.
     E1 implementation: Accept event_type, optional ts and metadata, insert and return event.
+    With read replicas, the X-Write-LSN header and write_lsn cookie let the
+    client's next reads wait for this write on any worker.
     """
+    started_at = time.perf_counter()
     # Verify customer exists
     customer = db.query(Customer).filter(Customer.id == id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     # Parse timestamp if provided, otherwise use current time
-    event_timestamp = datetime.now()
-    if event_data.ts:
-        try:
-            event_timestamp = datetime.fromisoformat(event_data.ts.replace('Z', '+00:00'))
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid timestamp format. Use ISO format.")
+    try:
+        event_timestamp = parse_event_timestamp(event_data.ts)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp format. Use ISO format.")
     
     # Create event object
     event = Event(
         customer_id=id,
         event_type=event_data.event_type,
         ts=event_timestamp,
-        event_metadata=event_data.metadata
+        event_metadata=event_data.metadata,
+        **extract_event_fields(event_data.metadata)
     )
     
     db.add(event)
+    db.flush()
+    # Refresh the daily rollup and queue the health score snapshot for recomputation
+    affected_customers = apply_event_side_effects(db, [event])
     db.commit()
+    # Drop cached scores, record the write mark and schedule rescoring; the write token goes to the client
+    set_write_lsn(response, after_events_committed(db, affected_customers))
+    record_ingest("single", 1, 0, time.perf_counter() - started_at)
     db.refresh(event)
     
     return {
@@ -119,38 +378,189 @@ def create_customer_event(id: str, event_data: EventCreate, db: Session = Depend
         "event_metadata": event.event_metadata
     }
 
+@app.post("/api/events/batch")
+def create_events_batch(response: Response, events: List[Any] = Body(..., embed=True), method: str = "copy",
+                        db: Session = Depends(get_db)):
+    """
+    Ingest a batch of events for any customers: {"events": [{customer_id, event_type, ts?, metadata?}, ...]}.
+    Customer ids are validated with one lookup and rows are written with COPY
+    (method=copy) or a multi-row INSERT (method=insert) in a single transaction.
+    Invalid rows are skipped and reported by index. Sets the write token like
+    the single-event endpoint.
+    """
+    if method not in ("copy", "insert"):
+        raise HTTPException(status_code=400, detail="method must be 'copy' or 'insert'")
+    result = ingest_events(db, events, method=method)
+    set_write_lsn(response, result.pop("write_lsn"))
+    return result
+
+NDJSON_CHUNK_SIZE = int(os.getenv("INGEST_NDJSON_CHUNK_SIZE", "5000"))
+
+def _ingest_chunk(rows: List[Any], method: str, row_offset: int) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return ingest_events(db, rows, method=method, row_offset=row_offset)
+    finally:
+        db.close()
+
+@app.post("/api/events/ndjson")
+async def create_events_ndjson(request: Request, response: Response, method: str = "copy"):
+    """
+    Ingest newline-delimited JSON events streamed in the request body.
+    The body is consumed incrementally and committed every INGEST_NDJSON_CHUNK_SIZE
+    records, so memory stays bounded. Blank lines are skipped; errors are reported
+    by zero-based record index. The write token is the last chunk's commit.
+    """
+    if method not in ("copy", "insert"):
+        raise HTTPException(status_code=400, detail="method must be 'copy' or 'insert'")
+    
+    totals = {"received": 0, "inserted": 0, "rejected": 0, "errors": []}
+    write_lsn = None
+    pending: List[Any] = []
+    buffer = b""
+    
+    async def flush():
+        nonlocal write_lsn
+        result = await run_in_threadpool(_ingest_chunk, pending[:], method, totals["received"])
+        write_lsn = latest_lsn(write_lsn, result["write_lsn"])
+        for key in ("received", "inserted", "rejected"):
+            totals[key] += result[key]
+        totals["errors"].extend(result["errors"][:1000 - len(totals["errors"])])
+        pending.clear()
+    
+    def add_line(raw: bytes):
+        if not raw.strip():
+            return
+        try:
+            pending.append(json.loads(raw))
+        except ValueError:
+            pending.append(None)  # rejected by validation as a non-object row
+    
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            add_line(raw)
+            if len(pending) >= NDJSON_CHUNK_SIZE:
+                await flush()
+    add_line(buffer)
+    if pending:
+        await flush()
+    
+    set_write_lsn(response, write_lsn)
+    return totals
+
 @app.get("/api/customers/{id}/events")
-def get_customer_events(id: str, db: Session = Depends(get_db)):
+def get_customer_events(id: str, request: Request, limit: int = Query(100, ge=1, le=1000),
+                        cursor: Optional[str] = None, event_type: Optional[List[str]] = Query(None),
+                        start: Optional[str] = None, end: Optional[str] = None, format: str = "json",
+                        db: Session = Depends(get_read_db)):
     """
-    Get all events for a specific customer.
+    Get events for a specific customer, newest first.
+    Pages are keyset-paginated on (ts, id): pass the returned next_cursor to get the
+    next page. Filter by event_type (repeatable) and an ISO start/end time range.
+    format=ndjson streams every matching event from a server-side cursor instead.
     """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    try:
+        start_ts = parse_event_timestamp(start) if start else None
+        end_ts = parse_event_timestamp(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp format. Use ISO format.")
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     # Verify customer exists
     customer = db.query(Customer).filter(Customer.id == id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    # Get all events for this customer, ordered by timestamp (newest first)
-    events = db.query(Event).filter(Event.customer_id == id).order_by(Event.ts.desc()).all()
-    
-    # Transform to API response format
-    event_list = []
-    for event in events:
-        event_data = {
-            "id": str(event.id),
-            "customer_id": event.customer_id,
-            "event_type": event.event_type,
-            "ts": event.ts.isoformat(),
-            "event_metadata": event.event_metadata
-        }
-        event_list.append(event_data)
+    if format == "ndjson":
+        def generate():
+            # The stream outlives the request dependency, so it owns its session
+            stream_db = read_router.session(id, client_write_lsn(request))
+            try:
+                for event in stream_customer_events(stream_db, id, event_type, start_ts, end_ts, cursor):
+                    yield json.dumps(event) + "\n"
+            finally:
+                stream_db.close()
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    
+    page = list_customer_events(db, id, limit=limit, cursor=cursor, event_types=event_type,
+                                start=start_ts, end=end_ts)
     
     return {
         "customer_id": id,
         "customer_name": customer.name,
-        "total_events": len(event_list),
-        "events": event_list
+        "count": len(page["events"]),
+        "next_cursor": page["next_cursor"],
+        "events": page["events"]
     }
 
+@app.get("/api/stream/scores")
+async def stream_score_changes(request: Request,
+                               customer_id: Optional[List[str]] = Query(None),
+                               segment: Optional[str] = None,
+                               label_changes_only: bool = False):
+    """
+    Server-Sent Events stream of health score changes as they are saved.
+    Each `score` event carries customer_id, segment, score, label, previous_score,
+    previous_label and computed_at. Filter by customer_id (repeatable) and segment;
+    label_changes_only=true skips changes that keep the label. A `resync` event
+    means changes were dropped because the client fell behind: refetch.
+    """
+    if not score_push_enabled():
+        raise HTTPException(status_code=404, detail="Score push is disabled")
+    subscription = score_broker.subscribe(customer_id, segment, label_changes_only)
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            dropped = 0
+            while not await request.is_disconnected():
+                try:
+                    change = await asyncio.wait_for(subscription.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.dropped != dropped:
+                    dropped = subscription.dropped
+                    yield format_sse("resync", {"dropped": dropped})
+                yield format_sse("score", change)
+        finally:
+            score_broker.unsubscribe(subscription)
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """
+    Return health score cache counters (size, hits, misses, hit rate, evictions, invalidations, stale writes).
+    """
+    return get_score_cache().stats()
+
+@app.get("/api/pool/stats")
+def get_database_pool_stats():
+    """
+    Return connection pool gauges and counters (checkouts, wait time, overflow, invalidations) per engine.
+    """
+    return get_pool_stats()
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics: request latency per route, per-factor scoring query time and
+    rows, scoring and ingestion throughput, pool, cache and replica routing counters.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/api/dashboard")
 def get_dashboard():
     """
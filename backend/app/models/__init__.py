@@ -1,5 +1,11 @@
 # Import models to make them available from this package
 from .customer import Customer
 from .event import Event
+from .rollup import CustomerDailyRollup
+from .health_score import HealthScore
+from .invoice import InvoiceLedger
+from .ticket import TicketState
+from .sketch import CustomerDailySketch
+from .derived_state import DerivedStateWork
 
-__all__ = ["Customer", "Event"]
+__all__ = ["Customer", "Event", "CustomerDailyRollup", "HealthScore", "InvoiceLedger", "TicketState", "CustomerDailySketch", "DerivedStateWork"]
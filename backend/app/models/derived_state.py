@@ -0,0 +1,25 @@
+"""
+Derived state queue model for Customer Health API
+"""
+from sqlalchemy import Column, DateTime, ForeignKey, Text
+from sqlalchemy.sql import func
+
+from ..database import Base
+
+class DerivedStateWork(Base):
+    """
+    Derived rows that new events made out of date and that are still to be
+    recomputed (see services/derived_state.py):
+      - kind 'invoice': invoice_ledger row, key = invoice_id
+      - kind 'ticket': ticket_states row, key = ticket_id
+      - kind 'sketch': customer_daily_sketches row, key = ISO day
+    """
+    __tablename__ = "derived_state_queue"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(Text, primary_key=True)
+    key = Column(Text, primary_key=True)
+    queued_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<DerivedStateWork(customer_id={self.customer_id}, kind={self.kind}, key={self.key})>"
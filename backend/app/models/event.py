@@ -3,7 +3,7 @@ Event model for Customer Health API
 """
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, String, Text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -13,15 +13,36 @@ from ..database import Base
 class Event(Base):
     """
     Event model representing customer activity events
+    
+    Metadata keys the scoring queries read are also stored in typed columns,
+    filled at write time (see services/event_fields.py). event_metadata keeps
+    the full payload, including keys without a column.
     """
     __tablename__ = "events"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
     event_type = Column(Text, nullable=False)  # login, feature_usage, support_ticket, etc.
-    ts = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key of the monthly events partitions, hence part of the primary key
+    ts = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     event_metadata = Column(JSONB)  # Additional event data
     
+    # Typed metadata (NULL when the key is missing or not parseable)
+    feature_name = Column(Text)           # feature_onboarded, feature_used
+    completion_percentage = Column(Integer)
+    ticket_id = Column(Text)              # support_ticket_created, support_ticket_resolved
+    priority = Column(Text)
+    resolution_type = Column(Text)
+    satisfaction_score = Column(Float)
+    invoice_id = Column(Text)             # invoice_generated, payment_received, payment_failed
+    amount_usd = Column(Float)
+    due_date = Column(Date)
+    payment_date = Column(Date)
+    days_early_late = Column(Integer)
+    endpoint = Column(Text)               # api_call
+    response_code = Column(Integer)
+    response_time_ms = Column(Integer)
+    
     # Relationship to customer
     customer = relationship("Customer", back_populates="events")
     
@@ -0,0 +1,29 @@
+"""
+Health score snapshot model for Customer Health API
+"""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Text
+from sqlalchemy.dialects.postgresql import JSONB
+
+from ..database import Base
+
+class HealthScore(Base):
+    """
+    Point-in-time health score for a customer, maintained by the background worker
+    """
+    __tablename__ = "health_scores"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float)
+    label = Column(Text)
+    breakdown = Column(JSONB)
+    # Factor scores from the breakdown, for re-weighting without rescoring (services/reweighting.py)
+    login_frequency_score = Column(Float)
+    feature_adoption_score = Column(Float)
+    support_tickets_score = Column(Float)
+    payment_health_score = Column(Float)
+    api_usage_score = Column(Float)
+    computed_at = Column(DateTime(timezone=True))
+    dirty_at = Column(DateTime(timezone=True))  # last time new events arrived, cleared on recompute
+
+    def __repr__(self):
+        return f"<HealthScore(customer_id={self.customer_id}, score={self.score}, label='{self.label}')>"
@@ -0,0 +1,29 @@
+"""
+Invoice ledger model for Customer Health API
+"""
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, Text
+
+from ..database import Base
+
+class InvoiceLedger(Base):
+    """
+    One row per invoice with its latest payment state, maintained from
+    invoice_generated, payment_received and payment_failed events at ingest time
+    (see services/invoice_ledger.py). issued_at is NULL while only payment
+    events have been seen for the invoice.
+    """
+    __tablename__ = "invoice_ledger"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    invoice_id = Column(Text, primary_key=True)
+    issued_at = Column(DateTime(timezone=True))
+    amount_usd = Column(Float)
+    due_date = Column(Date)
+    payment_date = Column(Date)
+    days_early_late = Column(Integer)
+    failure_count = Column(Integer, nullable=False, default=0)
+    status = Column(Text)  # unpaid, on_time_or_early, late_acceptable, late_concerning
+    updated_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<InvoiceLedger(customer_id={self.customer_id}, invoice_id={self.invoice_id}, status='{self.status}')>"
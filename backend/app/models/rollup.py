@@ -0,0 +1,35 @@
+"""
+Daily rollup model for Customer Health API
+"""
+from sqlalchemy import Column, Date, Float, ForeignKey, Integer, Text
+from sqlalchemy.dialects.postgresql import JSONB
+
+from ..database import Base
+
+class CustomerDailyRollup(Base):
+    """
+    Pre-aggregated events for one customer, day and event type.
+
+    Holds exactly what the five scoring factors need so a score can be computed
+    without touching the raw events table:
+      - match_count: api_call with 2xx response, feature_onboarded at 100%,
+        escalated support_ticket_resolved, high/critical support_ticket_created
+      - value_sum/value_count: api_call response_time_ms, support_ticket_resolved satisfaction_score
+      - key_counts: events per feature_name, endpoint, ticket_id or invoice_id
+      - key_values: invoice_generated amount_usd and payment_received
+        [payment_date, days_early_late] lists per invoice_id
+    """
+    __tablename__ = "customer_daily_rollups"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    event_type = Column(Text, primary_key=True)
+    event_count = Column(Integer, nullable=False, default=0)
+    match_count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float)
+    value_count = Column(Integer, nullable=False, default=0)
+    key_counts = Column(JSONB, nullable=False, default=dict)
+    key_values = Column(JSONB, nullable=False, default=dict)
+
+    def __repr__(self):
+        return f"<CustomerDailyRollup(customer_id={self.customer_id}, day={self.day}, type='{self.event_type}')>"
@@ -0,0 +1,29 @@
+"""
+Daily sketch model for Customer Health API
+"""
+from sqlalchemy import Column, Date, ForeignKey, Integer, LargeBinary, Text
+
+from ..database import Base
+
+class CustomerDailySketch(Base):
+    """
+    Mergeable summaries of one customer's day for segment analytics (see
+    services/sketches.py and services/segment_analytics.py):
+      - login_count, api_call_count: exact event counts
+      - response_time_sketch: QuantileSketch of api_call response_time_ms
+      - endpoint_hll, feature_hll: HyperLogLog of api_call endpoints and
+        feature_used feature names
+    Only days with a user_login, api_call or feature_used event have a row.
+    """
+    __tablename__ = "customer_daily_sketches"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    login_count = Column(Integer, nullable=False, default=0)
+    api_call_count = Column(Integer, nullable=False, default=0)
+    response_time_sketch = Column(LargeBinary)
+    endpoint_hll = Column(LargeBinary)
+    feature_hll = Column(LargeBinary)
+
+    def __repr__(self):
+        return f"<CustomerDailySketch(customer_id={self.customer_id}, day={self.day})>"
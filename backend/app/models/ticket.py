@@ -0,0 +1,27 @@
+"""
+Support ticket state model for Customer Health API
+"""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Text
+
+from ..database import Base
+
+class TicketState(Base):
+    """
+    Lifecycle of one support ticket, maintained from support_ticket_created and
+    support_ticket_resolved events at ingest time (see services/ticket_states.py).
+    A ticket is open while resolved_at is NULL; opened_at is NULL when only its
+    resolution has been seen.
+    """
+    __tablename__ = "ticket_states"
+
+    customer_id = Column(Text, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    ticket_id = Column(Text, primary_key=True)
+    opened_at = Column(DateTime(timezone=True))
+    resolved_at = Column(DateTime(timezone=True))
+    priority = Column(Text)
+    resolution_type = Column(Text)
+    satisfaction_score = Column(Float)
+    updated_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<TicketState(customer_id={self.customer_id}, ticket_id={self.ticket_id}, resolved_at={self.resolved_at})>"
@@ -0,0 +1,112 @@
+"""
+Async Customer Health Scoring
+
+Async counterpart of calculate_customer_health_score for the asyncio engine.
+By default the whole score is the single COMBINED_METRICS_SQL round trip on the
+request's own connection; with HEALTH_SCORE_SINGLE_PASS=false the factor
+queries for one customer run concurrently on pooled connections, at most
+ASYNC_SCORING_CONNECTIONS (default 2) of them per call. The cap is per call,
+not shared, so one slow request cannot hold back the factor queries of the
+others; size the pool for concurrent requests times the cap. Scoring math is
+shared with health_scoring through the *_from_metrics functions.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from ..core.metrics import observe_scoring
+from .health_scoring import (
+    API_GROWTH_SQL,
+    API_METRICS_SQL,
+    COMBINED_METRICS_SQL,
+    FEATURE_METRICS_SQL,
+    LOGIN_DAYS_SQL,
+    PAYMENT_METRICS_SQL,
+    SUPPORT_METRICS_SQL,
+    api_usage_from_metrics,
+    build_health_score,
+    combined_metrics_params,
+    feature_adoption_from_metrics,
+    get_period_dates,
+    get_score_source,
+    health_score_from_combined_metrics,
+    login_frequency_from_metrics,
+    payment_timeliness_from_metrics,
+    single_pass_enabled,
+    support_ticket_from_metrics,
+)
+
+
+def get_async_scoring_connections() -> int:
+    """Pooled connections the per-factor queries of one scoring call may hold at once."""
+    return max(1, int(os.getenv('ASYNC_SCORING_CONNECTIONS', '2')))
+
+
+async def _fetch_all(engine: AsyncEngine, slots: asyncio.Semaphore, query, params: Dict[str, Any]):
+    async with slots, engine.connect() as conn:
+        return (await conn.execute(query, params)).fetchall()
+
+
+async def _fetch_one(engine: AsyncEngine, slots: asyncio.Semaphore, query, params: Dict[str, Any]):
+    async with slots, engine.connect() as conn:
+        return (await conn.execute(query, params)).fetchone()
+
+
+async def calculate_customer_health_score_async(db: AsyncSession, customer_id: str,
+                                                period_start: Optional[datetime] = None,
+                                                period_end: Optional[datetime] = None,
+                                                source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Calculate the 5-factor health score for a customer without blocking the event loop.
+
+    Takes source like calculate_customer_health_score and returns the same structure.
+    """
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+
+    source = source or get_score_source()
+    if source == 'rollup':
+        # The rollup read is a single query; run the sync implementation on this session
+        from .rollups import calculate_rollup_health_scores
+        results = await db.run_sync(calculate_rollup_health_scores, [customer_id], period_start, period_end)
+        return results[customer_id]
+    if source == 'vectorized':
+        from .vectorized_scoring import calculate_vectorized_health_scores
+        results = await db.run_sync(calculate_vectorized_health_scores, [customer_id], period_start, period_end)
+        return results[customer_id]
+
+    if single_pass_enabled():
+        with observe_scoring('events', 'customer_async'):
+            row = (await db.execute(COMBINED_METRICS_SQL,
+                                    combined_metrics_params(customer_id, period_start, period_end))).fetchone()
+        return health_score_from_combined_metrics(row, period_start, period_end)
+
+    params = {
+        'period_start': period_start,
+        'period_end': period_end,
+        'previous_period_start': period_start - (period_end - period_start),
+        'customer_id': customer_id
+    }
+    with observe_scoring('events', 'customer_async'):
+        engine = db.bind
+        slots = asyncio.Semaphore(get_async_scoring_connections())
+        (login_rows, feature_row, support_row,
+         payment_row, api_row, growth_row) = await asyncio.gather(
+            _fetch_all(engine, slots, LOGIN_DAYS_SQL, params),
+            _fetch_one(engine, slots, FEATURE_METRICS_SQL, params),
+            _fetch_one(engine, slots, SUPPORT_METRICS_SQL, params),
+            _fetch_one(engine, slots, PAYMENT_METRICS_SQL, params),
+            _fetch_one(engine, slots, API_METRICS_SQL, params),
+            _fetch_one(engine, slots, API_GROWTH_SQL, params),
+        )
+
+        login_data = login_frequency_from_metrics(len(login_rows), period_start, period_end)
+        feature_data = feature_adoption_from_metrics(*feature_row)
+        support_data = support_ticket_from_metrics(*support_row)
+        payment_data = payment_timeliness_from_metrics(*payment_row)
+        api_data = api_usage_from_metrics(*api_row, growth_row[0], period_start=period_start, period_end=period_end)
+
+    return build_health_score(login_data, feature_data, support_data, payment_data, api_data)
@@ -0,0 +1,112 @@
+"""
+Derived State Queue
+
+New events make rows of invoice_ledger, ticket_states and
+customer_daily_sketches out of date. Recomputing such a row reads every event
+it aggregates (a sketch day reads all of the day's API calls), which is too
+slow for the ingest transaction, so ingest only records the row keys in
+derived_state_queue and apply_pending_derived_state recomputes them later:
+
+  - HealthScoreWorker drains the queue before it rescores dirty snapshots
+  - ScoreUpdateScheduler and fresh single-customer scoring first apply the
+    pending rows of the customers they score
+
+Queued rows are deleted in the transaction that recomputes them, so a failed
+refresh leaves them queued, and the queue can be shared by workers in several
+processes. Ingest (re)queues a key with ON CONFLICT DO UPDATE, which locks it
+until the ingest commits: a worker skips a key whose new events are not
+committed yet, and an ingest that touches a key being recomputed waits and
+queues it again.
+"""
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .invoice_ledger import invoice_keys, refresh_invoice_ledger
+from .segment_analytics import refresh_segment_sketches, sketch_buckets
+from .ticket_states import refresh_ticket_states, ticket_keys
+
+# Queued rows applied per transaction when draining the queue
+DRAIN_BATCH_SIZE = 5000
+
+QUEUE_SQL = text("""
+    INSERT INTO derived_state_queue (customer_id, kind, key)
+    SELECT customer_id, kind, key
+    FROM unnest(CAST(:customer_ids AS text[]), CAST(:kinds AS text[]), CAST(:keys AS text[]))
+        AS t(customer_id, kind, key)
+    ORDER BY customer_id, kind, key
+    ON CONFLICT (customer_id, kind, key) DO UPDATE SET
+        queued_at = derived_state_queue.queued_at
+""")
+
+# Oldest first; keys locked by an uncommitted ingest or another worker are left for later
+TAKE_QUEUED_SQL = text("""
+    DELETE FROM derived_state_queue q
+    WHERE (q.customer_id, q.kind, q.key) IN (
+        SELECT customer_id, kind, key
+        FROM derived_state_queue
+        ORDER BY queued_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING q.customer_id, q.kind, q.key
+""")
+
+# Every key of the customers, waiting for ingests that are queueing some of them
+TAKE_CUSTOMERS_SQL = text("""
+    DELETE FROM derived_state_queue q
+    WHERE (q.customer_id, q.kind, q.key) IN (
+        SELECT customer_id, kind, key
+        FROM derived_state_queue
+        WHERE customer_id = ANY(:customer_ids)
+        ORDER BY customer_id, kind, key
+        FOR UPDATE
+    )
+    RETURNING q.customer_id, q.kind, q.key
+""")
+
+
+def queue_derived_state(db: Session, events: Iterable[Any]) -> None:
+    """Queue the derived rows touched by newly inserted Event rows or event dicts (same transaction)."""
+    events = list(events)
+    work: Set[Tuple[str, str, str]] = set()
+    work.update((customer_id, 'invoice', invoice_id) for customer_id, invoice_id in invoice_keys(events))
+    work.update((customer_id, 'ticket', ticket_id) for customer_id, ticket_id in ticket_keys(events))
+    work.update((customer_id, 'sketch', day.isoformat()) for customer_id, day in sketch_buckets(db, events))
+    if not work:
+        return
+    db.execute(QUEUE_SQL, {
+        'customer_ids': [customer_id for customer_id, _, _ in work],
+        'kinds': [kind for _, kind, _ in work],
+        'keys': [key for _, _, key in work]
+    })
+
+
+def _apply(db: Session, rows: List[Any]) -> int:
+    by_kind: Dict[str, List[Tuple[str, Any]]] = {'invoice': [], 'ticket': [], 'sketch': []}
+    for customer_id, kind, key in rows:
+        by_kind[kind].append((customer_id, date.fromisoformat(key) if kind == 'sketch' else key))
+    refresh_invoice_ledger(db, by_kind['invoice'])
+    refresh_ticket_states(db, by_kind['ticket'])
+    refresh_segment_sketches(db, by_kind['sketch'])
+    return len(rows)
+
+
+def apply_pending_derived_state(db: Session, customer_ids: Optional[Iterable[str]] = None,
+                                limit: Optional[int] = DRAIN_BATCH_SIZE) -> int:
+    """
+    Recompute queued derived rows and remove them from the queue (in the caller's transaction).
+
+    With customer_ids, every pending row of those customers; otherwise up to limit
+    (all if None) of the oldest rows. Returns the number of rows recomputed.
+    """
+    if customer_ids is not None:
+        customer_ids = sorted(set(customer_ids))
+        if not customer_ids:
+            return 0
+        rows = db.execute(TAKE_CUSTOMERS_SQL, {'customer_ids': customer_ids}).fetchall()
+    else:
+        rows = db.execute(TAKE_QUEUED_SQL, {'limit': limit}).fetchall()
+    return _apply(db, rows)
@@ -0,0 +1,137 @@
+"""
+Typed Event Fields
+
+Extracts the metadata keys the scoring queries read into the typed columns of
+the events table at write time, so queries compare integers and dates instead
+of casting JSONB text on every row. Values that cannot be parsed are stored as
+NULL (the raw value stays in event_metadata) rather than rejecting the event.
+
+Events written without going through the API or loader (for example a raw
+COPY) can be backfilled:
+
+    python -m app.services.event_fields --start 2024-01-01 --end 2024-09-30
+"""
+import argparse
+import json
+import math
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+def _as_text(value: Any) -> Optional[str]:
+    # Same text event_metadata->>'key' would return
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # The columns are INTEGER; larger values would fail the whole insert
+    return int(number) if number.is_integer() and INT_MIN <= number <= INT_MAX else None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+# Column -> parser; the metadata key has the same name as the column
+EVENT_FIELDS: Dict[str, Callable[[Any], Any]] = {
+    'feature_name': _as_text,
+    'completion_percentage': _as_int,
+    'ticket_id': _as_text,
+    'priority': _as_text,
+    'resolution_type': _as_text,
+    'satisfaction_score': _as_float,
+    'invoice_id': _as_text,
+    'amount_usd': _as_float,
+    'due_date': _as_date,
+    'payment_date': _as_date,
+    'days_early_late': _as_int,
+    'endpoint': _as_text,
+    'response_code': _as_int,
+    'response_time_ms': _as_int,
+}
+
+
+def extract_event_fields(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Typed column values for an event's metadata (every column present, None when absent)."""
+    metadata = metadata or {}
+    return {column: parse(metadata.get(column)) for column, parse in EVENT_FIELDS.items()}
+
+
+# SQL equivalents of the parsers above, for rows that were written without them:
+# the event_field_* guarded casts created by migration 0004 (which fills the
+# columns of existing rows with them too) return NULL for values that do not
+# cast, e.g. 2024-13-45 or an integer out of range, instead of failing the statement.
+SQL_EXTRACT = {
+    _as_text: "event_metadata->>'{key}'",
+    _as_int: "event_field_int(event_metadata->>'{key}')",
+    _as_float: "event_field_float(event_metadata->>'{key}')",
+    _as_date: "event_field_date(event_metadata->>'{key}')",
+}
+BACKFILL_SQL = """
+    UPDATE events SET
+        {assignments}
+    WHERE ts >= :start AND ts < :end
+      AND event_metadata IS NOT NULL
+""".format(assignments=",\n        ".join(
+    f"{column} = {SQL_EXTRACT[parse].format(key=column)}" for column, parse in EVENT_FIELDS.items()
+))
+
+
+def backfill_event_fields(db: Session, start_day: date, end_day: date) -> int:
+    """Fill the typed columns from event_metadata one day at a time, committing each day."""
+    updated = 0
+    day = start_day
+    while day <= end_day:
+        result = db.execute(text(BACKFILL_SQL), {
+            'start': datetime.combine(day, datetime.min.time()),
+            'end': datetime.combine(day + timedelta(days=1), datetime.min.time())
+        })
+        db.commit()
+        updated += result.rowcount
+        day += timedelta(days=1)
+    return updated
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Fill typed event columns from event_metadata")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First day to backfill (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last day to backfill (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET statement_timeout = 0"))
+        print(f"Updated {backfill_event_fields(db, args.start, args.end)} events")
+    finally:
+        db.close()
@@ -7,10 +7,12 @@ Payment Timeliness, and API Usage.
 """
 import os
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any, Set, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func, text
 
+from ..core.metrics import observe_scoring
 from ..models import Customer, Event
 
 
@@ -23,26 +25,276 @@ def get_period_dates(days: int = 30) -> tuple[datetime, datetime]:
     return start_date, end_date
 
 
+EPOCH_US_SQL = text("""
+    SELECT (EXTRACT(EPOCH FROM value) * 1000000)::bigint
+    FROM unnest(CAST(:values AS timestamptz[])) WITH ORDINALITY AS t(value, position)
+    ORDER BY position
+""")
+
+
+def to_epoch_us(db: Session, values: List[datetime]) -> List[int]:
+    """Epoch microseconds of timestamp parameters, resolved the way Postgres resolves them
+    (session timezone for naive values), so in-memory engines cut windows exactly like SQL."""
+    if not values:
+        return []
+    return [row[0] for row in db.execute(EPOCH_US_SQL, {'values': list(values)}).fetchall()]
+
+
+# PER-CUSTOMER FACTOR QUERIES
+# Tagged with their factor so app.core.metrics times them
+LOGIN_DAYS_SQL = text("""
+    SELECT DISTINCT DATE(ts) as login_date
+    FROM events 
+    WHERE event_type = 'user_login'
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      AND customer_id = :customer_id
+""").execution_options(metrics_factor='login', metrics_query='login_days')
+
+FEATURE_METRICS_SQL = text("""
+    SELECT 
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'feature_onboarded' 
+              AND completion_percentage = 100
+            THEN feature_name 
+        END) as features_onboarded,
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'feature_used' 
+            THEN feature_name 
+        END) as features_used,
+        COUNT(CASE WHEN event_type = 'feature_used' THEN 1 END) as total_feature_usage
+    FROM events 
+    WHERE event_type IN ('feature_onboarded', 'feature_used')
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      AND customer_id = :customer_id
+""").execution_options(metrics_factor='feature', metrics_query='feature_metrics')
+
+# Reads ticket states (services/ticket_states.py): tickets still open at the end of
+# the window or resolved within it, one row per ticket
+SUPPORT_METRICS_SQL = text("""
+    SELECT 
+        COUNT(*) FILTER (
+            WHERE opened_at >= :period_start AND opened_at <= :period_end
+        ) as tickets_created,
+        COUNT(*) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+        ) as tickets_resolved,
+        COUNT(*) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+              AND resolution_type = 'escalated'
+        ) as tickets_escalated,
+        COUNT(*) FILTER (
+            WHERE opened_at >= :period_start AND opened_at <= :period_end
+              AND priority IN ('high', 'critical')
+        ) as high_priority_tickets,
+        AVG(satisfaction_score) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+        ) as avg_satisfaction,
+        -- Opened by the end of the window (possibly before it) and not resolved by then
+        COUNT(*) FILTER (
+            WHERE opened_at <= :period_end AND (resolved_at IS NULL OR resolved_at > :period_end)
+        ) as currently_open_tickets
+    FROM ticket_states
+    WHERE customer_id = :customer_id
+      AND (resolved_at IS NULL OR resolved_at >= :period_start)
+""").execution_options(metrics_factor='support', metrics_query='support_metrics')
+
+# Reads the invoice ledger (services/invoice_ledger.py), so the cost depends on the
+# invoices issued in the window rather than the customer's whole payment history
+PAYMENT_METRICS_SQL = text("""
+    SELECT 
+        COUNT(*) as total_invoices,
+        COUNT(*) FILTER (WHERE status = 'unpaid') as unpaid_invoices,
+        COUNT(*) FILTER (WHERE status = 'on_time_or_early') as on_time_payments,
+        COUNT(*) FILTER (WHERE status = 'late_acceptable') as late_acceptable,
+        COUNT(*) FILTER (WHERE status = 'late_concerning') as late_concerning,
+        SUM(failure_count) as total_payment_failures,
+        AVG(days_early_late) as avg_payment_delay,
+        SUM(CASE WHEN status = 'unpaid' THEN amount_usd ELSE 0 END) as unpaid_amount
+    FROM invoice_ledger
+    WHERE customer_id = :customer_id
+      AND issued_at >= :period_start 
+      AND issued_at <= :period_end
+""").execution_options(metrics_factor='payment', metrics_query='payment_metrics')
+
+API_METRICS_SQL = text("""
+    SELECT 
+        COUNT(CASE WHEN event_type = 'api_call' THEN 1 END) as total_api_calls,
+        COUNT(CASE WHEN event_type = 'api_rate_limit_exceeded' THEN 1 END) as rate_limit_hits,
+        COUNT(DISTINCT DATE(ts)) as active_api_days,
+        COUNT(CASE 
+            WHEN event_type = 'api_call' 
+              AND response_code BETWEEN 200 AND 299 
+            THEN 1 
+        END)::float / NULLIF(COUNT(CASE WHEN event_type = 'api_call' THEN 1 END), 0) * 100 as success_rate,
+        AVG(CASE 
+            WHEN event_type = 'api_call' 
+            THEN response_time_ms 
+        END) as avg_response_time,
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'api_call' 
+            THEN endpoint 
+        END) as unique_endpoints_used
+    FROM events 
+    WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      AND customer_id = :customer_id
+""").execution_options(metrics_factor='api', metrics_query='api_metrics')
+
+API_GROWTH_SQL = text("""
+    SELECT COUNT(*) as previous_period_calls
+    FROM events 
+    WHERE event_type = 'api_call'
+      AND ts >= :previous_period_start 
+      AND ts < :period_start
+      AND customer_id = :customer_id
+""").execution_options(metrics_factor='api', metrics_query='api_growth')
+
+
+# SINGLE-PASS PER-CUSTOMER QUERY
+# The six queries above folded into one statement: the customer's events are
+# read once (the scoring window plus the growth look-back), then every factor
+# is a FILTERed aggregate over that set; support and payments come from the
+# ticket states and invoice ledger as in SUPPORT_METRICS_SQL and PAYMENT_METRICS_SQL. Column order matches the *_from_metrics
+# arguments; each aggregate is the one the per-factor query computes.
+COMBINED_METRICS_SQL = text("""
+    WITH customer_events AS MATERIALIZED (
+        SELECT
+            event_type,
+            ts,
+            ts >= :period_start AND ts <= :period_end as in_period,
+            feature_name,
+            completion_percentage,
+            endpoint,
+            response_code,
+            response_time_ms
+        FROM events
+        WHERE customer_id = :customer_id
+          AND ts >= :previous_period_start
+          AND ts <= :period_end
+    ),
+    metrics AS (
+        SELECT
+            COUNT(DISTINCT DATE(ts)) FILTER (
+                WHERE in_period AND event_type = 'user_login'
+            ) as days_logged_in,
+            COUNT(DISTINCT feature_name) FILTER (
+                WHERE in_period AND event_type = 'feature_onboarded' AND completion_percentage = 100
+            ) as features_onboarded,
+            COUNT(DISTINCT feature_name) FILTER (
+                WHERE in_period AND event_type = 'feature_used'
+            ) as features_used,
+            COUNT(*) FILTER (WHERE in_period AND event_type = 'feature_used') as total_feature_usage,
+            COUNT(*) FILTER (WHERE in_period AND event_type = 'api_call') as total_api_calls,
+            COUNT(*) FILTER (WHERE in_period AND event_type = 'api_rate_limit_exceeded') as rate_limit_hits,
+            COUNT(DISTINCT DATE(ts)) FILTER (
+                WHERE in_period AND event_type IN ('api_call', 'api_rate_limit_exceeded')
+            ) as active_api_days,
+            COUNT(*) FILTER (
+                WHERE in_period AND event_type = 'api_call' AND response_code BETWEEN 200 AND 299
+            )::float / NULLIF(COUNT(*) FILTER (WHERE in_period AND event_type = 'api_call'), 0) * 100 as success_rate,
+            AVG(response_time_ms) FILTER (WHERE in_period AND event_type = 'api_call') as avg_response_time,
+            COUNT(DISTINCT endpoint) FILTER (
+                WHERE in_period AND event_type = 'api_call'
+            ) as unique_endpoints_used,
+            COUNT(*) FILTER (
+                WHERE event_type = 'api_call' AND ts >= :previous_period_start AND ts < :period_start
+            ) as previous_period_calls
+        FROM customer_events
+    ),
+    support AS (
+        SELECT
+            COUNT(*) FILTER (
+                WHERE opened_at >= :period_start AND opened_at <= :period_end
+            ) as tickets_created,
+            COUNT(*) FILTER (
+                WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+            ) as tickets_resolved,
+            COUNT(*) FILTER (
+                WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+                  AND resolution_type = 'escalated'
+            ) as tickets_escalated,
+            COUNT(*) FILTER (
+                WHERE opened_at >= :period_start AND opened_at <= :period_end
+                  AND priority IN ('high', 'critical')
+            ) as high_priority_tickets,
+            AVG(satisfaction_score) FILTER (
+                WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+            ) as avg_satisfaction,
+            -- Opened by the end of the window (possibly before it) and not resolved by then
+            COUNT(*) FILTER (
+                WHERE opened_at <= :period_end AND (resolved_at IS NULL OR resolved_at > :period_end)
+            ) as currently_open_tickets
+        FROM ticket_states
+        WHERE customer_id = :customer_id
+          AND (resolved_at IS NULL OR resolved_at >= :period_start)
+    ),
+    payments AS (
+        SELECT
+            COUNT(*) as total_invoices,
+            COUNT(*) FILTER (WHERE status = 'unpaid') as unpaid_invoices,
+            COUNT(*) FILTER (WHERE status = 'on_time_or_early') as on_time_payments,
+            COUNT(*) FILTER (WHERE status = 'late_acceptable') as late_acceptable,
+            COUNT(*) FILTER (WHERE status = 'late_concerning') as late_concerning,
+            SUM(failure_count) as total_payment_failures,
+            AVG(days_early_late) as avg_payment_delay,
+            SUM(CASE WHEN status = 'unpaid' THEN amount_usd ELSE 0 END) as unpaid_amount
+        FROM invoice_ledger
+        WHERE customer_id = :customer_id
+          AND issued_at >= :period_start
+          AND issued_at <= :period_end
+    )
+    SELECT
+        metrics.days_logged_in,
+        metrics.features_onboarded, metrics.features_used, metrics.total_feature_usage,
+        support.tickets_created, support.tickets_resolved, support.tickets_escalated,
+        support.high_priority_tickets, support.avg_satisfaction, support.currently_open_tickets,
+        payments.total_invoices, payments.unpaid_invoices, payments.on_time_payments,
+        payments.late_acceptable, payments.late_concerning, payments.total_payment_failures,
+        payments.avg_payment_delay, payments.unpaid_amount,
+        metrics.total_api_calls, metrics.rate_limit_hits, metrics.active_api_days, metrics.success_rate,
+        metrics.avg_response_time, metrics.unique_endpoints_used, metrics.previous_period_calls
+    FROM metrics, support, payments
+""").execution_options(metrics_factor='combined', metrics_query='combined_metrics')
+
+
+def combined_metrics_params(customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
+    return {
+        'customer_id': customer_id,
+        'period_start': period_start,
+        'period_end': period_end,
+        'previous_period_start': period_start - (period_end - period_start)
+    }
+
+
+def health_score_from_combined_metrics(row, period_start: datetime, period_end: datetime,
+                                       weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Score a COMBINED_METRICS_SQL row; same result as running the factor queries one by one."""
+    login_data = login_frequency_from_metrics(row[0] or 0, period_start, period_end)
+    feature_data = feature_adoption_from_metrics(*row[1:4])
+    support_data = support_ticket_from_metrics(*row[4:10])
+    payment_data = payment_timeliness_from_metrics(*row[10:18])
+    api_data = api_usage_from_metrics(*row[18:25], period_start=period_start, period_end=period_end)
+    return build_health_score(login_data, feature_data, support_data, payment_data, api_data, weights)
+
+
 # 1. LOGIN FREQUENCY SCORE
 def calc_login_frequency_score(db: Session, customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
     """Calculate login frequency score based on days logged in vs total days in period."""
     # Get unique login days in period
-    login_days_query = text("""
-        SELECT DISTINCT DATE(ts) as login_date
-        FROM events 
-        WHERE event_type = 'user_login'
-          AND ts >= :period_start 
-          AND ts <= :period_end
-          AND customer_id = :customer_id
-    """)
-    
-    result = db.execute(login_days_query, {
+    result = db.execute(LOGIN_DAYS_SQL, {
         'period_start': period_start,
         'period_end': period_end,
         'customer_id': customer_id
     }).fetchall()
     
-    days_logged_in = len(result)
+    return login_frequency_from_metrics(len(result), period_start, period_end)
+
+
+def login_frequency_from_metrics(days_logged_in: int, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
+    """Score login frequency from the number of distinct login days in the period."""
     total_days_in_period = (period_end.date() - period_start.date()).days + 1
     
     if total_days_in_period == 0:
@@ -64,34 +316,21 @@ def calc_login_frequency_score(db: Session, customer_id: str, period_start: date
 def calc_feature_adoption_score(db: Session, customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
     """Calculate feature adoption score combining onboarding completion and feature usage diversity."""
     # Get feature metrics
-    feature_metrics_query = text("""
-        SELECT 
-            COUNT(DISTINCT CASE 
-                WHEN event_type = 'feature_onboarded' 
-                  AND (event_metadata->>'completion_percentage')::int = 100
-                THEN event_metadata->>'feature_name' 
-            END) as features_onboarded,
-            COUNT(DISTINCT CASE 
-                WHEN event_type = 'feature_used' 
-                THEN event_metadata->>'feature_name' 
-            END) as features_used,
-            COUNT(CASE WHEN event_type = 'feature_used' THEN 1 END) as total_feature_usage
-        FROM events 
-        WHERE event_type IN ('feature_onboarded', 'feature_used')
-          AND ts >= :period_start 
-          AND ts <= :period_end
-          AND customer_id = :customer_id
-    """)
-    
-    result = db.execute(feature_metrics_query, {
+    result = db.execute(FEATURE_METRICS_SQL, {
         'period_start': period_start,
         'period_end': period_end,
         'customer_id': customer_id
     }).fetchone()
     
-    features_onboarded = result[0] if result[0] else 0
-    features_used = result[1] if result[1] else 0
-    total_feature_usage = result[2] if result[2] else 0
+    return feature_adoption_from_metrics(result[0], result[1], result[2])
+
+
+def feature_adoption_from_metrics(features_onboarded: Optional[int], features_used: Optional[int],
+                                  total_feature_usage: Optional[int]) -> Dict[str, Any]:
+    """Score feature adoption from the aggregated feature metrics row."""
+    features_onboarded = features_onboarded if features_onboarded else 0
+    features_used = features_used if features_used else 0
+    total_feature_usage = total_feature_usage if total_feature_usage else 0
     
     # Assume 8 total features available
     total_features = 8
@@ -117,70 +356,26 @@ def calc_feature_adoption_score(db: Session, customer_id: str, period_start: dat
 # 3. SUPPORT TICKET SCORE
 def calc_support_ticket_score(db: Session, customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
     """Calculate support health considering ticket volume, resolution rate, and escalations."""
-    # Get support metrics
-    support_metrics_query = text("""
-        SELECT 
-            COUNT(CASE WHEN event_type = 'support_ticket_created' THEN 1 END) as tickets_created,
-            COUNT(CASE WHEN event_type = 'support_ticket_resolved' THEN 1 END) as tickets_resolved,
-            COUNT(CASE 
-                WHEN event_type = 'support_ticket_resolved' 
-                  AND event_metadata->>'resolution_type' = 'escalated' 
-                THEN 1 
-            END) as tickets_escalated,
-            COUNT(CASE 
-                WHEN event_type = 'support_ticket_created' 
-                  AND event_metadata->>'priority' IN ('high', 'critical')
-                THEN 1 
-            END) as high_priority_tickets,
-            AVG(CASE 
-                WHEN event_type = 'support_ticket_resolved' 
-                  AND event_metadata->>'satisfaction_score' IS NOT NULL
-                THEN (event_metadata->>'satisfaction_score')::float 
-            END) as avg_satisfaction
-        FROM events 
-        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
-          AND ts >= :period_start 
-          AND ts <= :period_end
-          AND customer_id = :customer_id
-    """)
-    
-    result = db.execute(support_metrics_query, {
+    # Ticket counts, satisfaction and open tickets in one lookup
+    result = db.execute(SUPPORT_METRICS_SQL, {
         'period_start': period_start,
         'period_end': period_end,
         'customer_id': customer_id
     }).fetchone()
     
-    tickets_created = result[0] if result[0] else 0
-    tickets_resolved = result[1] if result[1] else 0
-    tickets_escalated = result[2] if result[2] else 0
-    high_priority_tickets = result[3] if result[3] else 0
-    avg_satisfaction = result[4] if result[4] else None
-    
-    # Calculate currently open tickets
-    open_tickets_query = text("""
-        SELECT COUNT(*) as currently_open_tickets
-        FROM (
-            SELECT 
-                event_metadata->>'ticket_id' as ticket_id,
-                SUM(CASE WHEN event_type = 'support_ticket_created' THEN 1 ELSE 0 END) as created,
-                SUM(CASE WHEN event_type = 'support_ticket_resolved' THEN 1 ELSE 0 END) as resolved
-            FROM events 
-            WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
-              AND ts >= :period_start 
-              AND ts <= :period_end
-              AND customer_id = :customer_id
-            GROUP BY event_metadata->>'ticket_id'
-        ) ticket_status
-        WHERE created > resolved
-    """)
-    
-    open_result = db.execute(open_tickets_query, {
-        'period_start': period_start,
-        'period_end': period_end,
-        'customer_id': customer_id
-    }).fetchone()
-    
-    currently_open_tickets = open_result[0] if open_result[0] else 0
+    return support_ticket_from_metrics(*result)
+
+
+def support_ticket_from_metrics(tickets_created: Optional[int], tickets_resolved: Optional[int],
+                                tickets_escalated: Optional[int], high_priority_tickets: Optional[int],
+                                avg_satisfaction: Optional[float], currently_open_tickets: Optional[int]) -> Dict[str, Any]:
+    """Score support health from the aggregated ticket metrics."""
+    tickets_created = tickets_created if tickets_created else 0
+    tickets_resolved = tickets_resolved if tickets_resolved else 0
+    tickets_escalated = tickets_escalated if tickets_escalated else 0
+    high_priority_tickets = high_priority_tickets if high_priority_tickets else 0
+    avg_satisfaction = avg_satisfaction if avg_satisfaction else None
+    currently_open_tickets = currently_open_tickets if currently_open_tickets else 0
     
     # Calculate component scores (convert to float)
     volume_score = max(0, 100.0 - (float(tickets_created) * 5))  # -5 points per ticket
@@ -216,78 +411,28 @@ def calc_support_ticket_score(db: Session, customer_id: str, period_start: datet
 def calc_payment_timeliness_score(db: Session, customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
     """Calculate payment health considering overdue invoices, payment delays, and failed payments."""
     # Get payment metrics
-    payment_metrics_query = text("""
-        WITH payment_metrics AS (
-            SELECT 
-                inv.invoice_id,
-                inv.amount_usd,
-                inv.due_date,
-                pay.payment_date,
-                pay.days_early_late,
-                CASE 
-                    WHEN pay.payment_date IS NULL THEN 'unpaid'
-                    WHEN pay.days_early_late <= 0 THEN 'on_time_or_early'
-                    WHEN pay.days_early_late BETWEEN 1 AND 10 THEN 'late_acceptable'
-                    WHEN pay.days_early_late > 10 THEN 'late_concerning'
-                END as payment_status,
-                COALESCE(fail.failure_count, 0) as failure_count
-            FROM (
-                SELECT 
-                    event_metadata->>'invoice_id' as invoice_id,
-                    (event_metadata->>'amount_usd')::float as amount_usd,
-                    (event_metadata->>'due_date')::date as due_date,
-                    ts
-                FROM events 
-                WHERE event_type = 'invoice_generated'
-                  AND ts >= :period_start 
-                  AND ts <= :period_end
-                  AND customer_id = :customer_id
-            ) inv
-            LEFT JOIN (
-                SELECT 
-                    event_metadata->>'invoice_id' as invoice_id,
-                    (event_metadata->>'payment_date')::date as payment_date,
-                    (event_metadata->>'days_early_late')::int as days_early_late
-                FROM events 
-                WHERE event_type = 'payment_received'
-                  AND customer_id = :customer_id
-            ) pay ON inv.invoice_id = pay.invoice_id
-            LEFT JOIN (
-                SELECT 
-                    event_metadata->>'invoice_id' as invoice_id,
-                    COUNT(*) as failure_count
-                FROM events 
-                WHERE event_type = 'payment_failed'
-                  AND customer_id = :customer_id
-                GROUP BY event_metadata->>'invoice_id'
-            ) fail ON inv.invoice_id = fail.invoice_id
-        )
-        SELECT 
-            COUNT(*) as total_invoices,
-            COUNT(CASE WHEN payment_status = 'unpaid' THEN 1 END) as unpaid_invoices,
-            COUNT(CASE WHEN payment_status = 'on_time_or_early' THEN 1 END) as on_time_payments,
-            COUNT(CASE WHEN payment_status = 'late_acceptable' THEN 1 END) as late_acceptable,
-            COUNT(CASE WHEN payment_status = 'late_concerning' THEN 1 END) as late_concerning,
-            SUM(failure_count) as total_payment_failures,
-            AVG(CASE WHEN days_early_late IS NOT NULL THEN days_early_late END) as avg_payment_delay,
-            SUM(CASE WHEN payment_status = 'unpaid' THEN amount_usd ELSE 0 END) as unpaid_amount
-        FROM payment_metrics
-    """)
-    
-    result = db.execute(payment_metrics_query, {
+    result = db.execute(PAYMENT_METRICS_SQL, {
         'period_start': period_start,
         'period_end': period_end,
         'customer_id': customer_id
     }).fetchone()
     
-    total_invoices = result[0] if result[0] else 0
-    unpaid_invoices = result[1] if result[1] else 0
-    on_time_payments = result[2] if result[2] else 0
-    late_acceptable = result[3] if result[3] else 0
-    late_concerning = result[4] if result[4] else 0
-    total_payment_failures = result[5] if result[5] else 0
-    avg_payment_delay = result[6] if result[6] else 0
-    unpaid_amount = result[7] if result[7] else 0
+    return payment_timeliness_from_metrics(*result)
+
+
+def payment_timeliness_from_metrics(total_invoices: Optional[int], unpaid_invoices: Optional[int],
+                                    on_time_payments: Optional[int], late_acceptable: Optional[int],
+                                    late_concerning: Optional[int], total_payment_failures: Optional[int],
+                                    avg_payment_delay: Optional[float], unpaid_amount: Optional[float]) -> Dict[str, Any]:
+    """Score payment health from the aggregated invoice metrics row."""
+    total_invoices = total_invoices if total_invoices else 0
+    unpaid_invoices = unpaid_invoices if unpaid_invoices else 0
+    on_time_payments = on_time_payments if on_time_payments else 0
+    late_acceptable = late_acceptable if late_acceptable else 0
+    late_concerning = late_concerning if late_concerning else 0
+    total_payment_failures = total_payment_failures if total_payment_failures else 0
+    avg_payment_delay = avg_payment_delay if avg_payment_delay else 0
+    unpaid_amount = unpaid_amount if unpaid_amount else 0
     
     # Calculate component scores (convert Decimal to float)
     on_time_rate_score = float((on_time_payments / total_invoices * 100)) if total_invoices > 0 else 100.0
@@ -322,62 +467,37 @@ def calc_payment_timeliness_score(db: Session, customer_id: str, period_start: d
 def calc_api_usage_score(db: Session, customer_id: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
     """Calculate API usage health considering call volume, growth trends, and rate limit issues."""
     # Get API metrics
-    api_metrics_query = text("""
-        SELECT 
-            COUNT(CASE WHEN event_type = 'api_call' THEN 1 END) as total_api_calls,
-            COUNT(CASE WHEN event_type = 'api_rate_limit_exceeded' THEN 1 END) as rate_limit_hits,
-            COUNT(DISTINCT DATE(ts)) as active_api_days,
-            COUNT(CASE 
-                WHEN event_type = 'api_call' 
-                  AND (event_metadata->>'response_code')::int BETWEEN 200 AND 299 
-                THEN 1 
-            END)::float / NULLIF(COUNT(CASE WHEN event_type = 'api_call' THEN 1 END), 0) * 100 as success_rate,
-            AVG(CASE 
-                WHEN event_type = 'api_call' 
-                THEN (event_metadata->>'response_time_ms')::int 
-            END) as avg_response_time,
-            COUNT(DISTINCT CASE 
-                WHEN event_type = 'api_call' 
-                THEN event_metadata->>'endpoint' 
-            END) as unique_endpoints_used
-        FROM events 
-        WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
-          AND ts >= :period_start 
-          AND ts <= :period_end
-          AND customer_id = :customer_id
-    """)
-    
-    result = db.execute(api_metrics_query, {
+    result = db.execute(API_METRICS_SQL, {
         'period_start': period_start,
         'period_end': period_end,
         'customer_id': customer_id
     }).fetchone()
     
-    total_api_calls = result[0] if result[0] else 0
-    rate_limit_hits = result[1] if result[1] else 0
-    active_api_days = result[2] if result[2] else 0
-    success_rate = result[3] if result[3] else 90
-    avg_response_time = result[4] if result[4] else 0
-    unique_endpoints_used = result[5] if result[5] else 0
-    
     # Calculate growth vs previous period
     previous_period_start = period_start - (period_end - period_start)
-    growth_query = text("""
-        SELECT COUNT(*) as previous_period_calls
-        FROM events 
-        WHERE event_type = 'api_call'
-          AND ts >= :previous_period_start 
-          AND ts < :period_start
-          AND customer_id = :customer_id
-    """)
-    
-    growth_result = db.execute(growth_query, {
+    
+    growth_result = db.execute(API_GROWTH_SQL, {
         'previous_period_start': previous_period_start,
         'period_start': period_start,
         'customer_id': customer_id
     }).fetchone()
     
-    previous_period_calls = growth_result[0] if growth_result[0] else 0
+    return api_usage_from_metrics(*result, growth_result[0], period_start=period_start, period_end=period_end)
+
+
+def api_usage_from_metrics(total_api_calls: Optional[int], rate_limit_hits: Optional[int],
+                           active_api_days: Optional[int], success_rate: Optional[float],
+                           avg_response_time: Optional[float], unique_endpoints_used: Optional[int],
+                           previous_period_calls: Optional[int], *,
+                           period_start: datetime, period_end: datetime) -> Dict[str, Any]:
+    """Score API usage from the aggregated API metrics and the previous-period call count."""
+    total_api_calls = total_api_calls if total_api_calls else 0
+    rate_limit_hits = rate_limit_hits if rate_limit_hits else 0
+    active_api_days = active_api_days if active_api_days else 0
+    success_rate = success_rate if success_rate else 90
+    avg_response_time = avg_response_time if avg_response_time else 0
+    unique_endpoints_used = unique_endpoints_used if unique_endpoints_used else 0
+    previous_period_calls = previous_period_calls if previous_period_calls else 0
     
     # Calculate component scores
     period_days = (period_end.date() - period_start.date()).days + 1
@@ -412,35 +532,55 @@ def calc_api_usage_score(db: Session, customer_id: str, period_start: datetime,
 
 
 # MAIN HEALTH SCORE CALCULATION
-def calculate_customer_health_score(db: Session, customer: Customer) -> Dict[str, Any]:
-    """
-    Calculate comprehensive health score for a customer using all 5 factors.
-    
-    Args:
-        db: Database session
-        customer: Customer model instance
-        
-    Returns:
-        Dict containing score breakdown and final score
-    """
-    # Get 30-day period
-    period_start, period_end = get_period_dates(30)
-    
-    # Calculate all health factors
-    login_data = calc_login_frequency_score(db, customer.id, period_start, period_end)
-    feature_data = calc_feature_adoption_score(db, customer.id, period_start, period_end)
-    support_data = calc_support_ticket_score(db, customer.id, period_start, period_end)
-    payment_data = calc_payment_timeliness_score(db, customer.id, period_start, period_end)
-    api_data = calc_api_usage_score(db, customer.id, period_start, period_end)
-    
-    # Configurable weights via environment variables
-    weights = {
+# Factor order of the weight vector and of the factor columns stored in health_scores
+HEALTH_FACTORS = ('login_frequency', 'feature_adoption', 'support_tickets', 'payment_health', 'api_usage')
+
+
+@lru_cache(maxsize=1)
+def _load_health_weights() -> Dict[str, float]:
+    return {
         'login_frequency': float(os.getenv('WEIGHT_LOGIN_FREQUENCY', '0.20')),
         'feature_adoption': float(os.getenv('WEIGHT_FEATURE_ADOPTION', '0.25')),
         'support_tickets': float(os.getenv('WEIGHT_SUPPORT_TICKETS', '0.20')),
         'payment_health': float(os.getenv('WEIGHT_PAYMENT_HEALTH', '0.20')),
         'api_usage': float(os.getenv('WEIGHT_API_USAGE', '0.15'))
     }
+
+
+def get_health_weights() -> Dict[str, float]:
+    """Configurable factor weights via environment variables (read once per process)."""
+    return dict(_load_health_weights())
+
+
+@lru_cache(maxsize=1)
+def _load_label_thresholds() -> Dict[str, float]:
+    return {
+        'healthy': float(os.getenv('LABEL_HEALTHY_MIN_SCORE', '80')),
+        'at_risk': float(os.getenv('LABEL_AT_RISK_MIN_SCORE', '60'))
+    }
+
+
+def get_label_thresholds() -> Dict[str, float]:
+    """Minimum scores for the Healthy and At Risk labels (read once per process)."""
+    return dict(_load_label_thresholds())
+
+
+def health_label(score: float, thresholds: Optional[Dict[str, float]] = None) -> str:
+    if thresholds is None:
+        thresholds = get_label_thresholds()
+    if score >= thresholds['healthy']:
+        return "Healthy"
+    if score >= thresholds['at_risk']:
+        return "At Risk"
+    return "Unhealthy"
+
+
+def build_health_score(login_data: Dict[str, Any], feature_data: Dict[str, Any], support_data: Dict[str, Any],
+                       payment_data: Dict[str, Any], api_data: Dict[str, Any],
+                       weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Combine the five factor results into the weighted score, label and breakdown."""
+    if weights is None:
+        weights = get_health_weights()
     
     # Calculate weighted total
     weighted_score = (
@@ -452,12 +592,7 @@ def calculate_customer_health_score(db: Session, customer: Customer) -> Dict[str
     )
     
     # Determine health label
-    if weighted_score >= 80:
-        label = "Healthy"
-    elif weighted_score >= 60:
-        label = "At Risk"
-    else:
-        label = "Unhealthy"
+    label = health_label(weighted_score)
     
     return {
         'score': round(weighted_score, 1),
@@ -504,3 +639,273 @@ def calculate_customer_health_score(db: Session, customer: Customer) -> Dict[str
         },
         'last_updated': datetime.now().isoformat()
     }
+
+
+def get_score_source() -> str:
+    """
+    Default scoring source: 'events' (raw events), 'rollup' (customer_daily_rollups)
+    or 'vectorized' (raw events scored in memory with NumPy).
+    """
+    return os.getenv('HEALTH_SCORE_SOURCE', 'events')
+
+
+def single_pass_enabled() -> bool:
+    """Score one customer from raw events with COMBINED_METRICS_SQL (HEALTH_SCORE_SINGLE_PASS, default true)."""
+    return os.getenv('HEALTH_SCORE_SINGLE_PASS', 'true').lower() == 'true'
+
+
+def calculate_customer_health_score(db: Session, customer: Customer,
+                                    period_start: Optional[datetime] = None,
+                                    period_end: Optional[datetime] = None,
+                                    source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Calculate comprehensive health score for a customer using all 5 factors.
+    
+    Args:
+        db: Database session
+        customer: Customer model instance
+        period_start: Start of the scoring window (defaults to the 30-day period)
+        period_end: End of the scoring window (defaults to the 30-day period)
+        source: 'events', 'rollup' or 'vectorized' (defaults to HEALTH_SCORE_SOURCE)
+        
+    Returns:
+        Dict containing score breakdown and final score
+    """
+    # Get 30-day period
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    
+    source = source or get_score_source()
+    with observe_scoring(source, 'customer'):
+        if source == 'rollup':
+            from .rollups import calculate_rollup_health_scores
+            return calculate_rollup_health_scores(db, [customer.id], period_start, period_end)[customer.id]
+        if source == 'vectorized':
+            from .vectorized_scoring import calculate_vectorized_health_scores
+            return calculate_vectorized_health_scores(db, [customer.id], period_start, period_end)[customer.id]
+
+        if not single_pass_enabled():
+            return calculate_customer_health_score_per_factor(db, customer.id, period_start, period_end)
+
+        # All five factors in one round trip
+        row = db.execute(COMBINED_METRICS_SQL,
+                         combined_metrics_params(customer.id, period_start, period_end)).fetchone()
+        return health_score_from_combined_metrics(row, period_start, period_end)
+
+
+def calculate_customer_health_score_per_factor(db: Session, customer_id: str, period_start: datetime,
+                                               period_end: datetime) -> Dict[str, Any]:
+    """The events score with one query per factor (six round trips); kept as the parity reference."""
+    login_data = calc_login_frequency_score(db, customer_id, period_start, period_end)
+    feature_data = calc_feature_adoption_score(db, customer_id, period_start, period_end)
+    support_data = calc_support_ticket_score(db, customer_id, period_start, period_end)
+    payment_data = calc_payment_timeliness_score(db, customer_id, period_start, period_end)
+    api_data = calc_api_usage_score(db, customer_id, period_start, period_end)
+
+    return build_health_score(login_data, feature_data, support_data, payment_data, api_data)
+
+
+# BULK HEALTH SCORE CALCULATION
+# Each query below is the GROUP BY customer_id form of the matching per-customer
+# query above, so a full scoring pass costs six statements instead of 6 x N.
+BULK_LOGIN_DAYS_SQL = """
+    SELECT customer_id, COUNT(DISTINCT DATE(ts)) as days_logged_in
+    FROM events 
+    WHERE event_type = 'user_login'
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+BULK_FEATURE_METRICS_SQL = """
+    SELECT 
+        customer_id,
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'feature_onboarded' 
+              AND completion_percentage = 100
+            THEN feature_name 
+        END) as features_onboarded,
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'feature_used' 
+            THEN feature_name 
+        END) as features_used,
+        COUNT(CASE WHEN event_type = 'feature_used' THEN 1 END) as total_feature_usage
+    FROM events 
+    WHERE event_type IN ('feature_onboarded', 'feature_used')
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+BULK_SUPPORT_METRICS_SQL = """
+    SELECT 
+        customer_id,
+        COUNT(*) FILTER (
+            WHERE opened_at >= :period_start AND opened_at <= :period_end
+        ) as tickets_created,
+        COUNT(*) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+        ) as tickets_resolved,
+        COUNT(*) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+              AND resolution_type = 'escalated'
+        ) as tickets_escalated,
+        COUNT(*) FILTER (
+            WHERE opened_at >= :period_start AND opened_at <= :period_end
+              AND priority IN ('high', 'critical')
+        ) as high_priority_tickets,
+        AVG(satisfaction_score) FILTER (
+            WHERE resolved_at >= :period_start AND resolved_at <= :period_end
+        ) as avg_satisfaction,
+        -- Opened by the end of the window (possibly before it) and not resolved by then
+        COUNT(*) FILTER (
+            WHERE opened_at <= :period_end AND (resolved_at IS NULL OR resolved_at > :period_end)
+        ) as currently_open_tickets
+    FROM ticket_states
+    WHERE (resolved_at IS NULL OR resolved_at >= :period_start)
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+BULK_PAYMENT_METRICS_SQL = """
+    SELECT 
+        customer_id,
+        COUNT(*) as total_invoices,
+        COUNT(*) FILTER (WHERE status = 'unpaid') as unpaid_invoices,
+        COUNT(*) FILTER (WHERE status = 'on_time_or_early') as on_time_payments,
+        COUNT(*) FILTER (WHERE status = 'late_acceptable') as late_acceptable,
+        COUNT(*) FILTER (WHERE status = 'late_concerning') as late_concerning,
+        SUM(failure_count) as total_payment_failures,
+        AVG(days_early_late) as avg_payment_delay,
+        SUM(CASE WHEN status = 'unpaid' THEN amount_usd ELSE 0 END) as unpaid_amount
+    FROM invoice_ledger
+    WHERE issued_at >= :period_start 
+      AND issued_at <= :period_end
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+BULK_API_METRICS_SQL = """
+    SELECT 
+        customer_id,
+        COUNT(CASE WHEN event_type = 'api_call' THEN 1 END) as total_api_calls,
+        COUNT(CASE WHEN event_type = 'api_rate_limit_exceeded' THEN 1 END) as rate_limit_hits,
+        COUNT(DISTINCT DATE(ts)) as active_api_days,
+        COUNT(CASE 
+            WHEN event_type = 'api_call' 
+              AND response_code BETWEEN 200 AND 299 
+            THEN 1 
+        END)::float / NULLIF(COUNT(CASE WHEN event_type = 'api_call' THEN 1 END), 0) * 100 as success_rate,
+        AVG(CASE 
+            WHEN event_type = 'api_call' 
+            THEN response_time_ms 
+        END) as avg_response_time,
+        COUNT(DISTINCT CASE 
+            WHEN event_type = 'api_call' 
+            THEN endpoint 
+        END) as unique_endpoints_used
+    FROM events 
+    WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+      AND ts >= :period_start 
+      AND ts <= :period_end
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+BULK_API_GROWTH_SQL = """
+    SELECT customer_id, COUNT(*) as previous_period_calls
+    FROM events 
+    WHERE event_type = 'api_call'
+      AND ts >= :previous_period_start 
+      AND ts < :period_start
+      {customer_filter}
+    GROUP BY customer_id
+"""
+
+
+def _fetch_grouped(db: Session, sql: str, params: Dict[str, Any], customer_filter: str,
+                   factor: str, query: str) -> Dict[str, tuple]:
+    """Run a GROUP BY customer_id query and index the remaining columns by customer id."""
+    statement = text(sql.format(customer_filter=customer_filter)).execution_options(
+        metrics_factor=factor, metrics_query=query
+    )
+    rows = db.execute(statement, params).fetchall()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def calculate_bulk_health_scores(db: Session, customer_ids: Optional[List[str]] = None,
+                                 period_start: Optional[datetime] = None,
+                                 period_end: Optional[datetime] = None,
+                                 source: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Calculate health scores for many customers with one GROUP BY query per metric.
+    
+    Produces the same result per customer as calculate_customer_health_score, but the
+    number of round trips is constant instead of growing with the customer count.
+    
+    Args:
+        db: Database session
+        customer_ids: Customers to score; None scores every customer
+        period_start: Start of the scoring window (defaults to the 30-day period)
+        period_end: End of the scoring window (defaults to the 30-day period)
+        source: 'events', 'rollup' or 'vectorized' (defaults to HEALTH_SCORE_SOURCE)
+        
+    Returns:
+        Dict mapping customer id to the same structure calculate_customer_health_score returns
+    """
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    
+    source = source or get_score_source()
+    with observe_scoring(source, 'bulk'):
+        if source == 'rollup':
+            from .rollups import calculate_rollup_health_scores
+            return calculate_rollup_health_scores(db, customer_ids, period_start, period_end)
+        if source == 'vectorized':
+            from .vectorized_scoring import calculate_vectorized_health_scores
+            return calculate_vectorized_health_scores(db, customer_ids, period_start, period_end)
+
+        if customer_ids is None:
+            customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers")).fetchall()]
+            customer_filter = ""
+        else:
+            customer_ids = list(customer_ids)
+            customer_filter = "AND customer_id = ANY(:customer_ids)"
+        if not customer_ids:
+            return {}
+
+        params = {
+            'period_start': period_start,
+            'period_end': period_end,
+            'previous_period_start': period_start - (period_end - period_start),
+            'customer_ids': customer_ids
+        }
+
+        login_rows = _fetch_grouped(db, BULK_LOGIN_DAYS_SQL, params, customer_filter, 'login', 'bulk_login_days')
+        feature_rows = _fetch_grouped(db, BULK_FEATURE_METRICS_SQL, params, customer_filter,
+                                      'feature', 'bulk_feature_metrics')
+        support_rows = _fetch_grouped(db, BULK_SUPPORT_METRICS_SQL, params, customer_filter,
+                                      'support', 'bulk_support_metrics')
+        payment_rows = _fetch_grouped(db, BULK_PAYMENT_METRICS_SQL, params, customer_filter,
+                                      'payment', 'bulk_payment_metrics')
+        api_rows = _fetch_grouped(db, BULK_API_METRICS_SQL, params, customer_filter, 'api', 'bulk_api_metrics')
+        growth_rows = _fetch_grouped(db, BULK_API_GROWTH_SQL, params, customer_filter, 'api', 'bulk_api_growth')
+
+        weights = get_health_weights()
+        # Customers without matching events get the same all-NULL row the per-customer
+        # aggregates return, so the scoring defaults apply identically.
+        results = {}
+        for customer_id in customer_ids:
+            login_data = login_frequency_from_metrics(login_rows.get(customer_id, (0,))[0], period_start, period_end)
+            feature_data = feature_adoption_from_metrics(*feature_rows.get(customer_id, (None,) * 3))
+            support_data = support_ticket_from_metrics(*support_rows.get(customer_id, (None,) * 6))
+            payment_data = payment_timeliness_from_metrics(*payment_rows.get(customer_id, (None,) * 8))
+            api_data = api_usage_from_metrics(*api_rows.get(customer_id, (None,) * 6),
+                                              growth_rows.get(customer_id, (None,))[0],
+                                              period_start=period_start, period_end=period_end)
+            results[customer_id] = build_health_score(login_data, feature_data, support_data,
+                                                      payment_data, api_data, weights)
+
+        return results
@@ -0,0 +1,209 @@
+"""
+Event Ingestion Service
+
+Validates and writes customer events in bulk. A batch costs one customer-id
+lookup, one COPY (or multi-row INSERT) and one commit regardless of its size,
+and every row that cannot be ingested is reported with its index instead of
+failing the batch.
+
+Side effects of new events (rollup deltas, queued invoice ledger, ticket state
+and daily sketch refreshes, snapshot dirty marks, cache invalidation) live
+here so the single-event and bulk paths stay in step.
+"""
+import csv
+import io
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from ..core.metrics import record_ingest
+from ..db.replicas import record_customer_writes
+from ..models import Event
+from .derived_state import queue_derived_state
+from .event_fields import EVENT_FIELDS, extract_event_fields
+from .rollups import add_events_to_rollups
+from .score_cache import invalidate_customer_scores
+from .score_snapshots import mark_scores_stale
+from .score_stream import schedule_score_updates
+
+EVENT_COLUMNS = ("id", "customer_id", "event_type", "ts", "event_metadata", *EVENT_FIELDS)
+
+
+def parse_event_timestamp(value: Optional[str]) -> datetime:
+    """Parse an ISO-8601 event timestamp (a trailing Z is accepted); None means now."""
+    if not value:
+        return datetime.now()
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def validate_event_row(row: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Normalize one raw event dict. Returns (event, None) or (None, error message)."""
+    if not isinstance(row, dict):
+        return None, "Event must be a JSON object"
+    customer_id = row.get("customer_id")
+    if not isinstance(customer_id, str) or not customer_id:
+        return None, "customer_id is required"
+    event_type = row.get("event_type")
+    if not isinstance(event_type, str) or not event_type:
+        return None, "event_type is required"
+    metadata = row.get("metadata", row.get("event_metadata"))
+    if metadata is not None and not isinstance(metadata, dict):
+        return None, "metadata must be a JSON object"
+    ts = row.get("ts")
+    if ts is not None and not isinstance(ts, str):
+        return None, "ts must be an ISO format string"
+    try:
+        timestamp = parse_event_timestamp(ts)
+    except ValueError:
+        return None, "Invalid timestamp format. Use ISO format."
+    return {
+        "id": str(uuid.uuid4()),
+        "customer_id": customer_id,
+        "event_type": event_type,
+        "ts": timestamp,
+        "event_metadata": metadata,
+        **extract_event_fields(metadata)
+    }, None
+
+
+def _copy_events(db: Session, events: List[Dict[str, Any]]) -> None:
+    """Stream events into the events table with COPY inside the session's transaction."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for event in events:
+        writer.writerow((
+            event["id"],
+            event["customer_id"],
+            event["event_type"],
+            event["ts"].isoformat(),
+            json.dumps(event["event_metadata"]) if event["event_metadata"] is not None else None,
+            *(event[column] for column in EVENT_FIELDS)
+        ))
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY events ({', '.join(EVENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_events(db: Session, events: List[Dict[str, Any]]) -> None:
+    """Multi-row INSERT fallback for drivers without COPY support."""
+    db.execute(insert(Event.__table__), events)
+
+
+def apply_event_side_effects(db: Session, events: Iterable[Any]) -> List[str]:
+    """
+    Bring derived state in line with newly written events (same transaction).
+
+    Rollups are updated in place; rows that are costly to recompute (invoice
+    ledger, ticket states, daily sketches) are queued and applied before the
+    customers are rescored. Accepts Event rows or event dicts. Returns the
+    affected customer ids so the caller can invalidate caches once the
+    transaction has committed.
+    """
+    events = list(events)
+    event_ids = []
+    customer_ids = set()
+    for event in events:
+        event_ids.append(event["id"] if isinstance(event, dict) else event.id)
+        customer_ids.add(event["customer_id"] if isinstance(event, dict) else event.customer_id)
+    add_events_to_rollups(db, event_ids)
+    queue_derived_state(db, events)
+    mark_scores_stale(db, customer_ids)
+    return sorted(customer_ids)
+
+
+def after_events_committed(db: Session, customer_ids: Iterable[str]) -> Optional[str]:
+    """
+    Post-commit side effects for customers that received new events: drop their
+    cached scores, pin their reads to the primary until replicas catch up and
+    queue them for rescoring so subscribers see the change.
+
+    Returns the commit's WAL position when replicas are configured, for the
+    response's write token (see replicas.set_write_lsn).
+    """
+    customer_ids = list(customer_ids)
+    for customer_id in customer_ids:
+        invalidate_customer_scores(customer_id)
+    write_lsn = record_customer_writes(db, customer_ids)
+    schedule_score_updates(customer_ids)
+    return write_lsn
+
+
+def ingest_events(db: Session, rows: List[Any], method: str = "copy",
+                  row_offset: int = 0, max_errors: int = 1000) -> Dict[str, Any]:
+    """
+    Validate, write and commit a batch of raw event dicts.
+
+    Args:
+        db: Database session
+        rows: Raw events ({customer_id, event_type, ts?, metadata?})
+        method: 'copy' (Postgres COPY) or 'insert' (multi-row INSERT)
+        row_offset: Added to reported row indexes (for chunked streams)
+        max_errors: Maximum number of per-row errors included in the response
+
+    Returns:
+        Dict with received/inserted/rejected counts, per-row errors and the
+        commit's write_lsn (None when nothing was written or no replica is configured)
+    """
+    started_at = time.perf_counter()
+    errors: List[Dict[str, Any]] = []
+    rejected = 0
+    valid: List[Tuple[int, Dict[str, Any]]] = []
+
+    def reject(index: int, message: str) -> None:
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < max_errors:
+            errors.append({"index": row_offset + index, "error": message})
+
+    for index, row in enumerate(rows):
+        event, error = validate_event_row(row)
+        if error:
+            reject(index, error)
+        else:
+            valid.append((index, event))
+
+    # One set lookup for every customer referenced by the batch
+    requested_ids = list({event["customer_id"] for _, event in valid})
+    known_ids = set()
+    if requested_ids:
+        known_ids = {row[0] for row in db.execute(
+            text("SELECT id FROM customers WHERE id = ANY(:customer_ids)"),
+            {"customer_ids": requested_ids}
+        ).fetchall()}
+
+    events = []
+    for index, event in valid:
+        if event["customer_id"] in known_ids:
+            events.append(event)
+        else:
+            reject(index, "Customer not found")
+
+    write_lsn = None
+    if events:
+        if method == "insert":
+            _insert_events(db, events)
+        else:
+            _copy_events(db, events)
+        customer_ids = apply_event_side_effects(db, events)
+        db.commit()
+        write_lsn = after_events_committed(db, customer_ids)
+    record_ingest(method, len(events), rejected, time.perf_counter() - started_at)
+
+    return {
+        "received": len(rows),
+        "inserted": len(events),
+        "rejected": rejected,
+        "errors": errors,
+        "write_lsn": write_lsn
+    }
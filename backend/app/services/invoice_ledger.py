@@ -0,0 +1,224 @@
+"""
+Invoice Ledger Service
+
+Maintains invoice_ledger, one row per (customer, invoice) holding the invoice
+amount and due date, its payment, failure count and payment status. Rows are
+recomputed from the customer's events for that invoice after an
+invoice_generated, payment_received or payment_failed event is ingested
+(queued by apply_event_side_effects, see services/derived_state.py), using the
+idx_events_invoice index, so the payment factor reads only the invoices issued in its window
+instead of re-joining the customer's whole payment history.
+
+An invoice issued more than once keeps its latest issue and an invoice paid
+more than once keeps its latest payment. Payment events without an invoice_id
+cannot be matched to an invoice and are ignored (as in the event joins).
+
+Engines that score from memory (rollup, vectorized, history) load the ledger
+with load_invoice_ledger and apply the PAYMENT_METRICS_SQL window rules with
+payment_metrics_from_ledger, so every engine scores invoices the same way.
+
+Events written without going through the API or loader (for example a raw
+COPY) can be folded in with:
+
+    python -m app.services.invoice_ledger --customer-id cust_001
+    python -m app.services.invoice_ledger --all
+"""
+import argparse
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+INVOICE_EVENT_TYPES = ('invoice_generated', 'payment_received', 'payment_failed')
+
+# Rebuilds the ledger row of every invoice in {keys} (customer_id, invoice_id) from its events
+REFRESH_LEDGER_SQL = """
+    INSERT INTO invoice_ledger (
+        customer_id, invoice_id, issued_at, amount_usd, due_date,
+        payment_date, days_early_late, failure_count, status, updated_at
+    )
+    SELECT
+        k.customer_id,
+        k.invoice_id,
+        inv.ts,
+        inv.amount_usd,
+        inv.due_date,
+        pay.payment_date,
+        pay.days_early_late,
+        fail.failure_count,
+        CASE
+            WHEN pay.payment_date IS NULL THEN 'unpaid'
+            WHEN pay.days_early_late <= 0 THEN 'on_time_or_early'
+            WHEN pay.days_early_late BETWEEN 1 AND 10 THEN 'late_acceptable'
+            WHEN pay.days_early_late > 10 THEN 'late_concerning'
+        END,
+        NOW()
+    FROM ({keys}) k
+    LEFT JOIN LATERAL (
+        SELECT ts, amount_usd, due_date
+        FROM events
+        WHERE customer_id = k.customer_id AND invoice_id = k.invoice_id AND event_type = 'invoice_generated'
+        ORDER BY ts DESC
+        LIMIT 1
+    ) inv ON true
+    LEFT JOIN LATERAL (
+        SELECT payment_date, days_early_late
+        FROM events
+        WHERE customer_id = k.customer_id AND invoice_id = k.invoice_id AND event_type = 'payment_received'
+        ORDER BY ts DESC
+        LIMIT 1
+    ) pay ON true
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) as failure_count
+        FROM events
+        WHERE customer_id = k.customer_id AND invoice_id = k.invoice_id AND event_type = 'payment_failed'
+    ) fail
+    ON CONFLICT (customer_id, invoice_id) DO UPDATE SET
+        issued_at = EXCLUDED.issued_at,
+        amount_usd = EXCLUDED.amount_usd,
+        due_date = EXCLUDED.due_date,
+        payment_date = EXCLUDED.payment_date,
+        days_early_late = EXCLUDED.days_early_late,
+        failure_count = EXCLUDED.failure_count,
+        status = EXCLUDED.status,
+        updated_at = EXCLUDED.updated_at
+"""
+
+TOUCHED_INVOICES = """
+    SELECT DISTINCT customer_id, invoice_id
+    FROM unnest(CAST(:customer_ids AS text[]), CAST(:invoice_ids AS text[])) AS t(customer_id, invoice_id)
+"""
+
+# One transaction-scoped advisory lock per invoice, taken in the order the keys are passed
+# (sorted by the caller) so concurrent ingests cannot deadlock on each other
+LOCK_INVOICES_SQL = """
+    SELECT pg_advisory_xact_lock(hashtext('invoice_ledger:' || customer_id || ':' || invoice_id))
+    FROM (
+        SELECT customer_id, invoice_id
+        FROM unnest(CAST(:customer_ids AS text[]), CAST(:invoice_ids AS text[]))
+             WITH ORDINALITY AS t(customer_id, invoice_id, position)
+        ORDER BY position
+    ) touched
+"""
+
+CUSTOMER_INVOICES = """
+    SELECT DISTINCT customer_id, invoice_id
+    FROM events
+    WHERE event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+      AND invoice_id IS NOT NULL
+      {customer_filter}
+"""
+
+
+# Issue time as epoch microseconds, so windows resolved by Postgres compare exactly
+LOAD_LEDGER_SQL = """
+    SELECT
+        customer_id,
+        (EXTRACT(EPOCH FROM issued_at) * 1000000)::bigint as issued_us,
+        amount_usd,
+        days_early_late,
+        failure_count,
+        status
+    FROM invoice_ledger
+    WHERE issued_at >= :since
+      AND issued_at <= :until
+      {customer_filter}
+"""
+
+
+def invoice_keys(events: Iterable[Any]) -> Set[Tuple[str, str]]:
+    """(customer_id, invoice_id) of the invoice events among Event rows or event dicts."""
+    keys = set()
+    for event in events:
+        if isinstance(event, dict):
+            event_type, invoice_id = event["event_type"], event.get("invoice_id")
+            customer_id = event["customer_id"]
+        else:
+            event_type, invoice_id, customer_id = event.event_type, event.invoice_id, event.customer_id
+        if event_type in INVOICE_EVENT_TYPES and invoice_id is not None:
+            keys.add((customer_id, invoice_id))
+    return keys
+
+
+def refresh_invoice_ledger(db: Session, keys: Iterable[Tuple[str, str]]) -> None:
+    """
+    Recompute the ledger rows for the given (customer_id, invoice_id) pairs from events.
+
+    Refreshing an invoice is idempotent. Each invoice is locked until commit before it
+    is recomputed, so a concurrent refresh of the same invoice waits and then recomputes
+    with this transaction's writes visible (otherwise the later upsert could overwrite
+    the row with an older view of its events).
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    params = {
+        'customer_ids': [customer_id for customer_id, _ in keys],
+        'invoice_ids': [invoice_id for _, invoice_id in keys]
+    }
+    db.execute(text(LOCK_INVOICES_SQL), params)
+    db.execute(text(REFRESH_LEDGER_SQL.format(keys=TOUCHED_INVOICES)), params)
+
+
+def load_invoice_ledger(db: Session, customer_ids: Optional[List[str]], since: datetime,
+                        until: datetime) -> List[Any]:
+    """Ledger rows of the given customers (all if None) for invoices issued between since and until."""
+    customer_filter = "AND customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    return db.execute(text(LOAD_LEDGER_SQL.format(customer_filter=customer_filter)), {
+        'since': since,
+        'until': until,
+        'customer_ids': customer_ids
+    }).fetchall()
+
+
+def payment_metrics_from_ledger(invoices: Iterable[Any], start_us: int, end_us: int) -> tuple:
+    """
+    PAYMENT_METRICS_SQL over one customer's load_invoice_ledger rows, for the window
+    [start_us, end_us] in epoch microseconds. Column order matches payment_timeliness_from_metrics.
+    """
+    invoices = [invoice for invoice in invoices if start_us <= invoice.issued_us <= end_us]
+    if not invoices:
+        return 0, 0, 0, 0, 0, None, None, None
+    statuses = [invoice.status for invoice in invoices]
+    delays = [invoice.days_early_late for invoice in invoices if invoice.days_early_late is not None]
+    # SUM skips NULL amounts and is NULL when every amount is
+    amounts = [invoice.amount_usd if invoice.status == 'unpaid' else 0.0 for invoice in invoices]
+    amounts = [amount for amount in amounts if amount is not None]
+    return (
+        len(invoices),
+        statuses.count('unpaid'),
+        statuses.count('on_time_or_early'),
+        statuses.count('late_acceptable'),
+        statuses.count('late_concerning'),
+        sum(invoice.failure_count for invoice in invoices),
+        sum(delays) / len(delays) if delays else None,
+        sum(amounts) if amounts else None,
+    )
+
+
+def rebuild_invoice_ledger(db: Session, customer_ids: Optional[List[str]] = None) -> None:
+    """Rebuild every ledger row of the given customers (all customers if None), e.g. after a bulk load."""
+    customer_filter = "AND customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    params = {'customer_ids': customer_ids}
+    db.execute(text(f"DELETE FROM invoice_ledger WHERE true {customer_filter}"), params)
+    keys = CUSTOMER_INVOICES.format(customer_filter=customer_filter)
+    db.execute(text(REFRESH_LEDGER_SQL.format(keys=keys)), params)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild invoice_ledger from raw events")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--customer-id", action="append", help="Customer to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="Rebuild every customer")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        rebuild_invoice_ledger(db, None if args.all else args.customer_id)
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,195 @@
+"""
+What-if Re-weighting
+
+Factor scores do not depend on the weights, so a change of weights or label
+thresholds only needs the five factor scores each snapshot stores
+(health_scores.<factor>_score), not a scoring pass over events. The snapshot
+factor scores are loaded into an N x 5 matrix, kept per process for
+REWEIGHT_MATRIX_TTL_SECONDS, and every customer is re-scored with one
+matrix-vector product and re-labelled with two comparisons.
+
+Scores are rounded and labelled exactly as build_health_score does, so the
+configured weights and thresholds reproduce the stored snapshot scores.
+Customers without a scored snapshot are left out and counted as unscored.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .health_scoring import HEALTH_FACTORS, get_health_weights, get_label_thresholds
+
+LABELS = ("Unhealthy", "At Risk", "Healthy")
+
+LOAD_FACTORS_SQL = text(f"""
+    SELECT c.id, c.segment, hs.label, {', '.join(f'hs.{factor}_score' for factor in HEALTH_FACTORS)}
+    FROM customers c
+    LEFT JOIN health_scores hs ON hs.customer_id = c.id
+    ORDER BY c.id
+""")
+
+
+def get_matrix_ttl_seconds() -> float:
+    return float(os.getenv('REWEIGHT_MATRIX_TTL_SECONDS', '60'))
+
+
+class FactorMatrix:
+    """Factor scores of every scored customer, one row per customer in HEALTH_FACTORS column order."""
+
+    def __init__(self, customer_ids: List[str], segments: List[str], labels: List[Optional[str]],
+                 factors: np.ndarray, unscored: int):
+        self.customer_ids = np.array(customer_ids, dtype=object)
+        self.segments = np.array(segments, dtype=object)
+        self.labels = np.array(labels, dtype=object)
+        self.factors = factors
+        self.unscored = unscored
+        self.loaded_at = datetime.now(timezone.utc)
+
+    @classmethod
+    def load(cls, db: Session) -> "FactorMatrix":
+        customer_ids, segments, labels, vectors = [], [], [], []
+        unscored = 0
+        for customer_id, segment, label, *factor_scores in db.execute(LOAD_FACTORS_SQL):
+            if any(score is None for score in factor_scores):
+                unscored += 1
+                continue
+            customer_ids.append(customer_id)
+            segments.append(segment or 'unknown')
+            labels.append(label)
+            vectors.append(factor_scores)
+        factors = np.array(vectors, dtype=np.float64).reshape(len(vectors), len(HEALTH_FACTORS))
+        return cls(customer_ids, segments, labels, factors, unscored)
+
+
+class FactorMatrixCache:
+    """Keeps the last FactorMatrix for ttl seconds; concurrent misses load it once."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else get_matrix_ttl_seconds()
+        self._matrix: Optional[FactorMatrix] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> FactorMatrix:
+        with self._lock:
+            if self._matrix is None or time.monotonic() >= self._expires_at:
+                self._matrix = FactorMatrix.load(db)
+                self._expires_at = time.monotonic() + self.ttl_seconds
+            return self._matrix
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._matrix = None
+
+
+factor_matrix_cache = FactorMatrixCache()
+
+
+def resolve_weights(weights: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """Configured weights overridden by the given ones. Raises ValueError on unknown factors or bad values."""
+    resolved = get_health_weights()
+    for factor, weight in (weights or {}).items():
+        if factor not in resolved:
+            raise ValueError(f"Unknown factor '{factor}'. Use one of: {', '.join(HEALTH_FACTORS)}")
+        if weight is None or weight < 0:
+            raise ValueError(f"Weight for '{factor}' must be a non-negative number")
+        resolved[factor] = float(weight)
+    if sum(resolved.values()) <= 0:
+        raise ValueError("At least one weight must be positive")
+    return resolved
+
+
+def resolve_thresholds(thresholds: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """Configured label thresholds overridden by the given ones. Raises ValueError if they are inconsistent."""
+    resolved = get_label_thresholds()
+    for name, value in (thresholds or {}).items():
+        if name not in resolved:
+            raise ValueError(f"Unknown threshold '{name}'. Use 'healthy' or 'at_risk'")
+        resolved[name] = float(value)
+    if not 0 <= resolved['at_risk'] <= resolved['healthy'] <= 100:
+        raise ValueError("Thresholds must satisfy 0 <= at_risk <= healthy <= 100")
+    return resolved
+
+
+def _label_counts(labels: np.ndarray) -> Dict[str, int]:
+    return {label: int(np.count_nonzero(labels == label)) for label in reversed(LABELS)}
+
+
+def reweight_scores(matrix: FactorMatrix, weights: Dict[str, float], thresholds: Dict[str, float],
+                    segment: Optional[str] = None, changed_limit: int = 50) -> Dict[str, Any]:
+    """
+    Score and label every customer in the matrix with the given weights and thresholds.
+
+    Returns label counts and the average overall and per segment, how many
+    customers move between labels compared with their stored snapshot, and the
+    changed_limit customers whose label changed with the largest score moves.
+    """
+    rows = slice(None) if segment is None else matrix.segments == segment
+    factors = matrix.factors[rows]
+    weight_vector = np.array([weights[factor] for factor in HEALTH_FACTORS])
+    weighted = factors @ weight_vector
+    scores = np.round(weighted, 1)
+    # Labelled before rounding, like build_health_score
+    label_codes = (weighted >= thresholds['at_risk']).astype(np.int8) + (weighted >= thresholds['healthy'])
+    labels = np.array(LABELS, dtype=object)[label_codes]
+    segments = matrix.segments[rows]
+    previous_labels = matrix.labels[rows]
+    customer_ids = matrix.customer_ids[rows]
+
+    changed = np.flatnonzero(labels != previous_labels)
+    transitions: Dict[str, int] = {}
+    for before, after in zip(previous_labels[changed], labels[changed]):
+        key = f"{before} -> {after}"
+        transitions[key] = transitions.get(key, 0) + 1
+
+    baseline = np.round(factors @ np.array([get_health_weights()[factor] for factor in HEALTH_FACTORS]), 1)
+    moves = scores - baseline
+    shown = changed[np.argsort(-np.abs(moves[changed]), kind='stable')[:changed_limit]]
+
+    by_segment = {}
+    for name in sorted(set(segments)):
+        in_segment = segments == name
+        by_segment[name] = {
+            'customers': int(np.count_nonzero(in_segment)),
+            'average_score': round(float(scores[in_segment].mean()), 1),
+            'labels': _label_counts(labels[in_segment])
+        }
+
+    return {
+        'weights': weights,
+        'thresholds': thresholds,
+        'customers': int(len(scores)),
+        'unscored_customers': matrix.unscored if segment is None else None,
+        'average_score': round(float(scores.mean()), 1) if len(scores) else None,
+        'labels': _label_counts(labels),
+        'segments': by_segment,
+        'label_changes': int(len(changed)),
+        'transitions': dict(sorted(transitions.items())),
+        'changed_customers': [
+            {
+                'customer_id': customer_ids[i],
+                'segment': segments[i],
+                'score': float(scores[i]),
+                'label': labels[i],
+                'baseline_score': float(baseline[i]),
+                'previous_label': previous_labels[i]
+            }
+            for i in shown
+        ],
+        'snapshot_loaded_at': matrix.loaded_at.isoformat()
+    }
+
+
+def reweight_customers(db: Session, weights: Optional[Dict[str, float]] = None,
+                       thresholds: Optional[Dict[str, float]] = None, segment: Optional[str] = None,
+                       changed_limit: int = 50) -> Dict[str, Any]:
+    """What-if scores for the whole customer base from the cached factor matrix (see reweight_scores)."""
+    resolved_weights = resolve_weights(weights)
+    resolved_thresholds = resolve_thresholds(thresholds)
+    matrix = factor_matrix_cache.get(db)
+    return reweight_scores(matrix, resolved_weights, resolved_thresholds, segment, changed_limit)
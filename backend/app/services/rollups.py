@@ -0,0 +1,384 @@
+"""
+Daily Rollup Service
+
+Maintains customer_daily_rollups, a per customer x day x event_type aggregate of
+the raw events table, and scores customers from it. Rollup scoring reads
+O(days x customers) rows instead of every raw event, which matters because
+api_call events dominate the events table.
+
+Rollups are day-granular: the scoring window covers whole days from
+period_start.date() to period_end.date(), and the API growth look-back covers the
+whole days before that. Events missing the id key a factor joins on
+(feature_name, endpoint) are counted but not keyed. Support and payment are
+not day-granular: they read ticket_states and invoice_ledger with the exact
+window bounds, applying the same rules as the events engine.
+"""
+import argparse
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .health_scoring import (
+    api_usage_from_metrics,
+    build_health_score,
+    feature_adoption_from_metrics,
+    get_health_weights,
+    get_period_dates,
+    login_frequency_from_metrics,
+    payment_timeliness_from_metrics,
+    support_ticket_from_metrics,
+    to_epoch_us,
+)
+from .invoice_ledger import INVOICE_EVENT_TYPES, load_invoice_ledger, payment_metrics_from_ledger
+from .ticket_states import TICKET_EVENT_TYPES, load_ticket_states, support_metrics_from_states
+
+
+# Aggregates every event in {scope} into rows for its (customer, day, event_type) bucket.
+# The per-row CASE expressions mirror the filters used by the calc_* queries.
+ROLLUP_ROWS_SQL = """
+    WITH bucket_events AS (
+        SELECT
+            e.customer_id,
+            DATE(e.ts) as day,
+            e.event_type,
+            CASE
+                WHEN e.event_type = 'feature_used' THEN e.feature_name
+                WHEN e.event_type = 'feature_onboarded'
+                  AND e.completion_percentage = 100
+                THEN e.feature_name
+                WHEN e.event_type = 'api_call' THEN e.endpoint
+                WHEN e.event_type IN ('support_ticket_created', 'support_ticket_resolved')
+                THEN e.ticket_id
+                WHEN e.event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+                THEN e.invoice_id
+            END as rollup_key,
+            CASE
+                WHEN e.event_type = 'api_call'
+                THEN e.response_code BETWEEN 200 AND 299
+                WHEN e.event_type = 'feature_onboarded'
+                THEN e.completion_percentage = 100
+                WHEN e.event_type = 'support_ticket_resolved'
+                THEN e.resolution_type = 'escalated'
+                WHEN e.event_type = 'support_ticket_created'
+                THEN e.priority IN ('high', 'critical')
+                ELSE false
+            END as is_match,
+            CASE
+                WHEN e.event_type = 'api_call'
+                THEN e.response_time_ms::float
+                WHEN e.event_type = 'support_ticket_resolved'
+                THEN e.satisfaction_score
+            END as value,
+            CASE
+                WHEN e.event_type = 'invoice_generated'
+                THEN to_jsonb(e.amount_usd)
+                WHEN e.event_type = 'payment_received'
+                THEN jsonb_build_array(
+                    e.payment_date,
+                    e.days_early_late
+                )
+            END as key_value
+        FROM events e
+        {scope}
+    ),
+    keyed AS (
+        SELECT
+            customer_id,
+            day,
+            event_type,
+            rollup_key,
+            COUNT(*) as n,
+            COUNT(*) FILTER (WHERE is_match) as matches,
+            SUM(value) as value_sum,
+            COUNT(value) as value_count,
+            jsonb_agg(key_value) FILTER (WHERE key_value IS NOT NULL) as vals
+        FROM bucket_events
+        GROUP BY customer_id, day, event_type, rollup_key
+    )
+    INSERT INTO customer_daily_rollups AS r (
+        customer_id, day, event_type, event_count, match_count,
+        value_sum, value_count, key_counts, key_values
+    )
+    SELECT
+        customer_id,
+        day,
+        event_type,
+        SUM(n),
+        SUM(matches),
+        SUM(value_sum),
+        SUM(value_count),
+        COALESCE(jsonb_object_agg(rollup_key, n) FILTER (WHERE rollup_key IS NOT NULL), '{{}}'::jsonb),
+        COALESCE(jsonb_object_agg(rollup_key, vals) FILTER (WHERE rollup_key IS NOT NULL AND vals IS NOT NULL), '{{}}'::jsonb)
+    FROM keyed
+    GROUP BY customer_id, day, event_type
+    -- Upsert in key order, so concurrent ingests lock shared buckets in the same order
+    ORDER BY customer_id, day, event_type
+"""
+
+# Replaces the buckets with the aggregate of {scope}, which must cover all of their events
+REFRESH_ROLLUPS_SQL = ROLLUP_ROWS_SQL + """
+    ON CONFLICT (customer_id, day, event_type) DO UPDATE SET
+        event_count = EXCLUDED.event_count,
+        match_count = EXCLUDED.match_count,
+        value_sum = EXCLUDED.value_sum,
+        value_count = EXCLUDED.value_count,
+        key_counts = EXCLUDED.key_counts,
+        key_values = EXCLUDED.key_values
+"""
+
+# Adds the aggregate of {scope}, events not yet counted, to the buckets. Every
+# column is additive: counts and sums add up, key_counts add up per key and
+# key_values concatenate per key.
+ADD_ROLLUPS_SQL = ROLLUP_ROWS_SQL + """
+    ON CONFLICT (customer_id, day, event_type) DO UPDATE SET
+        event_count = r.event_count + EXCLUDED.event_count,
+        match_count = r.match_count + EXCLUDED.match_count,
+        value_sum = COALESCE(r.value_sum + EXCLUDED.value_sum, r.value_sum, EXCLUDED.value_sum),
+        value_count = r.value_count + EXCLUDED.value_count,
+        key_counts = (
+            SELECT COALESCE(jsonb_object_agg(
+                k, COALESCE((r.key_counts ->> k)::bigint, 0) + COALESCE((EXCLUDED.key_counts ->> k)::bigint, 0)
+            ), '{{}}'::jsonb)
+            FROM jsonb_object_keys(r.key_counts || EXCLUDED.key_counts) k
+        ),
+        key_values = (
+            SELECT COALESCE(jsonb_object_agg(
+                k, COALESCE(r.key_values -> k, '[]'::jsonb) || COALESCE(EXCLUDED.key_values -> k, '[]'::jsonb)
+            ), '{{}}'::jsonb)
+            FROM jsonb_object_keys(r.key_values || EXCLUDED.key_values) k
+        )
+"""
+
+NEW_EVENTS_SCOPE = "WHERE e.id = ANY(CAST(:event_ids AS text[]))"
+
+# Events of given (customer_id, day) buckets, days in the session time zone as DATE(ts)
+# computes them (segment_analytics rebuilds sketch days with these)
+TOUCHED_BUCKETS = """
+    SELECT DISTINCT customer_id, day
+    FROM unnest(CAST(:customer_ids AS text[]), CAST(:days AS date[])) AS t(customer_id, day)
+"""
+
+TOUCHED_SCOPE = """
+    JOIN ({touched}) touched
+      ON e.customer_id = touched.customer_id
+     AND e.ts >= touched.day
+     AND e.ts < touched.day + 1
+""".format(touched=TOUCHED_BUCKETS)
+
+def add_events_to_rollups(db: Session, event_ids: Iterable[Any]) -> None:
+    """
+    Count newly inserted events into their rollup buckets.
+
+    Called in the same transaction as the event insert so the rollup never lags the
+    events table. Only the new events are read, so the cost does not grow with the
+    size of the buckets; each event must be added exactly once.
+    """
+    event_ids = [str(event_id) for event_id in event_ids]
+    if not event_ids:
+        return
+    db.execute(text(ADD_ROLLUPS_SQL.format(scope=NEW_EVENTS_SCOPE)), {'event_ids': event_ids})
+
+
+def refresh_rollups_for_range(db: Session, start_day: date, end_day: date,
+                              customer_ids: Optional[List[str]] = None) -> None:
+    """Rebuild every bucket between start_day and end_day (inclusive), e.g. after a bulk load."""
+    customer_filter = "AND customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    event_filter = "AND e.customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    params = {
+        'start_day': start_day,
+        'end_day': end_day,
+        'end_exclusive': end_day + timedelta(days=1),
+        'customer_ids': customer_ids
+    }
+    db.execute(text(f"""
+        DELETE FROM customer_daily_rollups
+        WHERE day >= :start_day AND day <= :end_day
+          {customer_filter}
+    """), params)
+    scope = f"""
+        WHERE e.ts >= :start_day AND e.ts < :end_exclusive
+          {event_filter}
+    """
+    db.execute(text(REFRESH_ROLLUPS_SQL.format(scope=scope)), params)
+
+
+# ROLLUP SCORING
+# Support and payment are scored from ticket_states and invoice_ledger, not from
+# these rollup rows, so their rules stay identical to the events engine
+STATE_EVENT_TYPES_SQL = ", ".join(f"'{event_type}'" for event_type in TICKET_EVENT_TYPES + INVOICE_EVENT_TYPES)
+
+
+def _shift(counter: Counter, key_counts: Dict[str, int], sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) per-key counts, dropping keys that reach zero."""
+    for key, n in key_counts.items():
+        counter[key] += sign * n
+        if counter[key] <= 0:
+            del counter[key]
+
+
+class RollupWindow:
+    """
+    Factor accumulators for one customer over a set of rollup days.
+
+    Days can be removed as well as added, so a window can slide one day at a time.
+    Distinct-key factors (features, endpoints) keep per-key counts, so a
+    key only disappears when the last day that saw it leaves the window.
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.value_sums: Counter = Counter()
+        self.login_days = 0
+        self.api_days: Counter = Counter()
+        self.onboarded: Counter = Counter()
+        self.used: Counter = Counter()
+        self.endpoints: Counter = Counter()
+        self.previous_calls = 0
+
+    def apply(self, day: date, event_type: str, event_count: int, match_count: int,
+              value_sum: Optional[float], value_count: int, key_counts: Dict[str, int],
+              key_values: Dict[str, List[Any]], sign: int = 1) -> None:
+        """Add (or remove) one customer_daily_rollups row inside the scoring window."""
+        self.counts[event_type] += sign * event_count
+        self.counts[event_type + ':match'] += sign * match_count
+        if value_count:
+            self.value_sums[event_type] += sign * value_sum
+            self.value_sums[event_type + ':count'] += sign * value_count
+        if event_type == 'user_login':
+            self.login_days += sign
+        elif event_type == 'feature_onboarded':
+            _shift(self.onboarded, key_counts, sign)
+        elif event_type == 'feature_used':
+            _shift(self.used, key_counts, sign)
+        elif event_type in ('api_call', 'api_rate_limit_exceeded'):
+            _shift(self.api_days, {day: 1}, sign)
+            if event_type == 'api_call':
+                _shift(self.endpoints, key_counts, sign)
+
+    def apply_previous(self, event_type: str, event_count: int, sign: int = 1) -> None:
+        """Add (or remove) a rollup row from the API growth look-back period."""
+        if event_type == 'api_call':
+            self.previous_calls += sign * event_count
+
+    def score(self, period_start: datetime, period_end: datetime, support_metrics: tuple,
+              payment_metrics: tuple, weights: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Score the current window; same structure as calculate_customer_health_score.
+
+        support_metrics and payment_metrics come from support_metrics_from_states and
+        payment_metrics_from_ledger for the same window.
+        """
+        c = self.counts
+        v = self.value_sums
+
+        login_data = login_frequency_from_metrics(self.login_days, period_start, period_end)
+        feature_data = feature_adoption_from_metrics(len(self.onboarded), len(self.used), c['feature_used'])
+
+        support_data = support_ticket_from_metrics(*support_metrics)
+        payment_data = payment_timeliness_from_metrics(*payment_metrics)
+
+        total_api_calls = c['api_call']
+        response_count = v['api_call:count']
+        api_data = api_usage_from_metrics(
+            total_api_calls,
+            c['api_rate_limit_exceeded'],
+            len(self.api_days),
+            c['api_call:match'] / total_api_calls * 100 if total_api_calls else None,
+            v['api_call'] / response_count if response_count else None,
+            len(self.endpoints),
+            self.previous_calls,
+            period_start=period_start, period_end=period_end
+        )
+
+        return build_health_score(login_data, feature_data, support_data, payment_data, api_data, weights)
+
+
+def load_customer_states(db: Session, customer_ids: List[str], since: datetime, until: datetime
+                         ) -> Tuple[Dict[str, List[Any]], Dict[str, List[Any]]]:
+    """Ticket states and invoice ledger rows per customer for windows between since and until."""
+    tickets: Dict[str, List[Any]] = defaultdict(list)
+    for state in load_ticket_states(db, customer_ids, since):
+        tickets[state.customer_id].append(state)
+    invoices: Dict[str, List[Any]] = defaultdict(list)
+    for invoice in load_invoice_ledger(db, customer_ids, since, until):
+        invoices[invoice.customer_id].append(invoice)
+    return tickets, invoices
+
+
+def calculate_rollup_health_scores(db: Session, customer_ids: Optional[List[str]] = None,
+                                   period_start: Optional[datetime] = None,
+                                   period_end: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Calculate health scores from customer_daily_rollups only.
+
+    Returns the same structure as calculate_bulk_health_scores.
+    """
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+
+    if customer_ids is None:
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers")).fetchall()]
+        customer_filter = ""
+    else:
+        customer_ids = list(customer_ids)
+        customer_filter = "AND customer_id = ANY(:customer_ids)"
+    if not customer_ids:
+        return {}
+
+    start_day = period_start.date()
+    end_day = period_end.date()
+    previous_start_day = (period_start - (period_end - period_start)).date()
+    params = {
+        'previous_start_day': previous_start_day,
+        'end_day': end_day,
+        'customer_ids': customer_ids
+    }
+
+    window_rows = db.execute(text(f"""
+        SELECT customer_id, day, event_type, event_count, match_count,
+               value_sum, value_count, key_counts, key_values
+        FROM customer_daily_rollups
+        WHERE day >= :previous_start_day
+          AND day <= :end_day
+          AND event_type NOT IN ({STATE_EVENT_TYPES_SQL})
+          {customer_filter}
+    """), params).fetchall()
+    tickets, invoices = load_customer_states(db, customer_ids, period_start, period_end)
+    start_us, end_us = to_epoch_us(db, [period_start, period_end])
+
+    windows: Dict[str, RollupWindow] = defaultdict(RollupWindow)
+    for customer_id, day, event_type, *values in window_rows:
+        if day < start_day:
+            windows[customer_id].apply_previous(event_type, values[0])
+        else:
+            windows[customer_id].apply(day, event_type, *values)
+
+    weights = get_health_weights()
+    return {
+        customer_id: windows[customer_id].score(
+            period_start, period_end,
+            support_metrics_from_states(tickets[customer_id], start_us, end_us),
+            payment_metrics_from_ledger(invoices[customer_id], start_us, end_us),
+            weights
+        )
+        for customer_id in customer_ids
+    }
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild customer_daily_rollups from raw events")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        refresh_rollups_for_range(db, args.start, args.end)
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,312 @@
+"""
+Health Score Cache
+
+Bounded cache in front of calculate_customer_health_score, keyed by
+(customer_id, period window, weights, scoring source). It serves repeated
+fresh=true polls of /api/customers/{id}/health (see
+score_snapshots.refresh_customer_score). Entries expire after a TTL and are
+invalidated as soon as an event is written for the customer.
+
+Each customer has a generation that invalidation bumps. A computation reads the
+generation before it queries and passes it to set(), which drops the write if
+the customer was invalidated in between, so a score computed from pre-event
+data is never cached after the event's invalidation.
+
+The backend is pluggable: LocalScoreCache keeps entries in-process (one cache
+per uvicorn worker), RedisScoreCache shares them across workers. Select with
+HEALTH_CACHE_BACKEND=local|redis or call set_score_cache(). LocalScoreCache
+invalidation is per process too: an event ingested by one worker does not
+reach the others' caches, which keep serving that customer's entries until the
+TTL expires. Deployments with more than one worker that need event-accurate
+cached scores should use the redis backend.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models import Customer
+from .async_health_scoring import calculate_customer_health_score_async
+from .health_scoring import (
+    calculate_customer_health_score,
+    get_health_weights,
+    get_period_dates,
+    get_score_source,
+)
+
+CacheKey = Tuple[str, str, str, Tuple[Tuple[str, float], ...], str]
+
+
+def make_cache_key(customer_id: str, period_start: datetime, period_end: datetime,
+                   weights: Dict[str, float], source: str) -> CacheKey:
+    return (customer_id, period_start.isoformat(), period_end.isoformat(), tuple(sorted(weights.items())), source)
+
+
+class ScoreCache:
+    """Interface every cache backend implements."""
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def generation(self, customer_id: str) -> int:
+        """Current invalidation generation of the customer; read it before computing a value to set."""
+        raise NotImplementedError
+
+    def set(self, key: CacheKey, value: Dict[str, Any], generation: Optional[int] = None) -> None:
+        """Store value, unless generation is given and the customer has been invalidated since."""
+        raise NotImplementedError
+
+    def invalidate_customer(self, customer_id: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class LocalScoreCache(ScoreCache):
+    """
+    Thread-safe in-process LRU cache with per-entry TTL.
+
+    Invalidation only reaches this process' entries; see the module docstring.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._keys_by_customer: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_customer.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_customer[key[0]]
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def generation(self, customer_id: str) -> int:
+        with self._lock:
+            return self._generations.get(customer_id, 0)
+
+    def set(self, key: CacheKey, value: Dict[str, Any], generation: Optional[int] = None) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key[0], 0):
+                self.stale_writes += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._keys_by_customer.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_customer(self, customer_id: str) -> None:
+        with self._lock:
+            for key in list(self._keys_by_customer.get(customer_id, ())):
+                self._remove(key)
+            self._generations[customer_id] = self._generations.get(customer_id, 0) + 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_customer.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'local',
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_writes': self.stale_writes
+            }
+
+
+class RedisScoreCache(ScoreCache):
+    """
+    Redis-backed cache shared by all uvicorn workers.
+
+    Each customer has a version counter that is part of every entry key, so
+    invalidating a customer is a single INCR; old entries age out via TTL and
+    Redis' own maxmemory LRU policy. The version doubles as the generation: a
+    value set with an older one lands under a key nobody reads any more.
+    """
+
+    def __init__(self, url: str, ttl: float = 300.0, prefix: str = "health"):
+        import redis  # optional dependency, only needed for the shared backend
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def generation(self, customer_id: str) -> int:
+        return int(self._redis.get(f"{self.prefix}:version:{customer_id}") or 0)
+
+    def _entry_key(self, key: CacheKey, generation: Optional[int] = None) -> str:
+        customer_id = key[0]
+        if generation is None:
+            generation = self.generation(customer_id)
+        return f"{self.prefix}:entry:{customer_id}:{generation}:{json.dumps(key[1:])}"
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        raw = self._redis.get(self._entry_key(key))
+        self._redis.incr(f"{self.prefix}:stats:{'hits' if raw is not None else 'misses'}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: CacheKey, value: Dict[str, Any], generation: Optional[int] = None) -> None:
+        self._redis.set(self._entry_key(key, generation), json.dumps(value, default=str),
+                        px=int(self.ttl * 1000))
+
+    def invalidate_customer(self, customer_id: str) -> None:
+        self._redis.incr(f"{self.prefix}:version:{customer_id}")
+        self._redis.incr(f"{self.prefix}:stats:invalidations")
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(f"{self.prefix}:*"):
+            self._redis.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses, invalidations = (
+            int(self._redis.get(f"{self.prefix}:stats:{name}") or 0)
+            for name in ('hits', 'misses', 'invalidations')
+        )
+        lookups = hits + misses
+        return {
+            'backend': 'redis',
+            'ttl_seconds': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+            'invalidations': invalidations
+        }
+
+
+_score_cache: Optional[ScoreCache] = None
+_score_cache_lock = threading.Lock()
+
+
+def _build_score_cache() -> ScoreCache:
+    ttl = float(os.getenv('HEALTH_CACHE_TTL_SECONDS', '300'))
+    if os.getenv('HEALTH_CACHE_BACKEND', 'local') == 'redis':
+        return RedisScoreCache(os.getenv('HEALTH_CACHE_REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    return LocalScoreCache(maxsize=int(os.getenv('HEALTH_CACHE_MAXSIZE', '10000')), ttl=ttl)
+
+
+def get_score_cache() -> ScoreCache:
+    """Return the process-wide cache, building it from the environment on first use."""
+    global _score_cache
+    if _score_cache is None:
+        with _score_cache_lock:
+            if _score_cache is None:
+                _score_cache = _build_score_cache()
+    return _score_cache
+
+
+def set_score_cache(cache: ScoreCache) -> None:
+    """Swap the cache backend (e.g. a shared or stand-in backend)."""
+    global _score_cache
+    _score_cache = cache
+
+
+def cached_customer_health_score(db: Session, customer: Customer,
+                                 period_start: Optional[datetime] = None,
+                                 period_end: Optional[datetime] = None,
+                                 source: Optional[str] = None,
+                                 fresh: bool = False) -> Dict[str, Any]:
+    """
+    calculate_customer_health_score with a read-through cache.
+
+    fresh=True skips the lookup and always recomputes; the result still
+    replaces the cached entry.
+    """
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    source = source or get_score_source()
+    cache = get_score_cache()
+    key = make_cache_key(customer.id, period_start, period_end, get_health_weights(), source)
+    health_data = None if fresh else cache.get(key)
+    if health_data is None:
+        generation = cache.generation(customer.id)
+        health_data = calculate_customer_health_score(db, customer, period_start, period_end, source=source)
+        cache.set(key, health_data, generation)
+    return health_data
+
+
+async def cached_customer_health_score_async(db: AsyncSession, customer_id: str,
+                                             period_start: Optional[datetime] = None,
+                                             period_end: Optional[datetime] = None,
+                                             source: Optional[str] = None,
+                                             fresh: bool = False) -> Dict[str, Any]:
+    """calculate_customer_health_score_async with a read-through cache (fresh=True skips the lookup)."""
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    source = source or get_score_source()
+    cache = get_score_cache()
+    key = make_cache_key(customer_id, period_start, period_end, get_health_weights(), source)
+    health_data = None if fresh else cache.get(key)
+    if health_data is None:
+        generation = cache.generation(customer_id)
+        health_data = await calculate_customer_health_score_async(db, customer_id, period_start, period_end,
+                                                                  source=source)
+        cache.set(key, health_data, generation)
+    return health_data
+
+
+def get_cached_customer_health_score(customer_id: str,
+                                     period_start: Optional[datetime] = None,
+                                     period_end: Optional[datetime] = None,
+                                     source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Cached breakdown of the customer for the period, or None on a miss (nothing is computed)."""
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    key = make_cache_key(customer_id, period_start, period_end, get_health_weights(), source or get_score_source())
+    return get_score_cache().get(key)
+
+
+def invalidate_customer_scores(customer_id: str) -> None:
+    """Drop every cached breakdown for the customer (call after writing its events)."""
+    get_score_cache().invalidate_customer(customer_id)
@@ -0,0 +1,262 @@
+"""
+Score Export Service
+
+Streams every customer's health score with its full factor breakdown as CSV,
+NDJSON or Parquet. Customers are read in id order, CHUNK_SIZE at a time
+(keyset pagination), and each chunk is scored with calculate_bulk_health_scores,
+so an export costs six grouped queries per chunk instead of six queries per
+customer, memory stays at one chunk whatever the customer count, and the first
+rows are sent as soon as the first chunk is scored (the CSV header right away).
+
+Scores are computed live for the scoring window, exactly as
+/api/customers/{id}/health would return them. The label filter applies to those
+live labels. CSV and Parquet have one column per breakdown field
+({factor}_{field}); NDJSON keeps the nested breakdown. Parquet needs pyarrow
+and writes one row group per chunk.
+
+    python -m app.services.score_export --format csv --output scores.csv
+    python -m app.services.score_export --format parquet --segment enterprise --output enterprise.parquet
+    python -m app.services.score_export --format ndjson --label "At Risk" > at_risk.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .health_scoring import calculate_bulk_health_scores, get_period_dates
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Breakdown fields per factor, as produced by build_health_score
+BREAKDOWN_FIELDS = {
+    'login_frequency': ('score', 'weight', 'days_logged_in', 'total_days_in_period', 'login_frequency_percentage'),
+    'feature_adoption': ('score', 'weight', 'features_onboarded', 'features_used', 'total_feature_usage'),
+    'support_tickets': ('score', 'weight', 'tickets_created', 'tickets_resolved', 'currently_open_tickets',
+                        'resolution_rate'),
+    'payment_health': ('score', 'weight', 'total_invoices', 'unpaid_invoices', 'on_time_rate', 'unpaid_amount'),
+    'api_usage': ('score', 'weight', 'total_api_calls', 'active_api_days', 'success_rate', 'unique_endpoints_used')
+}
+
+# Count fields are integers in Parquet; everything else in the breakdown is a float
+INTEGER_FIELDS = {
+    'days_logged_in', 'total_days_in_period', 'features_onboarded', 'features_used', 'total_feature_usage',
+    'tickets_created', 'tickets_resolved', 'currently_open_tickets', 'total_invoices', 'unpaid_invoices',
+    'total_api_calls', 'active_api_days', 'unique_endpoints_used'
+}
+
+EXPORT_COLUMNS = (
+    'customer_id', 'customer_name', 'segment', 'score', 'label',
+    *(f'{factor}_{field}' for factor, fields in BREAKDOWN_FIELDS.items() for field in fields),
+    'last_updated'
+)
+
+EXPORT_CUSTOMERS_SQL = """
+    SELECT id, name, segment
+    FROM customers
+    WHERE id > :after
+      {segment_filter}
+    ORDER BY id
+    LIMIT :limit
+"""
+
+
+def get_export_chunk_size() -> int:
+    return int(os.getenv('SCORE_EXPORT_CHUNK_SIZE', '1000'))
+
+
+def check_export_format(file_format: str) -> None:
+    """Raise ValueError for an unknown format, or for Parquet without pyarrow installed."""
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if file_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+def iter_export_scores(db: Session, segment: Optional[str] = None, label: Optional[str] = None,
+                       period_start: Optional[datetime] = None, period_end: Optional[datetime] = None,
+                       chunk_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield lists of export records (customer fields plus the calculate_customer_health_score
+    result), one list per chunk of customers, skipping customers whose label does not match.
+    """
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    chunk_size = chunk_size or get_export_chunk_size()
+    segment_filter = "AND segment = :segment" if segment is not None else ""
+    statement = text(EXPORT_CUSTOMERS_SQL.format(segment_filter=segment_filter))
+
+    after = ""
+    while True:
+        customers = db.execute(statement, {'after': after, 'segment': segment, 'limit': chunk_size}).fetchall()
+        if not customers:
+            return
+        after = customers[-1].id
+        scores = calculate_bulk_health_scores(db, [customer.id for customer in customers], period_start, period_end)
+        records = []
+        for customer in customers:
+            health_data = scores[customer.id]
+            if label is not None and health_data['label'] != label:
+                continue
+            records.append({
+                'customer_id': customer.id,
+                'customer_name': customer.name,
+                'segment': customer.segment,
+                **health_data
+            })
+        if records:
+            yield records
+        if len(customers) < chunk_size:
+            return
+
+
+def flatten_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """One export row: customer fields, score, label and one column per breakdown field."""
+    row = {column: record.get(column) for column in ('customer_id', 'customer_name', 'segment', 'score', 'label')}
+    for factor, fields in BREAKDOWN_FIELDS.items():
+        for field in fields:
+            row[f'{factor}_{field}'] = record['breakdown'][factor].get(field)
+    row['last_updated'] = record['last_updated']
+    return row
+
+
+def _csv_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for records in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(flatten_record(record) for record in records)
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[str]:
+    for records in chunks:
+        # default=float: unpaid_amount can be a Decimal
+        yield "".join(json.dumps(record, default=float) + "\n" for record in records)
+
+
+class _StreamSink:
+    """Write-only file object handing pyarrow's output to a generator as it is produced."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _column_type(column: str) -> str:
+    """'string', 'int64' or 'float64': the Parquet type of an export column."""
+    if column in ('customer_id', 'customer_name', 'segment', 'label', 'last_updated'):
+        return 'string'
+    field = column
+    for factor in BREAKDOWN_FIELDS:
+        if column.startswith(factor + '_'):
+            field = column[len(factor) + 1:]
+    return 'int64' if field in INTEGER_FIELDS else 'float64'
+
+
+def _parquet_chunks(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {column: _column_type(column) for column in EXPORT_COLUMNS}
+    casts = {'string': str, 'int64': int, 'float64': float}
+    schema = pa.schema([(column, pa.type_for_alias(types[column])) for column in EXPORT_COLUMNS])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    try:
+        for records in chunks:
+            rows = [
+                {column: casts[types[column]](value) if value is not None else None
+                 for column, value in flatten_record(record).items()}
+                for record in records
+            ]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_score_export(db: Session, file_format: str, segment: Optional[str] = None,
+                        label: Optional[str] = None, chunk_size: Optional[int] = None) -> Iterator[Any]:
+    """Yield the export in the given format (str for CSV / NDJSON, bytes for Parquet), chunk by chunk."""
+    check_export_format(file_format)
+    chunks = iter_export_scores(db, segment, label, chunk_size=chunk_size)
+    if file_format == 'csv':
+        return _csv_chunks(chunks)
+    if file_format == 'ndjson':
+        return _ndjson_chunks(chunks)
+    return _parquet_chunks(chunks)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.services.score_export",
+                                     description="Export every customer's health score and breakdown")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--segment")
+    parser.add_argument("--label")
+    parser.add_argument("--chunk-size", type=int, help="Customers scored per chunk (default SCORE_EXPORT_CHUNK_SIZE)")
+    parser.add_argument("--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        check_export_format(args.format)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    binary = args.format == "parquet"
+    if args.output:
+        out = open(args.output, "wb") if binary else open(args.output, "w", newline="", encoding="utf-8")
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    db = SessionLocal()
+    try:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        for part in stream_score_export(db, args.format, args.segment, args.label, args.chunk_size):
+            out.write(part)
+    finally:
+        db.close()
+        if args.output:
+            out.close()
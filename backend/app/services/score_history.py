@@ -0,0 +1,191 @@
+"""
+Health Score History Service
+
+Daily (or weekly) score series for a customer or a segment over an arbitrary
+date range. The point for day d scores the window ending d 23:59, exactly the
+shape get_period_dates produces, from customer_daily_rollups.
+
+Each customer's window is slid one day at a time: the entering day is added, the
+leaving day moves into the API growth look-back and the day leaving the
+look-back is dropped. The rollups for the whole range are read once, so a
+365-point series costs one rollup scan plus O(days) in-memory updates instead
+of 365 independent window scores. Support and payment come from the customer's
+ticket_states and invoice_ledger rows, read once for the range and cut to each
+point's window with the same rules as the events engine.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .health_scoring import get_health_weights, to_epoch_us
+from .invoice_ledger import payment_metrics_from_ledger
+from .rollups import STATE_EVENT_TYPES_SQL, RollupWindow, load_customer_states
+from .ticket_states import support_metrics_from_states
+
+MAX_HISTORY_DAYS = 3 * 366
+PERIOD_END_TIME = time(23, 59)
+
+
+def history_points(start_day: date, end_day: date, step_days: int = 1) -> List[date]:
+    """Days a series has a point for: start_day, start_day + step, ... up to end_day."""
+    if step_days < 1:
+        raise ValueError("step must be at least one day")
+    if end_day < start_day:
+        raise ValueError("end must not be before start")
+    if (end_day - start_day).days > MAX_HISTORY_DAYS:
+        raise ValueError(f"range must not exceed {MAX_HISTORY_DAYS} days")
+    return [start_day + timedelta(days=i) for i in range(0, (end_day - start_day).days + 1, step_days)]
+
+
+def calculate_score_history(db: Session, customer_ids: List[str], start_day: date, end_day: date,
+                            window_days: int = 30, step_days: int = 1,
+                            include_breakdown: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Score series for each customer.
+
+    Args:
+        db: Database session
+        customer_ids: Customers to score
+        start_day: First point of the series
+        end_day: Last day a point may fall on
+        window_days: Scoring window length (30 matches the default score)
+        step_days: Days between points (1 = daily, 7 = weekly)
+        include_breakdown: Include the factor breakdown with every point
+
+    Returns:
+        Dict mapping customer id to [{date, score, label[, breakdown]}, ...]
+    """
+    points = history_points(start_day, end_day, step_days)
+    if not customer_ids:
+        return {}
+    customer_ids = list(customer_ids)
+    customer_filter = "AND customer_id = ANY(:customer_ids)"
+    window = timedelta(days=window_days)
+
+    # Every day any point's window or look-back touches
+    first_end = datetime.combine(points[0], PERIOD_END_TIME)
+    first_start_day = (first_end - window).date()
+    first_previous_day = (first_end - 2 * window).date()
+    params = {
+        'previous_start_day': first_previous_day,
+        'end_day': points[-1],
+        'customer_ids': customer_ids
+    }
+    rows = db.execute(text(f"""
+        SELECT customer_id, day, event_type, event_count, match_count,
+               value_sum, value_count, key_counts, key_values
+        FROM customer_daily_rollups
+        WHERE day >= :previous_start_day
+          AND day <= :end_day
+          AND event_type NOT IN ({STATE_EVENT_TYPES_SQL})
+          {customer_filter}
+    """), params).fetchall()
+    last_end = datetime.combine(points[-1], PERIOD_END_TIME)
+    tickets, invoices = load_customer_states(db, customer_ids, first_end - window, last_end)
+    # Exact bounds of every point's window, for the ticket and invoice rules
+    bounds_us = to_epoch_us(db, [value for point in points
+                                 for value in (datetime.combine(point, PERIOD_END_TIME) - window,
+                                               datetime.combine(point, PERIOD_END_TIME))])
+    point_bounds = {point: tuple(bounds_us[2 * i:2 * i + 2]) for i, point in enumerate(points)}
+
+    rows_by_day: Dict[str, Dict[date, List[tuple]]] = defaultdict(lambda: defaultdict(list))
+    for customer_id, day, event_type, *values in rows:
+        rows_by_day[customer_id][day].append((event_type, *values))
+
+    weights = get_health_weights()
+    emit = set(points)
+    history: Dict[str, List[Dict[str, Any]]] = {}
+    for customer_id in customer_ids:
+        days = rows_by_day.get(customer_id, {})
+        state = RollupWindow()
+
+        def add_window_day(day: date, sign: int) -> None:
+            for event_type, *values in days.get(day, ()):
+                state.apply(day, event_type, *values, sign=sign)
+
+        def add_previous_day(day: date, sign: int) -> None:
+            for event_type, event_count, *_ in days.get(day, ()):
+                state.apply_previous(event_type, event_count, sign=sign)
+
+        # Window [d - window_days, d] and look-back [d - 2 * window_days, d - window_days)
+        for offset in range((points[0] - first_start_day).days + 1):
+            add_window_day(first_start_day + timedelta(days=offset), 1)
+        for offset in range((first_start_day - first_previous_day).days):
+            add_previous_day(first_previous_day + timedelta(days=offset), 1)
+
+        series = []
+        day = points[0]
+        while True:
+            if day in emit:
+                period_end = datetime.combine(day, PERIOD_END_TIME)
+                start_us, end_us = point_bounds[day]
+                result = state.score(
+                    period_end - window, period_end,
+                    support_metrics_from_states(tickets[customer_id], start_us, end_us),
+                    payment_metrics_from_ledger(invoices[customer_id], start_us, end_us),
+                    weights
+                )
+                point = {'date': day.isoformat(), 'score': result['score'], 'label': result['label']}
+                if include_breakdown:
+                    point['breakdown'] = result['breakdown']
+                series.append(point)
+            if day >= points[-1]:
+                break
+            # Slide by one day
+            leaving = day - timedelta(days=window_days)
+            add_window_day(leaving, -1)
+            add_previous_day(leaving, 1)
+            add_previous_day(leaving - timedelta(days=window_days), -1)
+            day += timedelta(days=1)
+            add_window_day(day, 1)
+        history[customer_id] = series
+
+    return history
+
+
+def summarize_history(history: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Collapse per-customer series into one point per date (average, range and label counts)."""
+    by_date: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for series in history.values():
+        for point in series:
+            by_date[point['date']].append(point)
+
+    summary = []
+    for day in sorted(by_date):
+        points = by_date[day]
+        scores = [point['score'] for point in points]
+        labels = {'Healthy': 0, 'At Risk': 0, 'Unhealthy': 0}
+        for point in points:
+            labels[point['label']] += 1
+        summary.append({
+            'date': day,
+            'customers': len(points),
+            'average_score': round(sum(scores) / len(scores), 1),
+            'min_score': min(scores),
+            'max_score': max(scores),
+            'labels': labels
+        })
+    return summary
+
+
+def get_customer_score_history(db: Session, customer_id: str, start_day: date, end_day: date,
+                               window_days: int = 30, step_days: int = 1,
+                               include_breakdown: bool = True) -> List[Dict[str, Any]]:
+    """Score series for one customer."""
+    return calculate_score_history(db, [customer_id], start_day, end_day, window_days,
+                                   step_days, include_breakdown)[customer_id]
+
+
+def get_segment_score_history(db: Session, segment: str, start_day: date, end_day: date,
+                              window_days: int = 30, step_days: int = 1) -> Optional[List[Dict[str, Any]]]:
+    """Aggregated score series for every customer in a segment; None if the segment has no customers."""
+    customer_ids = [row[0] for row in db.execute(
+        text("SELECT id FROM customers WHERE segment = :segment"), {'segment': segment}
+    ).fetchall()]
+    if not customer_ids:
+        return None
+    history = calculate_score_history(db, customer_ids, start_day, end_day, window_days, step_days)
+    return summarize_history(history)
@@ -0,0 +1,533 @@
+"""
+Health Score Snapshot Service
+
+Persists point-in-time health scores in the health_scores table so the read
+endpoints can serve them with a single indexed SELECT. New events mark a
+customer's snapshot dirty; HealthScoreWorker recomputes dirty, missing and
+expired snapshots in the background with bulk scoring. Reads never write: a
+customer without a snapshot yet is served as stale with a null score until
+the worker scores it. Derived rows the
+events queued (services/derived_state.py) are applied before a customer is
+scored.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..core.metrics import SCORE_CHANGES_NOTIFIED, SNAPSHOTS_WRITTEN
+from ..db.replicas import ReadRouter, current_wal_lsn
+from ..models import Customer
+from .derived_state import DRAIN_BATCH_SIZE, apply_pending_derived_state
+from .health_scoring import HEALTH_FACTORS, calculate_bulk_health_scores
+from .score_cache import (
+    cached_customer_health_score,
+    cached_customer_health_score_async,
+    get_cached_customer_health_score,
+)
+
+logger = logging.getLogger(__name__)
+
+
+UPSERT_SNAPSHOT_SQL = text("""
+    INSERT INTO health_scores (
+        customer_id, score, label, breakdown, computed_at, dirty_at,
+        login_frequency_score, feature_adoption_score, support_tickets_score,
+        payment_health_score, api_usage_score
+    )
+    VALUES (
+        :customer_id, :score, :label, :breakdown, :computed_at, NULL,
+        :login_frequency_score, :feature_adoption_score, :support_tickets_score,
+        :payment_health_score, :api_usage_score
+    )
+    ON CONFLICT (customer_id) DO UPDATE SET
+        score = EXCLUDED.score,
+        label = EXCLUDED.label,
+        breakdown = EXCLUDED.breakdown,
+        computed_at = EXCLUDED.computed_at,
+        login_frequency_score = EXCLUDED.login_frequency_score,
+        feature_adoption_score = EXCLUDED.feature_adoption_score,
+        support_tickets_score = EXCLUDED.support_tickets_score,
+        payment_health_score = EXCLUDED.payment_health_score,
+        api_usage_score = EXCLUDED.api_usage_score,
+        dirty_at = CASE
+            WHEN health_scores.dirty_at IS NOT DISTINCT FROM :seen_dirty_at THEN NULL
+            ELSE health_scores.dirty_at
+        END
+""").bindparams(bindparam('breakdown', type_=JSONB))
+
+SNAPSHOT_COLUMNS = """
+    c.id, c.name, c.segment,
+    hs.score, hs.label, hs.computed_at, hs.dirty_at
+"""
+
+# Postgres NOTIFY channel carrying score/label changes (see app.services.score_stream)
+SCORE_CHANGES_CHANNEL = "health_score_changes"
+# NOTIFY payloads must stay under 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7500
+
+# Sort keys accepted by query_score_snapshots -> column
+SNAPSHOT_SORT_COLUMNS = {
+    'id': 'c.id',
+    'name': 'c.name',
+    'segment': 'c.segment',
+    'score': 'hs.score',
+    'label': 'hs.label',
+    'last_updated': 'hs.computed_at',
+}
+# Width of the score histogram buckets in summarize_score_snapshots (scores run 0-100)
+HISTOGRAM_BUCKET_WIDTH = 10
+
+
+def get_max_snapshot_age() -> timedelta:
+    """Snapshots older than this are recomputed even without new events."""
+    return timedelta(seconds=float(os.getenv('HEALTH_SCORE_MAX_AGE_SECONDS', '3600')))
+
+
+def mark_scores_stale(db: Session, customer_ids: Iterable[str]) -> None:
+    """Flag the customers' snapshots for recomputation."""
+    customer_ids = list(set(customer_ids))
+    if not customer_ids:
+        return
+    db.execute(text("""
+        INSERT INTO health_scores (customer_id, dirty_at)
+        SELECT customer_id, clock_timestamp() FROM unnest(CAST(:customer_ids AS text[])) AS t(customer_id)
+        ON CONFLICT (customer_id) DO UPDATE SET
+            dirty_at = EXCLUDED.dirty_at
+    """), {'customer_ids': customer_ids})
+
+
+def _read_snapshot_state(db: Session, customer_ids: Optional[List[str]]) -> Dict[str, Any]:
+    """Current dirty mark, computed_at, score, label and segment per customer, read before rescoring."""
+    customer_filter = "WHERE c.id = ANY(:customer_ids)" if customer_ids is not None else ""
+    rows = db.execute(text(f"""
+        SELECT c.id AS customer_id, hs.dirty_at, hs.computed_at, hs.score, hs.label, c.segment
+        FROM customers c
+        LEFT JOIN health_scores hs ON hs.customer_id = c.id
+        {customer_filter}
+    """), {'customer_ids': customer_ids}).fetchall()
+    return {row.customer_id: row for row in rows}
+
+
+def score_push_enabled() -> bool:
+    return os.getenv('SCORE_PUSH_ENABLED', 'true').lower() == 'true'
+
+
+def get_min_score_change() -> float:
+    """Smallest score movement (without a label change) that is pushed to subscribers."""
+    return float(os.getenv('SCORE_PUSH_MIN_CHANGE', '1.0'))
+
+
+def score_changes(results: Dict[str, Dict[str, Any]], previous: Dict[str, Any],
+                  computed_at: datetime) -> List[Dict[str, Any]]:
+    """Customers whose label changed or whose score moved by at least SCORE_PUSH_MIN_CHANGE."""
+    min_change = get_min_score_change()
+    changes = []
+    for customer_id, health_data in results.items():
+        before = previous.get(customer_id)
+        old_score = before.score if before is not None else None
+        old_label = before.label if before is not None else None
+        if old_label == health_data['label'] and old_score is not None \
+                and abs(health_data['score'] - old_score) < min_change:
+            continue
+        changes.append({
+            'customer_id': customer_id,
+            'segment': before.segment if before is not None else None,
+            'score': health_data['score'],
+            'label': health_data['label'],
+            'previous_score': old_score,
+            'previous_label': old_label,
+            'computed_at': computed_at.isoformat()
+        })
+    return changes
+
+
+def notify_score_changes(db: Session, changes: List[Dict[str, Any]]) -> None:
+    """
+    Queue score change notifications on SCORE_CHANGES_CHANNEL in the session's transaction.
+
+    Postgres delivers NOTIFY only when the transaction commits (and drops it on
+    rollback), so listeners never see a score that was not saved. Changes are
+    packed into JSON arrays under the NOTIFY payload limit.
+    """
+    payloads, batch, size = [], [], 2
+    for change in changes:
+        encoded = json.dumps(change, separators=(',', ':'), default=str)
+        if batch and size + len(encoded) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            payloads.append('[' + ','.join(batch) + ']')
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append('[' + ','.join(batch) + ']')
+    db.execute(text("SELECT pg_notify(:channel, :payload)"),
+               [{'channel': SCORE_CHANGES_CHANNEL, 'payload': payload} for payload in payloads])
+    SCORE_CHANGES_NOTIFIED.inc(len(changes))
+
+
+def save_score_snapshots(db: Session, results: Dict[str, Dict[str, Any]], previous: Dict[str, Any]) -> None:
+    """
+    Upsert computed scores into health_scores.
+
+    previous is the _read_snapshot_state read before scoring started. The dirty
+    mark is only cleared if it still equals the value read then, so a customer
+    marked dirty while scoring was running stays dirty. Score and label changes
+    are announced to push subscribers when the transaction commits.
+    """
+    if not results:
+        return
+    computed_at = datetime.now(timezone.utc)
+    db.execute(UPSERT_SNAPSHOT_SQL, [
+        {
+            'customer_id': customer_id,
+            'score': health_data['score'],
+            'label': health_data['label'],
+            'breakdown': health_data['breakdown'],
+            'computed_at': computed_at,
+            'seen_dirty_at': previous[customer_id].dirty_at if customer_id in previous else None,
+            **{f'{factor}_score': health_data['breakdown'][factor]['score'] for factor in HEALTH_FACTORS}
+        }
+        for customer_id, health_data in results.items()
+    ])
+    SNAPSHOTS_WRITTEN.inc(len(results))
+    if score_push_enabled():
+        changes = score_changes(results, previous, computed_at)
+        if changes:
+            notify_score_changes(db, changes)
+    for health_data in results.values():
+        health_data['last_updated'] = computed_at.isoformat()
+
+
+def recompute_scores(db: Session, customer_ids: Optional[List[str]] = None,
+                     read_router: Optional[ReadRouter] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Recompute and persist snapshots for the given customers (all when None) with bulk scoring.
+
+    Pending derived rows of the customers are applied first (in this transaction).
+    With a read_router the scoring queries run on a replica that has replayed
+    everything the primary had when the dirty marks were read (else on the primary,
+    as they do when derived rows were just applied, which no replica has yet), so a
+    cleared mark never hides events the score did not see.
+    """
+    applied = apply_pending_derived_state(db, customer_ids, limit=None)
+    previous = _read_snapshot_state(db, customer_ids)
+    use_replica = read_router is not None and read_router.enabled and not applied
+    read_db = read_router.session_at(current_wal_lsn(db)) if use_replica else None
+    try:
+        results = calculate_bulk_health_scores(read_db or db, customer_ids)
+    finally:
+        if read_db is not None:
+            read_db.close()
+    save_score_snapshots(db, results, previous)
+    return results
+
+
+def _snapshot_is_clean(state: Any) -> bool:
+    """Whether the snapshot was computed and no event has reached the customer since."""
+    return state is not None and state.computed_at is not None and state.dirty_at is None
+
+
+def refresh_customer_score(db: Session, customer: Customer) -> Dict[str, Any]:
+    """
+    Score one customer live and persist the result as its snapshot.
+
+    While the snapshot is clean, a breakdown cached within the TTL is served
+    instead and the snapshot is left as it is. Events mark the snapshot dirty
+    in the ingesting transaction, so a dirty customer always bypasses the
+    cache, even when another worker ingested the event and this process'
+    local cache was never invalidated.
+    """
+    previous = _read_snapshot_state(db, [customer.id])
+    if _snapshot_is_clean(previous.get(customer.id)):
+        health_data = get_cached_customer_health_score(customer.id)
+        if health_data is not None:
+            return health_data
+    apply_pending_derived_state(db, [customer.id])
+    health_data = cached_customer_health_score(db, customer, fresh=True)
+    save_score_snapshots(db, {customer.id: health_data}, previous)
+    return health_data
+
+
+async def refresh_customer_score_async(db: AsyncSession, customer_id: str) -> Optional[Dict[str, Any]]:
+    """Async refresh_customer_score; returns None if the customer does not exist."""
+    previous = await db.run_sync(_read_snapshot_state, [customer_id])
+    if customer_id not in previous:
+        return None
+    if _snapshot_is_clean(previous[customer_id]):
+        health_data = get_cached_customer_health_score(customer_id)
+        if health_data is not None:
+            return health_data
+    await db.run_sync(apply_pending_derived_state, [customer_id])
+    health_data = await cached_customer_health_score_async(db, customer_id, fresh=True)
+    await db.run_sync(save_score_snapshots, {customer_id: health_data}, previous)
+    return health_data
+
+
+def find_customers_needing_recompute(db: Session, limit: int) -> List[str]:
+    """Customers whose snapshot is dirty, missing or older than the max age (oldest first)."""
+    rows = db.execute(text("""
+        SELECT c.id
+        FROM customers c
+        LEFT JOIN health_scores hs ON hs.customer_id = c.id
+        WHERE hs.customer_id IS NULL
+           OR hs.computed_at IS NULL
+           OR hs.dirty_at IS NOT NULL
+           OR hs.computed_at < :expired_before
+        ORDER BY hs.computed_at NULLS FIRST
+        LIMIT :limit
+    """), {
+        'expired_before': datetime.now(timezone.utc) - get_max_snapshot_age(),
+        'limit': limit
+    }).fetchall()
+    return [row[0] for row in rows]
+
+
+def recompute_stale_scores(db: Session, batch_size: int = 500, read_router: Optional[ReadRouter] = None) -> int:
+    """Recompute one batch of stale snapshots. Returns the number of customers rescored."""
+    customer_ids = find_customers_needing_recompute(db, batch_size)
+    if customer_ids:
+        recompute_scores(db, customer_ids, read_router)
+    return len(customer_ids)
+
+
+def snapshot_to_response(row: Any) -> Dict[str, Any]:
+    """
+    Convert a SNAPSHOT_COLUMNS row (plus optional breakdown) into the API response format.
+
+    A customer that has not been scored yet (no computed_at) has null score,
+    label, last_updated and age_seconds and is reported stale.
+    """
+    now = datetime.now(timezone.utc)
+    computed_at = row.computed_at
+    response = {
+        "id": str(row.id),
+        "name": row.name,
+        "segment": row.segment,
+        "score": row.score,
+        "label": row.label,
+        "last_updated": computed_at.isoformat() if computed_at is not None else None,
+        "stale": (computed_at is None or row.dirty_at is not None
+                  or computed_at < now - get_max_snapshot_age()),
+        "age_seconds": round((now - computed_at).total_seconds(), 1) if computed_at is not None else None
+    }
+    if "breakdown" in row._fields:
+        response["breakdown"] = row.breakdown
+    return response
+
+
+def get_score_snapshot(db: Session, customer_id: str) -> Optional[Dict[str, Any]]:
+    """Return the customer's snapshot (stale with a null score if not scored yet), or None if no such customer."""
+    row = db.execute(text(f"""
+        SELECT {SNAPSHOT_COLUMNS}, hs.breakdown
+        FROM customers c
+        LEFT JOIN health_scores hs ON hs.customer_id = c.id
+        WHERE c.id = :customer_id
+    """), {'customer_id': customer_id}).fetchone()
+    return snapshot_to_response(row) if row else None
+
+
+def list_score_snapshots(db: Session) -> List[Dict[str, Any]]:
+    """Return every customer's snapshot (without breakdown) ordered by id."""
+    return query_score_snapshots(db, sort='id')[0]
+
+
+def _snapshot_filters(segment: Optional[str], label: Optional[str], min_score: Optional[float],
+                      max_score: Optional[float], name: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """WHERE clause and params shared by the snapshot list and summary queries."""
+    if min_score is not None and max_score is not None and min_score > max_score:
+        raise ValueError("min_score must not be greater than max_score")
+    conditions = []
+    params: Dict[str, Any] = {}
+    if segment is not None:
+        # Plain equality so idx_customers_segment can be used
+        conditions.append("c.segment = :segment")
+        params['segment'] = segment
+    if label is not None:
+        conditions.append("hs.label = :label")
+        params['label'] = label
+    if min_score is not None:
+        conditions.append("hs.score >= :min_score")
+        params['min_score'] = min_score
+    if max_score is not None:
+        conditions.append("hs.score <= :max_score")
+        params['max_score'] = max_score
+    if name:
+        conditions.append("c.name ILIKE :name")
+        params['name'] = '%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+
+def query_score_snapshots(db: Session, segment: Optional[str] = None, label: Optional[str] = None,
+                          min_score: Optional[float] = None, max_score: Optional[float] = None,
+                          sort: str = 'id', order: str = 'asc', limit: Optional[int] = None,
+                          offset: int = 0, name: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Return one page of snapshots (without breakdown) and the total number matching the filters.
+
+    Filtering (name is a case-insensitive substring match), sorting and paging
+    all run in the database; ties are broken by customer id so pages are stable. Raises ValueError for an unknown sort key or order.
+    Customers not scored yet are included (stale, null score) unless a label
+    or score filter excludes them; they sort last by score, label or last_updated.
+    """
+    if sort not in SNAPSHOT_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort key {sort!r}; expected one of {', '.join(SNAPSHOT_SORT_COLUMNS)}")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    where, params = _snapshot_filters(segment, label, min_score, max_score, name)
+
+    order_by = f"{SNAPSHOT_SORT_COLUMNS[sort]} {order.upper()} NULLS LAST"
+    if sort != 'id':
+        order_by += ", c.id"
+    page = "LIMIT :limit OFFSET :offset" if limit is not None else ""
+    rows = db.execute(text(f"""
+        SELECT {SNAPSHOT_COLUMNS}, COUNT(*) OVER () AS total
+        FROM customers c
+        LEFT JOIN health_scores hs ON hs.customer_id = c.id
+        {where}
+        ORDER BY {order_by}
+        {page}
+    """), {**params, 'limit': limit, 'offset': offset}).fetchall()
+
+    if rows:
+        total = rows[0].total
+    elif offset > 0:
+        # Past the last page: the window count is not available without rows
+        total = db.execute(text(f"""
+            SELECT COUNT(*)
+            FROM customers c
+            LEFT JOIN health_scores hs ON hs.customer_id = c.id
+            {where}
+        """), params).scalar()
+    else:
+        total = 0
+    return [snapshot_to_response(row) for row in rows], total
+
+
+def summarize_score_snapshots(db: Session, segment: Optional[str] = None, label: Optional[str] = None,
+                              min_score: Optional[float] = None,
+                              max_score: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Aggregate the snapshots in one query: overall and per-segment counts and average
+    score, label distribution and a score histogram (HISTOGRAM_BUCKET_WIDTH wide buckets).
+    Only customers that have been scored are counted.
+    """
+    where, params = _snapshot_filters(segment, label, min_score, max_score)
+    last_bucket = 100 - HISTOGRAM_BUCKET_WIDTH
+    rows = db.execute(text(f"""
+        WITH scored AS (
+            SELECT
+                COALESCE(c.segment, 'unknown') AS segment,
+                hs.label,
+                hs.score,
+                LEAST(FLOOR(hs.score / :width) * :width, :last_bucket)::int AS bucket
+            FROM customers c
+            JOIN health_scores hs ON hs.customer_id = c.id AND hs.computed_at IS NOT NULL
+            {where}
+        )
+        SELECT
+            segment, label, bucket,
+            GROUPING(segment) AS no_segment,
+            GROUPING(label) AS no_label,
+            GROUPING(bucket) AS no_bucket,
+            COUNT(*) AS customers,
+            AVG(score) AS average_score
+        FROM scored
+        GROUP BY GROUPING SETS ((), (label), (bucket), (segment), (segment, label), (segment, bucket))
+    """), {**params, 'width': HISTOGRAM_BUCKET_WIDTH, 'last_bucket': last_bucket}).fetchall()
+
+    def empty_group() -> Dict[str, Any]:
+        return {
+            'customers': 0,
+            'average_score': None,
+            'labels': {},
+            'histogram': [
+                {'min_score': start, 'max_score': start + HISTOGRAM_BUCKET_WIDTH, 'customers': 0}
+                for start in range(0, 100, HISTOGRAM_BUCKET_WIDTH)
+            ]
+        }
+
+    overall = empty_group()
+    segments: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        group = overall if row.no_segment else segments.setdefault(row.segment, empty_group())
+        if row.no_label and row.no_bucket:
+            group['customers'] = row.customers
+            group['average_score'] = round(row.average_score, 1) if row.average_score is not None else None
+        elif not row.no_label:
+            group['labels'][row.label] = row.customers
+        else:
+            group['histogram'][row.bucket // HISTOGRAM_BUCKET_WIDTH]['customers'] = row.customers
+
+    return {**overall, 'segments': dict(sorted(segments.items()))}
+
+
+class HealthScoreWorker:
+    """
+    Background thread that keeps health_scores fresh.
+
+    Every HEALTH_SCORE_WORKER_INTERVAL seconds it applies the queued derived rows,
+    then rescores batches of HEALTH_SCORE_WORKER_BATCH stale customers until none
+    are left. With a read_router the scoring queries run on a read replica.
+    """
+
+    def __init__(self, session_factory, interval: Optional[float] = None, batch_size: Optional[int] = None,
+                 read_router: Optional[ReadRouter] = None):
+        self.session_factory = session_factory
+        self.read_router = read_router
+        self.interval = interval if interval is not None else float(os.getenv('HEALTH_SCORE_WORKER_INTERVAL', '30'))
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv('HEALTH_SCORE_WORKER_BATCH', '500'))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Drain the derived state queue and all stale snapshots. Returns the number of customers rescored."""
+        total = 0
+        db = self.session_factory()
+        try:
+            while not self._stop.is_set():
+                applied = apply_pending_derived_state(db, limit=DRAIN_BATCH_SIZE)
+                db.commit()
+                if applied < DRAIN_BATCH_SIZE:
+                    break
+            while not self._stop.is_set():
+                rescored = recompute_stale_scores(db, self.batch_size, self.read_router)
+                db.commit()
+                total += rescored
+                if rescored < self.batch_size:
+                    break
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                rescored = self.run_once()
+                if rescored:
+                    logger.info("Recomputed %d health score snapshots", rescored)
+            except Exception:
+                logger.exception("Health score recomputation failed")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-score-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,261 @@
+"""
+Score Change Push
+
+Pushes health score and label changes to subscribers (the SSE endpoint
+/api/stream/scores) as soon as they are saved:
+
+  1. Committed events schedule their customers with ScoreUpdateScheduler,
+     which waits SCORE_PUSH_COALESCE_MS after a customer's first pending event
+     (so a burst of events costs one recomputation) and then rescores every
+     ready customer in one bulk pass.
+  2. save_score_snapshots NOTIFYs the changes in the same transaction, so they
+     are delivered only on commit and reach every API process, whichever one
+     (or the background worker) did the scoring.
+  3. Each process holds one LISTEN connection (ScoreChangeListener) and fans
+     each change out to its subscribers in memory: no per-client queries.
+
+Subscribers that fall more than SCORE_PUSH_QUEUE_SIZE changes behind lose the
+oldest ones and are told to resync.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from ..core.metrics import SCORE_STREAM_DROPPED, SCORE_STREAM_SUBSCRIBERS
+from ..db.replicas import ReadRouter
+from .score_snapshots import SCORE_CHANGES_CHANNEL, recompute_scores, score_push_enabled
+
+logger = logging.getLogger(__name__)
+
+
+def get_push_settings() -> Dict[str, Any]:
+    """Push settings read from SCORE_PUSH_* environment variables."""
+    return {
+        'coalesce_seconds': float(os.getenv('SCORE_PUSH_COALESCE_MS', '250')) / 1000,
+        'batch_size': int(os.getenv('SCORE_PUSH_BATCH', '1000')),
+        'queue_size': int(os.getenv('SCORE_PUSH_QUEUE_SIZE', '1000'))
+    }
+
+
+class Subscription:
+    """One subscriber's bounded queue of changes, with optional filters."""
+
+    def __init__(self, customer_ids: Optional[Set[str]], segment: Optional[str], labels_only: bool, maxsize: int):
+        self.customer_ids = customer_ids
+        self.segment = segment
+        self.labels_only = labels_only
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def wants(self, change: Dict[str, Any]) -> bool:
+        if self.customer_ids is not None and change['customer_id'] not in self.customer_ids:
+            return False
+        if self.segment is not None and change.get('segment') != self.segment:
+            return False
+        if self.labels_only and change['label'] == change.get('previous_label'):
+            return False
+        return True
+
+    def put(self, change: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            SCORE_STREAM_DROPPED.inc()
+        self.queue.put_nowait(change)
+
+
+class ScoreChangeBroker:
+    """In-process fan-out of score changes to subscriptions. Used from the event loop only."""
+
+    def __init__(self):
+        self._subscriptions: Set[Subscription] = set()
+
+    def subscribe(self, customer_ids: Optional[Iterable[str]] = None, segment: Optional[str] = None,
+                  labels_only: bool = False) -> Subscription:
+        subscription = Subscription(set(customer_ids) if customer_ids else None, segment, labels_only,
+                                    get_push_settings()['queue_size'])
+        self._subscriptions.add(subscription)
+        SCORE_STREAM_SUBSCRIBERS.set(len(self._subscriptions))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        SCORE_STREAM_SUBSCRIBERS.set(len(self._subscriptions))
+
+    def publish(self, changes: List[Dict[str, Any]]) -> None:
+        for subscription in self._subscriptions:
+            for change in changes:
+                if subscription.wants(change):
+                    subscription.put(change)
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+
+score_broker = ScoreChangeBroker()
+
+
+def _asyncpg_dsn(url: str) -> str:
+    """asyncpg takes a plain postgresql:// DSN (no SQLAlchemy driver suffix)."""
+    scheme, _, rest = url.partition("://")
+    return "postgresql://" + rest if scheme.startswith("postgres") else url
+
+
+class ScoreChangeListener:
+    """LISTENs on SCORE_CHANGES_CHANNEL and publishes every notification to the broker."""
+
+    def __init__(self, database_url: str, broker: ScoreChangeBroker, retry_seconds: float = 5.0):
+        self.dsn = _asyncpg_dsn(database_url)
+        self.broker = broker
+        self.retry_seconds = retry_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            self.broker.publish(json.loads(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed score change payload")
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(SCORE_CHANGES_CHANNEL, self._on_notify)
+                logger.info("Listening for score changes on %s", SCORE_CHANGES_CHANNEL)
+                # Notifications arrive via the callback; wake up now and then to notice a dead connection
+                while not connection.is_closed():
+                    await asyncio.sleep(self.retry_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Score change listener failed; reconnecting")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ScoreUpdateScheduler:
+    """
+    Background thread that rescores customers shortly after their events commit.
+
+    A customer's first pending event starts its coalescing window; events that
+    arrive during the window ride along. Ready customers are rescored together
+    in batches of SCORE_PUSH_BATCH with bulk scoring.
+    """
+
+    def __init__(self, session_factory, coalesce_seconds: Optional[float] = None,
+                 batch_size: Optional[int] = None, read_router: Optional[ReadRouter] = None):
+        settings = get_push_settings()
+        self.session_factory = session_factory
+        self.coalesce_seconds = coalesce_seconds if coalesce_seconds is not None else settings['coalesce_seconds']
+        self.batch_size = batch_size if batch_size is not None else settings['batch_size']
+        self.read_router = read_router
+        self._pending: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, customer_ids: Iterable[str]) -> None:
+        now = time.monotonic()
+        with self._condition:
+            for customer_id in customer_ids:
+                self._pending.setdefault(customer_id, now)
+            self._condition.notify()
+
+    def _take_ready(self) -> List[str]:
+        """Wait until some customers' windows have closed and remove them from pending."""
+        with self._condition:
+            while not self._stop:
+                if self._pending:
+                    wait = min(self._pending.values()) + self.coalesce_seconds - time.monotonic()
+                    if wait <= 0:
+                        cutoff = time.monotonic() - self.coalesce_seconds
+                        ready = [c for c, since in self._pending.items() if since <= cutoff][:self.batch_size]
+                        for customer_id in ready:
+                            del self._pending[customer_id]
+                        return ready
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            return []
+
+    def run_once(self, customer_ids: List[str]) -> None:
+        db = self.session_factory()
+        try:
+            recompute_scores(db, customer_ids, self.read_router)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while True:
+            customer_ids = self._take_ready()
+            if not customer_ids:
+                return
+            try:
+                self.run_once(customer_ids)
+            except Exception:
+                # Their snapshots stay dirty; HealthScoreWorker picks them up
+                logger.exception("Rescoring %d customers after new events failed", len(customer_ids))
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="score-update-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_scheduler: Optional[ScoreUpdateScheduler] = None
+
+
+def set_score_update_scheduler(scheduler: Optional[ScoreUpdateScheduler]) -> None:
+    global _scheduler
+    _scheduler = scheduler
+
+
+def schedule_score_updates(customer_ids: Iterable[str]) -> None:
+    """Queue customers for coalesced rescoring (no-op when push is off or outside the API process)."""
+    if _scheduler is not None and score_push_enabled():
+        _scheduler.schedule(customer_ids)
+
+
+def format_sse(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    """One Server-Sent Events message."""
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,426 @@
+"""
+Segment Analytics Service
+
+Segment / cohort figures (API response time percentiles, distinct endpoints
+and features used, login-day distributions) per segment and per day, week or
+month, without re-running COUNT(DISTINCT ...) and percentile queries over raw
+events.
+
+customer_daily_sketches holds one row per customer-day with exact login and
+API call counts plus mergeable sketches (see services/sketches.py for the
+structures and their error bounds). Rows are rebuilt from the day's events
+after a user_login, api_call or feature_used event is ingested (queued by
+apply_event_side_effects, see services/derived_state.py). A rollup streams the
+customer-days of its range and merges them into one set of sketches per
+(segment, period), so its memory depends on the number of segments and
+periods, not on customers or events:
+
+  - response_time_ms: p50 / p95 / p99 within 1% relative error; count,
+    average and max exact
+  - distinct_endpoints, distinct_features: ~1.6% relative standard error
+  - login_days: exact distribution of login days per customer in the period
+    (customers without activity count as 0 days)
+
+Events that existed when the table was created (migration 0009), and events
+written without going through the API or loader (for example a raw COPY), are
+folded in with the commands below. `rebuild --all` commits every
+REBUILD_COMMIT_CUSTOMERS customers, so it can run while the API is serving:
+
+    python -m app.services.segment_analytics rebuild --all
+    python -m app.services.segment_analytics rebuild --customer-id cust_001
+    python -m app.services.segment_analytics report --start 2024-07-01 --end 2024-09-30
+"""
+import argparse
+import json
+import math
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .rollups import TOUCHED_BUCKETS, TOUCHED_SCOPE
+from .sketches import HLL_REGISTERS, QUANTILE_RELATIVE_ACCURACY, HyperLogLog, QuantileSketch
+
+SKETCH_EVENT_TYPES = ('user_login', 'api_call', 'feature_used')
+SKETCH_STREAM_BATCH_SIZE = 5000
+# Customers rebuilt per transaction by `rebuild --all`
+REBUILD_COMMIT_CUSTOMERS = 500
+
+ANALYTICS_INTERVALS = {
+    'day': "s.day::text",
+    'week': "date_trunc('week', s.day)::date::text",
+    'month': "to_char(s.day, 'YYYY-MM')",
+    'total': "'total'"
+}
+
+ERROR_BOUNDS = {
+    'response_time_percentiles_relative_error': QUANTILE_RELATIVE_ACCURACY,
+    'distinct_counts_relative_standard_error': round(1.04 / math.sqrt(HLL_REGISTERS), 4),
+    'exact': ['customers', 'active_customers', 'api_calls', 'response_time_ms.avg',
+              'response_time_ms.max', 'login_days']
+}
+
+SKETCH_EVENTS_SQL = """
+    SELECT e.customer_id, DATE(e.ts) as day, e.event_type, e.endpoint, e.feature_name, e.response_time_ms
+    FROM events e
+    {scope}
+    WHERE e.event_type IN ('user_login', 'api_call', 'feature_used')
+      {conditions}
+"""
+
+SKETCH_BUCKETS_SQL = text("""
+    SELECT DISTINCT customer_id, DATE(ts) as day
+    FROM unnest(CAST(:customer_ids AS text[]), CAST(:timestamps AS timestamptz[])) AS t(customer_id, ts)
+    ORDER BY customer_id, day
+""")
+
+UPSERT_SKETCH_SQL = text("""
+    INSERT INTO customer_daily_sketches (
+        customer_id, day, login_count, api_call_count, response_time_sketch, endpoint_hll, feature_hll
+    )
+    VALUES (
+        :customer_id, :day, :login_count, :api_call_count, :response_time_sketch, :endpoint_hll, :feature_hll
+    )
+    ON CONFLICT (customer_id, day) DO UPDATE SET
+        login_count = EXCLUDED.login_count,
+        api_call_count = EXCLUDED.api_call_count,
+        response_time_sketch = EXCLUDED.response_time_sketch,
+        endpoint_hll = EXCLUDED.endpoint_hll,
+        feature_hll = EXCLUDED.feature_hll
+""")
+
+DELETE_TOUCHED_SQL = """
+    DELETE FROM customer_daily_sketches s
+    USING ({touched}) touched
+    WHERE s.customer_id = touched.customer_id
+      AND s.day = touched.day
+""".format(touched=TOUCHED_BUCKETS)
+
+SEGMENT_SKETCHES_SQL = """
+    SELECT c.segment, {period} as period, s.api_call_count, s.response_time_sketch, s.endpoint_hll, s.feature_hll
+    FROM customer_daily_sketches s
+    JOIN customers c ON c.id = s.customer_id
+    WHERE s.day >= :start_day AND s.day <= :end_day
+      AND (s.api_call_count > 0 OR s.feature_hll IS NOT NULL)
+      {segment_filter}
+"""
+
+# Customers per (segment, period, login days) among customers active in the period
+SEGMENT_LOGIN_DAYS_SQL = """
+    WITH per_customer AS (
+        SELECT c.segment, {period} as period, s.customer_id, COUNT(*) FILTER (WHERE s.login_count > 0) as login_days
+        FROM customer_daily_sketches s
+        JOIN customers c ON c.id = s.customer_id
+        WHERE s.day >= :start_day AND s.day <= :end_day
+          {segment_filter}
+        GROUP BY 1, 2, 3
+    )
+    SELECT segment, period, login_days, COUNT(*)
+    FROM per_customer
+    GROUP BY 1, 2, 3
+"""
+
+SEGMENT_SIZES_SQL = """
+    SELECT segment, COUNT(*)
+    FROM customers c
+    WHERE true {segment_filter}
+    GROUP BY segment
+"""
+
+
+def get_max_range_days() -> int:
+    return int(os.getenv('SEGMENT_ANALYTICS_MAX_DAYS', '731'))
+
+
+# SKETCH MAINTENANCE
+class _DaySketch:
+    """Events of one customer-day on their way into a customer_daily_sketches row."""
+
+    def __init__(self):
+        self.login_count = 0
+        self.api_call_count = 0
+        self.response_times: List[float] = []
+        self.endpoints = set()
+        self.features = set()
+
+    def add(self, event_type: str, endpoint: Optional[str], feature_name: Optional[str],
+            response_time_ms: Optional[int]) -> None:
+        if event_type == 'user_login':
+            self.login_count += 1
+        elif event_type == 'api_call':
+            self.api_call_count += 1
+            if response_time_ms is not None:
+                self.response_times.append(response_time_ms)
+            if endpoint is not None:
+                self.endpoints.add(endpoint)
+        elif feature_name is not None:
+            self.features.add(feature_name)
+
+    def to_row(self, customer_id: str, day: date) -> Dict[str, Any]:
+        response_time_sketch = endpoint_hll = feature_hll = None
+        if self.response_times:
+            sketch = QuantileSketch()
+            sketch.update(self.response_times)
+            response_time_sketch = sketch.to_bytes()
+        if self.endpoints:
+            hll = HyperLogLog()
+            hll.update(self.endpoints)
+            endpoint_hll = hll.to_bytes()
+        if self.features:
+            hll = HyperLogLog()
+            hll.update(self.features)
+            feature_hll = hll.to_bytes()
+        return {
+            'customer_id': customer_id,
+            'day': day,
+            'login_count': self.login_count,
+            'api_call_count': self.api_call_count,
+            'response_time_sketch': response_time_sketch,
+            'endpoint_hll': endpoint_hll,
+            'feature_hll': feature_hll
+        }
+
+
+def _write_sketches(db: Session, event_rows: Iterable[Tuple]) -> int:
+    """Build one sketch row per (customer, day) of the given event rows and upsert them."""
+    days: Dict[Tuple[str, date], _DaySketch] = defaultdict(_DaySketch)
+    for customer_id, day, event_type, endpoint, feature_name, response_time_ms in event_rows:
+        days[(customer_id, day)].add(event_type, endpoint, feature_name, response_time_ms)
+    if days:
+        db.execute(UPSERT_SKETCH_SQL, [sketch.to_row(customer_id, day)
+                                       for (customer_id, day), sketch in days.items()])
+    return len(days)
+
+
+def sketch_buckets(db: Session, events: Iterable[Any]) -> List[Tuple[str, date]]:
+    """
+    (customer_id, day) buckets touched by the sketched events among Event rows or event dicts.
+
+    Days are DATE(ts) in the session time zone, the way SKETCH_EVENTS_SQL buckets them.
+    """
+    customer_ids, timestamps = [], []
+    for event in events:
+        if isinstance(event, dict):
+            event_type, customer_id, ts = event["event_type"], event["customer_id"], event["ts"]
+        else:
+            event_type, customer_id, ts = event.event_type, event.customer_id, event.ts
+        if event_type in SKETCH_EVENT_TYPES:
+            customer_ids.append(customer_id)
+            timestamps.append(ts)
+    if not customer_ids:
+        return []
+    rows = db.execute(SKETCH_BUCKETS_SQL, {'customer_ids': customer_ids, 'timestamps': timestamps})
+    return [(customer_id, day) for customer_id, day in rows]
+
+
+def refresh_segment_sketches(db: Session, buckets: Iterable[Tuple[str, date]]) -> None:
+    """
+    Rebuild the sketch rows of the given (customer_id, day) buckets from their events.
+
+    Refreshing a bucket is idempotent.
+    """
+    buckets = set(buckets)
+    if not buckets:
+        return
+    params = {
+        'customer_ids': [customer_id for customer_id, _ in buckets],
+        'days': [day for _, day in buckets]
+    }
+    db.execute(text(DELETE_TOUCHED_SQL), params)
+    rows = db.execute(text(SKETCH_EVENTS_SQL.format(scope=TOUCHED_SCOPE, conditions="")), params)
+    _write_sketches(db, rows)
+
+
+def rebuild_segment_sketches(db: Session, customer_ids: Optional[List[str]] = None,
+                             start_day: Optional[date] = None, end_day: Optional[date] = None) -> int:
+    """
+    Rebuild the sketch rows of the given customers (all customers if None), optionally only
+    between start_day and end_day (inclusive), e.g. after a bulk load. One customer's events
+    are read at a time. Returns the number of customer-days written.
+    """
+    if customer_ids is None:
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers ORDER BY id"))]
+    day_filter = event_filter = ""
+    if start_day is not None:
+        day_filter += " AND day >= :start_day"
+        event_filter += " AND e.ts >= :start_day"
+    if end_day is not None:
+        day_filter += " AND day <= :end_day"
+        event_filter += " AND e.ts < :end_exclusive"
+    delete_sql = text(f"DELETE FROM customer_daily_sketches WHERE customer_id = :customer_id {day_filter}")
+    events_sql = text(SKETCH_EVENTS_SQL.format(
+        scope="", conditions=f"AND e.customer_id = :customer_id {event_filter}"
+    ))
+
+    written = 0
+    for customer_id in customer_ids:
+        params = {
+            'customer_id': customer_id,
+            'start_day': start_day,
+            'end_day': end_day,
+            'end_exclusive': end_day + timedelta(days=1) if end_day is not None else None
+        }
+        db.execute(delete_sql, params)
+        written += _write_sketches(db, db.execute(events_sql, params))
+    return written
+
+
+# SEGMENT ROLLUPS
+class _SegmentPeriod:
+    """Merged sketches of every customer-day of one segment and period."""
+
+    def __init__(self):
+        self.api_calls = 0
+        self.response_times = QuantileSketch()
+        self.endpoints = HyperLogLog()
+        self.features = HyperLogLog()
+
+    def add(self, api_call_count: int, response_time_sketch: Optional[bytes],
+            endpoint_hll: Optional[bytes], feature_hll: Optional[bytes]) -> None:
+        self.api_calls += api_call_count
+        if response_time_sketch is not None:
+            self.response_times.merge_bytes(bytes(response_time_sketch))
+        if endpoint_hll is not None:
+            self.endpoints.merge_bytes(bytes(endpoint_hll))
+        if feature_hll is not None:
+            self.features.merge_bytes(bytes(feature_hll))
+
+
+def _login_day_summary(histogram: Dict[int, int]) -> Dict[str, Any]:
+    """Mean and nearest-rank percentiles of an exact {login_days: customers} histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return {'mean': None, 'p50': None, 'p90': None, 'histogram': {}}
+    ordered = sorted(histogram.items())
+
+    def percentile(q: float) -> int:
+        rank = max(math.ceil(q * total), 1)
+        seen = 0
+        for login_days, customers in ordered:
+            seen += customers
+            if seen >= rank:
+                return login_days
+        return ordered[-1][0]
+
+    return {
+        'mean': round(sum(days * customers for days, customers in ordered) / total, 2),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'histogram': {str(days): customers for days, customers in ordered}
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def get_segment_analytics(db: Session, start_day: date, end_day: date, interval: str = 'month',
+                          segment: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Merge customer-day sketches into one result per (segment, period).
+
+    interval is 'day', 'week', 'month' or 'total' (one period for the whole range).
+    Raises ValueError for an unknown interval or an invalid or too long range.
+    """
+    if interval not in ANALYTICS_INTERVALS:
+        raise ValueError(f"Invalid interval. Use one of: {', '.join(ANALYTICS_INTERVALS)}")
+    if start_day > end_day:
+        raise ValueError("start must not be after end")
+    if (end_day - start_day).days + 1 > get_max_range_days():
+        raise ValueError(f"Range is limited to {get_max_range_days()} days")
+
+    segment_filter = "AND c.segment = :segment" if segment is not None else ""
+    params = {'start_day': start_day, 'end_day': end_day, 'segment': segment}
+    period = ANALYTICS_INTERVALS[interval]
+
+    groups: Dict[Tuple[str, str], _SegmentPeriod] = defaultdict(_SegmentPeriod)
+    result = db.connection().execution_options(stream_results=True, yield_per=SKETCH_STREAM_BATCH_SIZE).execute(
+        text(SEGMENT_SKETCHES_SQL.format(period=period, segment_filter=segment_filter)), params
+    )
+    for segment_name, period_name, *sketches in result:
+        groups[(segment_name, period_name)].add(*sketches)
+
+    login_days: Dict[Tuple[str, str], Dict[int, int]] = defaultdict(dict)
+    for segment_name, period_name, days, customers in db.execute(
+            text(SEGMENT_LOGIN_DAYS_SQL.format(period=period, segment_filter=segment_filter)), params):
+        login_days[(segment_name, period_name)][days] = customers
+    segment_sizes = dict(db.execute(text(SEGMENT_SIZES_SQL.format(segment_filter=segment_filter)), params).fetchall())
+
+    results = []
+    for key in sorted(set(groups) | set(login_days)):
+        segment_name, period_name = key
+        group = groups.get(key) or _SegmentPeriod()
+        histogram = dict(login_days.get(key, {}))
+        active_customers = sum(histogram.values())
+        inactive_customers = segment_sizes.get(segment_name, 0) - active_customers
+        if inactive_customers > 0:
+            histogram[0] = histogram.get(0, 0) + inactive_customers
+        response_times = group.response_times
+        results.append({
+            'segment': segment_name,
+            'period': period_name,
+            'customers': segment_sizes.get(segment_name, 0),
+            'active_customers': active_customers,
+            'api_calls': group.api_calls,
+            'response_time_ms': {
+                'count': response_times.count,
+                'avg': _round(response_times.mean()),
+                'p50': _round(response_times.quantile(0.5)),
+                'p95': _round(response_times.quantile(0.95)),
+                'p99': _round(response_times.quantile(0.99)),
+                'max': response_times.max if response_times.count else None
+            },
+            'distinct_endpoints': round(group.endpoints.estimate()),
+            'distinct_features': round(group.features.estimate()),
+            'login_days': _login_day_summary(histogram)
+        })
+
+    return {
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'interval': interval,
+        'error_bounds': ERROR_BOUNDS,
+        'groups': results
+    }
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.services.segment_analytics",
+                                     description="Maintain and query customer-day sketches")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Rebuild customer_daily_sketches from raw events")
+    target = rebuild.add_mutually_exclusive_group(required=True)
+    target.add_argument("--customer-id", action="append", help="Customer to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="Rebuild every customer")
+    rebuild.add_argument("--start", type=date.fromisoformat, help="First day to rebuild (default: all)")
+    rebuild.add_argument("--end", type=date.fromisoformat, help="Last day to rebuild (default: all)")
+    report = subparsers.add_parser("report", help="Print segment analytics as JSON")
+    report.add_argument("--start", type=date.fromisoformat, required=True)
+    report.add_argument("--end", type=date.fromisoformat, required=True)
+    report.add_argument("--interval", choices=list(ANALYTICS_INTERVALS), default="month")
+    report.add_argument("--segment")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            if args.all:
+                customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers ORDER BY id"))]
+            else:
+                customer_ids = args.customer_id
+            written = 0
+            for offset in range(0, len(customer_ids), REBUILD_COMMIT_CUSTOMERS):
+                db.execute(text("SET LOCAL statement_timeout = 0"))
+                written += rebuild_segment_sketches(db, customer_ids[offset:offset + REBUILD_COMMIT_CUSTOMERS],
+                                                    args.start, args.end)
+                db.commit()
+            print(json.dumps({"customer_days": written}))
+        else:
+            print(json.dumps(get_segment_analytics(db, args.start, args.end, args.interval, args.segment), indent=2))
+    finally:
+        db.close()
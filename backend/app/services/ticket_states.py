@@ -0,0 +1,214 @@
+"""
+Ticket State Service
+
+Maintains ticket_states, one row per (customer, support ticket) with when it
+was opened and resolved, its priority, resolution type and satisfaction score.
+Rows are recomputed from the ticket's events after a support_ticket_created
+or support_ticket_resolved event is ingested (queued by
+apply_event_side_effects, see services/derived_state.py), using the
+idx_events_ticket index, so the support factor reads ticket states instead of
+grouping every support event by ticket.
+
+A ticket opened more than once keeps its first opening and priority; a ticket
+resolved more than once keeps its latest resolution, unless it was reopened
+after it, in which case it is open. Support events without a ticket_id are
+ignored.
+
+Engines that score from memory (rollup, vectorized, history) load the states
+with load_ticket_states and apply the SUPPORT_METRICS_SQL window rules with
+support_metrics_from_states, so every engine counts tickets the same way.
+
+Events written without going through the API or loader (for example a raw
+COPY) can be folded in with:
+
+    python -m app.services.ticket_states --customer-id cust_001
+    python -m app.services.ticket_states --all
+"""
+import argparse
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+TICKET_EVENT_TYPES = ('support_ticket_created', 'support_ticket_resolved')
+
+# Rebuilds the state of every ticket in {keys} (customer_id, ticket_id) from its events
+REFRESH_TICKETS_SQL = """
+    WITH ticket_events AS (
+        SELECT
+            k.customer_id,
+            k.ticket_id,
+            MIN(e.ts) FILTER (WHERE e.event_type = 'support_ticket_created') as opened_at,
+            MAX(e.ts) FILTER (WHERE e.event_type = 'support_ticket_created') as last_opened_at,
+            MAX(e.ts) FILTER (WHERE e.event_type = 'support_ticket_resolved') as resolved_at,
+            (array_agg(e.priority ORDER BY e.ts)
+                FILTER (WHERE e.event_type = 'support_ticket_created'))[1] as priority,
+            (array_agg(e.resolution_type ORDER BY e.ts DESC)
+                FILTER (WHERE e.event_type = 'support_ticket_resolved'))[1] as resolution_type,
+            (array_agg(e.satisfaction_score ORDER BY e.ts DESC)
+                FILTER (WHERE e.event_type = 'support_ticket_resolved'))[1] as satisfaction_score
+        FROM ({keys}) k
+        JOIN events e
+          ON e.customer_id = k.customer_id
+         AND e.ticket_id = k.ticket_id
+         AND e.event_type IN ('support_ticket_created', 'support_ticket_resolved')
+        GROUP BY k.customer_id, k.ticket_id
+    )
+    INSERT INTO ticket_states (
+        customer_id, ticket_id, opened_at, resolved_at, priority,
+        resolution_type, satisfaction_score, updated_at
+    )
+    SELECT
+        customer_id,
+        ticket_id,
+        opened_at,
+        -- Reopened after its last resolution: open again
+        CASE WHEN last_opened_at IS NULL OR resolved_at >= last_opened_at THEN resolved_at END,
+        priority,
+        resolution_type,
+        satisfaction_score,
+        NOW()
+    FROM ticket_events
+    ON CONFLICT (customer_id, ticket_id) DO UPDATE SET
+        opened_at = EXCLUDED.opened_at,
+        resolved_at = EXCLUDED.resolved_at,
+        priority = EXCLUDED.priority,
+        resolution_type = EXCLUDED.resolution_type,
+        satisfaction_score = EXCLUDED.satisfaction_score,
+        updated_at = EXCLUDED.updated_at
+"""
+
+TOUCHED_TICKETS = """
+    SELECT DISTINCT customer_id, ticket_id
+    FROM unnest(CAST(:customer_ids AS text[]), CAST(:ticket_ids AS text[])) AS t(customer_id, ticket_id)
+"""
+
+# One transaction-scoped advisory lock per ticket, taken in the order the keys are passed
+# (sorted by the caller) so concurrent ingests cannot deadlock on each other
+LOCK_TICKETS_SQL = """
+    SELECT pg_advisory_xact_lock(hashtext('ticket_states:' || customer_id || ':' || ticket_id))
+    FROM (
+        SELECT customer_id, ticket_id
+        FROM unnest(CAST(:customer_ids AS text[]), CAST(:ticket_ids AS text[]))
+             WITH ORDINALITY AS t(customer_id, ticket_id, position)
+        ORDER BY position
+    ) touched
+"""
+
+CUSTOMER_TICKETS = """
+    SELECT DISTINCT customer_id, ticket_id
+    FROM events
+    WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+      AND ticket_id IS NOT NULL
+      {customer_filter}
+"""
+
+
+# Timestamps as epoch microseconds, so windows resolved by Postgres compare exactly
+LOAD_STATES_SQL = """
+    SELECT
+        customer_id,
+        (EXTRACT(EPOCH FROM opened_at) * 1000000)::bigint as opened_us,
+        (EXTRACT(EPOCH FROM resolved_at) * 1000000)::bigint as resolved_us,
+        COALESCE(priority IN ('high', 'critical'), false) as high_priority,
+        COALESCE(resolution_type = 'escalated', false) as escalated,
+        satisfaction_score
+    FROM ticket_states
+    WHERE (resolved_at IS NULL OR resolved_at >= :since)
+      {customer_filter}
+"""
+
+
+def ticket_keys(events: Iterable[Any]) -> Set[Tuple[str, str]]:
+    """(customer_id, ticket_id) of the support ticket events among Event rows or event dicts."""
+    keys = set()
+    for event in events:
+        if isinstance(event, dict):
+            event_type, ticket_id = event["event_type"], event.get("ticket_id")
+            customer_id = event["customer_id"]
+        else:
+            event_type, ticket_id, customer_id = event.event_type, event.ticket_id, event.customer_id
+        if event_type in TICKET_EVENT_TYPES and ticket_id is not None:
+            keys.add((customer_id, ticket_id))
+    return keys
+
+
+def refresh_ticket_states(db: Session, keys: Iterable[Tuple[str, str]]) -> None:
+    """
+    Recompute the states of the given (customer_id, ticket_id) pairs from events.
+
+    Refreshing a ticket is idempotent. Each ticket is locked until commit before it is
+    recomputed, so a concurrent refresh of the same ticket waits and then recomputes
+    with this transaction's writes visible (otherwise the later upsert could overwrite
+    the state with an older view of its events).
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    params = {
+        'customer_ids': [customer_id for customer_id, _ in keys],
+        'ticket_ids': [ticket_id for _, ticket_id in keys]
+    }
+    db.execute(text(LOCK_TICKETS_SQL), params)
+    db.execute(text(REFRESH_TICKETS_SQL.format(keys=TOUCHED_TICKETS)), params)
+
+
+def load_ticket_states(db: Session, customer_ids: Optional[List[str]], since: datetime) -> List[Any]:
+    """Ticket states of the given customers (all if None) that can count in a window starting at or after since."""
+    customer_filter = "AND customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    return db.execute(text(LOAD_STATES_SQL.format(customer_filter=customer_filter)), {
+        'since': since,
+        'customer_ids': customer_ids
+    }).fetchall()
+
+
+def support_metrics_from_states(states: Iterable[Any], start_us: int, end_us: int) -> tuple:
+    """
+    SUPPORT_METRICS_SQL over one customer's load_ticket_states rows, for the window
+    [start_us, end_us] in epoch microseconds. Column order matches support_ticket_from_metrics.
+    """
+    created = resolved = escalated = high_priority = open_tickets = 0
+    satisfaction: List[float] = []
+    for state in states:
+        opened_us, resolved_us = state.opened_us, state.resolved_us
+        if opened_us is not None and start_us <= opened_us <= end_us:
+            created += 1
+            high_priority += bool(state.high_priority)
+        if resolved_us is not None and start_us <= resolved_us <= end_us:
+            resolved += 1
+            escalated += bool(state.escalated)
+            if state.satisfaction_score is not None:
+                satisfaction.append(state.satisfaction_score)
+        # Opened by the end of the window (possibly before it) and not resolved by then
+        if opened_us is not None and opened_us <= end_us and (resolved_us is None or resolved_us > end_us):
+            open_tickets += 1
+    avg_satisfaction = sum(satisfaction) / len(satisfaction) if satisfaction else None
+    return created, resolved, escalated, high_priority, avg_satisfaction, open_tickets
+
+
+def rebuild_ticket_states(db: Session, customer_ids: Optional[List[str]] = None) -> None:
+    """Rebuild every ticket state of the given customers (all customers if None), e.g. after a bulk load."""
+    customer_filter = "AND customer_id = ANY(:customer_ids)" if customer_ids is not None else ""
+    params = {'customer_ids': customer_ids}
+    db.execute(text(f"DELETE FROM ticket_states WHERE true {customer_filter}"), params)
+    keys = CUSTOMER_TICKETS.format(customer_filter=customer_filter)
+    db.execute(text(REFRESH_TICKETS_SQL.format(keys=keys)), params)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild ticket_states from raw events")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--customer-id", action="append", help="Customer to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="Rebuild every customer")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        rebuild_ticket_states(db, None if args.all else args.customer_id)
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,330 @@
+"""
+Vectorized Health Scoring Engine
+
+Loads the events the login, feature and API factors read, plus the customers'
+ticket_states and invoice_ledger rows, into columnar NumPy arrays (customer
+index, epoch microseconds, day number, event-type code, key code and typed
+metadata columns) and computes every factor for every customer at once with
+bincount/unique group-bys. Arrays are loaded once per time range and can be
+scored for any number of windows inside it, which is what what-if analysis and
+backfills need.
+
+Results match calculate_customer_health_score (tests/test_engine_parity.py):
+support and payment apply the SUPPORT_METRICS_SQL / PAYMENT_METRICS_SQL rules to
+the same derived tables, and window bounds and day buckets are resolved by
+Postgres so timezone handling is identical.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .health_scoring import (
+    api_usage_from_metrics,
+    build_health_score,
+    feature_adoption_from_metrics,
+    get_health_weights,
+    get_period_dates,
+    login_frequency_from_metrics,
+    payment_timeliness_from_metrics,
+    support_ticket_from_metrics,
+    to_epoch_us,
+)
+from .invoice_ledger import load_invoice_ledger
+from .ticket_states import load_ticket_states
+
+# Support and payment are read from ticket_states and invoice_ledger instead
+EVENT_TYPES = (
+    'user_login',
+    'feature_onboarded',
+    'feature_used',
+    'api_call',
+    'api_rate_limit_exceeded',
+)
+EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+LOGIN, ONBOARDED, FEATURE_USED, API_CALL, RATE_LIMIT = range(len(EVENT_TYPES))
+
+PAYMENT_STATUSES = ('unpaid', 'on_time_or_early', 'late_acceptable', 'late_concerning')
+
+LOAD_EVENTS_SQL = """
+    SELECT
+        customer_id,
+        (EXTRACT(EPOCH FROM ts) * 1000000)::bigint as ts_us,
+        DATE(ts) - DATE '1970-01-01' as day_number,
+        event_type,
+        CASE
+            WHEN event_type IN ('feature_onboarded', 'feature_used') THEN feature_name
+            WHEN event_type = 'api_call' THEN endpoint
+        END as key,
+        CASE WHEN event_type = 'feature_onboarded'
+             THEN completion_percentage END as completion_percentage,
+        CASE WHEN event_type = 'api_call'
+             THEN response_code END as response_code,
+        CASE WHEN event_type = 'api_call'
+             THEN response_time_ms END as response_time_ms
+    FROM events
+    WHERE event_type = ANY(:event_types)
+      AND ts >= :range_start
+      AND ts <= :range_end
+      {customer_filter}
+"""
+
+
+@dataclass
+class TicketArrays:
+    """Columnar ticket_states rows; one array element per ticket."""
+    cust: np.ndarray              # int64 index into customer_ids
+    opened_us: np.ndarray         # float64 epoch microseconds, NaN when NULL
+    resolved_us: np.ndarray
+    high_priority: np.ndarray     # bool
+    escalated: np.ndarray
+    satisfaction: np.ndarray      # float64, NaN when NULL
+
+
+@dataclass
+class InvoiceArrays:
+    """Columnar invoice_ledger rows; one array element per invoice."""
+    cust: np.ndarray              # int64 index into customer_ids
+    issued_us: np.ndarray         # float64 epoch microseconds
+    status: np.ndarray            # int8 index into PAYMENT_STATUSES, -1 for NULL
+    failures: np.ndarray          # int64
+    days_early_late: np.ndarray   # float64, NaN when NULL
+    amount: np.ndarray
+
+
+@dataclass
+class EventArrays:
+    """Columnar events for a set of customers; one array element per event."""
+    customer_ids: List[str]
+    cust: np.ndarray              # int64 index into customer_ids
+    ts_us: np.ndarray             # int64 epoch microseconds
+    day: np.ndarray               # int64 day number in the database session timezone
+    etype: np.ndarray             # int8 code from EVENT_TYPES
+    key: np.ndarray               # int64 code of feature/endpoint, -1 for NULL
+    completion: np.ndarray        # float64, NaN when NULL
+    response_code: np.ndarray
+    response_time: np.ndarray
+    tickets: TicketArrays
+    invoices: InvoiceArrays
+
+
+def _float_column(values) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _load_ticket_arrays(db: Session, customer_ids: Optional[List[str]], customer_index: Dict[str, int],
+                        range_start: datetime) -> TicketArrays:
+    rows = [row for row in load_ticket_states(db, customer_ids, range_start) if row.customer_id in customer_index]
+    return TicketArrays(
+        cust=np.array([customer_index[row.customer_id] for row in rows], dtype=np.int64),
+        opened_us=_float_column(row.opened_us for row in rows),
+        resolved_us=_float_column(row.resolved_us for row in rows),
+        high_priority=np.array([row.high_priority for row in rows], dtype=bool),
+        escalated=np.array([row.escalated for row in rows], dtype=bool),
+        satisfaction=_float_column(row.satisfaction_score for row in rows),
+    )
+
+
+def _load_invoice_arrays(db: Session, customer_ids: Optional[List[str]], customer_index: Dict[str, int],
+                         range_start: datetime, range_end: datetime) -> InvoiceArrays:
+    rows = [row for row in load_invoice_ledger(db, customer_ids, range_start, range_end)
+            if row.customer_id in customer_index]
+    status_codes = {status: code for code, status in enumerate(PAYMENT_STATUSES)}
+    return InvoiceArrays(
+        cust=np.array([customer_index[row.customer_id] for row in rows], dtype=np.int64),
+        issued_us=_float_column(row.issued_us for row in rows),
+        status=np.array([status_codes.get(row.status, -1) for row in rows], dtype=np.int8),
+        failures=np.array([row.failure_count for row in rows], dtype=np.int64),
+        days_early_late=_float_column(row.days_early_late for row in rows),
+        amount=_float_column(row.amount_usd for row in rows),
+    )
+
+
+def load_event_arrays(db: Session, customer_ids: Optional[List[str]],
+                      range_start: datetime, range_end: datetime) -> EventArrays:
+    """Load every event, ticket state and invoice the factors need between range_start and range_end."""
+    if customer_ids is None:
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers")).fetchall()]
+        customer_filter = ""
+    else:
+        customer_ids = list(customer_ids)
+        customer_filter = "AND customer_id = ANY(:customer_ids)"
+
+    rows = db.execute(text(LOAD_EVENTS_SQL.format(customer_filter=customer_filter)), {
+        'event_types': list(EVENT_TYPES),
+        'range_start': range_start,
+        'range_end': range_end,
+        'customer_ids': customer_ids
+    }).fetchall()
+
+    customer_index = {customer_id: i for i, customer_id in enumerate(customer_ids)}
+    rows = [row for row in rows if row[0] in customer_index]
+    columns = list(zip(*rows)) if rows else [()] * 8
+
+    # Key strings become integer codes so group-bys stay numeric; NULL keys get -1
+    key = np.full(len(rows), -1, dtype=np.int64)
+    present = np.array([k is not None for k in columns[4]], dtype=bool)
+    if present.any():
+        _, codes = np.unique(np.array([k for k in columns[4] if k is not None], dtype=object),
+                             return_inverse=True)
+        key[present] = codes
+
+    return EventArrays(
+        customer_ids=customer_ids,
+        cust=np.array([customer_index[c] for c in columns[0]], dtype=np.int64),
+        ts_us=np.array(columns[1], dtype=np.int64),
+        day=np.array(columns[2], dtype=np.int64),
+        etype=np.array([EVENT_CODES[t] for t in columns[3]], dtype=np.int8),
+        key=key,
+        completion=_float_column(columns[5]),
+        response_code=_float_column(columns[6]),
+        response_time=_float_column(columns[7]),
+        tickets=_load_ticket_arrays(db, customer_ids, customer_index, range_start),
+        invoices=_load_invoice_arrays(db, customer_ids, customer_index, range_start, range_end),
+    )
+
+
+# GROUP-BY HELPERS (one output slot per customer)
+def _count(cust: np.ndarray, mask: np.ndarray, n: int) -> np.ndarray:
+    return np.bincount(cust[mask], minlength=n)
+
+
+def _sum(cust: np.ndarray, mask: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    return np.bincount(cust[mask], weights=values[mask], minlength=n)
+
+
+def _distinct(cust: np.ndarray, codes: np.ndarray, mask: np.ndarray, n: int) -> np.ndarray:
+    """COUNT(DISTINCT code) per customer over rows in mask (codes must be >= 0)."""
+    if not mask.any():
+        return np.zeros(n, dtype=np.int64)
+    width = int(codes[mask].max()) + 1
+    pairs = np.unique(cust[mask] * width + codes[mask])
+    return np.bincount(pairs // width, minlength=n)
+
+
+def _mean_or_none(total: float, count: int) -> Optional[float]:
+    return float(total) / int(count) if count else None
+
+
+def _support_metrics(t: TicketArrays, start_us: int, end_us: int, n: int) -> List[tuple]:
+    """Vectorized form of SUPPORT_METRICS_SQL over ticket states (NaN timestamps compare false)."""
+    with np.errstate(invalid='ignore'):
+        opened = (t.opened_us >= start_us) & (t.opened_us <= end_us)
+        resolved = (t.resolved_us >= start_us) & (t.resolved_us <= end_us)
+        # Opened by the end of the window (possibly before it) and not resolved by then
+        still_open = (t.opened_us <= end_us) & ~(t.resolved_us <= end_us)
+    rated = resolved & ~np.isnan(t.satisfaction)
+
+    created = _count(t.cust, opened, n)
+    resolved_count = _count(t.cust, resolved, n)
+    escalated = _count(t.cust, resolved & t.escalated, n)
+    high_priority = _count(t.cust, opened & t.high_priority, n)
+    satisfaction_sum = _sum(t.cust, rated, np.nan_to_num(t.satisfaction), n)
+    satisfaction_count = _count(t.cust, rated, n)
+    open_tickets = _count(t.cust, still_open, n)
+    return [
+        (int(created[i]), int(resolved_count[i]), int(escalated[i]), int(high_priority[i]),
+         _mean_or_none(satisfaction_sum[i], satisfaction_count[i]), int(open_tickets[i]))
+        for i in range(n)
+    ]
+
+
+def _payment_metrics(inv: InvoiceArrays, start_us: int, end_us: int, n: int) -> List[tuple]:
+    """Vectorized form of PAYMENT_METRICS_SQL over invoice ledger rows."""
+    issued = (inv.issued_us >= start_us) & (inv.issued_us <= end_us)
+    unpaid = issued & (inv.status == 0)
+    has_delay = issued & ~np.isnan(inv.days_early_late)
+    # SUM skips NULL amounts and is NULL when every amount is
+    summed = issued & ~(unpaid & np.isnan(inv.amount))
+
+    total = _count(inv.cust, issued, n)
+    status_counts = [_count(inv.cust, issued & (inv.status == code), n) for code in range(len(PAYMENT_STATUSES))]
+    failures = _sum(inv.cust, issued, inv.failures.astype(np.float64), n)
+    delay_sum = _sum(inv.cust, has_delay, np.nan_to_num(inv.days_early_late), n)
+    delay_count = _count(inv.cust, has_delay, n)
+    unpaid_amount = _sum(inv.cust, unpaid, np.nan_to_num(inv.amount), n)
+    summed_count = _count(inv.cust, summed, n)
+
+    return [
+        (int(total[i]), *(int(counts[i]) for counts in status_counts),
+         int(failures[i]) if total[i] else None, _mean_or_none(delay_sum[i], delay_count[i]),
+         float(unpaid_amount[i]) if summed_count[i] else None)
+        for i in range(n)
+    ]
+
+
+def compute_health_scores(db: Session, arrays: EventArrays, period_start: datetime, period_end: datetime,
+                          weights: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+    """Score every customer in arrays for one window; same structure as calculate_bulk_health_scores."""
+    a = arrays
+    n = len(a.customer_ids)
+    start_us, end_us, previous_us = to_epoch_us(
+        db, [period_start, period_end, period_start - (period_end - period_start)]
+    )
+
+    in_window = (a.ts_us >= start_us) & (a.ts_us <= end_us)
+    in_previous = (a.ts_us >= previous_us) & (a.ts_us < start_us)
+    is_type = {code: (a.etype == code) for code in range(len(EVENT_TYPES))}
+    day_codes = a.day - (a.day.min() if a.day.size else 0)
+    has_key = a.key >= 0
+
+    # 1. Login frequency
+    login_days = _distinct(a.cust, day_codes, is_type[LOGIN] & in_window, n)
+
+    # 2. Feature adoption
+    onboarded = _distinct(a.cust, a.key, is_type[ONBOARDED] & in_window & (a.completion == 100) & has_key, n)
+    used_mask = is_type[FEATURE_USED] & in_window
+    features_used = _distinct(a.cust, a.key, used_mask & has_key, n)
+    feature_usage = _count(a.cust, used_mask, n)
+
+    # 3. Support tickets
+    support_rows = _support_metrics(a.tickets, start_us, end_us, n)
+
+    # 4. Payment timeliness
+    payment_rows = _payment_metrics(a.invoices, start_us, end_us, n)
+
+    # 5. API usage
+    api_mask = is_type[API_CALL] & in_window
+    api_calls = _count(a.cust, api_mask, n)
+    rate_limits = _count(a.cust, is_type[RATE_LIMIT] & in_window, n)
+    api_days = _distinct(a.cust, day_codes, (is_type[API_CALL] | is_type[RATE_LIMIT]) & in_window, n)
+    successes = _count(a.cust, api_mask & (a.response_code >= 200) & (a.response_code <= 299), n)
+    timed = api_mask & ~np.isnan(a.response_time)
+    response_sum = _sum(a.cust, timed, np.nan_to_num(a.response_time), n)
+    response_count = _count(a.cust, timed, n)
+    endpoints = _distinct(a.cust, a.key, api_mask & has_key, n)
+    previous_calls = _count(a.cust, is_type[API_CALL] & in_previous, n)
+
+    if weights is None:
+        weights = get_health_weights()
+    results = {}
+    for i, customer_id in enumerate(a.customer_ids):
+        login_data = login_frequency_from_metrics(int(login_days[i]), period_start, period_end)
+        feature_data = feature_adoption_from_metrics(int(onboarded[i]), int(features_used[i]), int(feature_usage[i]))
+        support_data = support_ticket_from_metrics(*support_rows[i])
+        payment_data = payment_timeliness_from_metrics(*payment_rows[i])
+        api_data = api_usage_from_metrics(
+            int(api_calls[i]), int(rate_limits[i]), int(api_days[i]),
+            float(successes[i]) / int(api_calls[i]) * 100 if api_calls[i] else None,
+            _mean_or_none(response_sum[i], response_count[i]),
+            int(endpoints[i]), int(previous_calls[i]),
+            period_start=period_start, period_end=period_end
+        )
+        results[customer_id] = build_health_score(login_data, feature_data, support_data,
+                                                  payment_data, api_data, weights)
+    return results
+
+
+def calculate_vectorized_health_scores(db: Session, customer_ids: Optional[List[str]] = None,
+                                       period_start: Optional[datetime] = None,
+                                       period_end: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Load arrays for one window and score it; same structure as calculate_bulk_health_scores."""
+    if period_start is None or period_end is None:
+        period_start, period_end = get_period_dates(30)
+    arrays = load_event_arrays(db, customer_ids, period_start - (period_end - period_start), period_end)
+    if not arrays.customer_ids:
+        return {}
+    return compute_health_scores(db, arrays, period_start, period_end)
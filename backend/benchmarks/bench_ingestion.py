@@ -0,0 +1,119 @@
+"""
+Event ingestion benchmark
+
+Measures sustained events/sec for the bulk ingestion path, either directly
+against the database (ingest_events) or over HTTP (/api/events/batch or
+/api/events/ndjson). Run directly, it then also times applying the derived
+rows the events queued, which the health score worker does after ingest. Run
+from the backend directory:
+
+    python -m benchmarks.bench_ingestion --events 200000 --batch-size 10000
+    python -m benchmarks.bench_ingestion --url http://localhost:8000 --mode ndjson
+"""
+import argparse
+import json
+import random
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services.derived_state import apply_pending_derived_state
+from app.services.ingestion import ingest_events
+
+EVENT_TYPES = ["api_call", "api_call", "api_call", "user_login", "feature_used"]
+ENDPOINTS = ["/v1/orders", "/v1/customers", "/v1/invoices", "/v1/reports", "/v1/search"]
+FEATURES = ["reports", "dashboards", "alerts", "exports", "integrations", "workflows", "sso", "audit_log"]
+
+
+def make_events(customer_ids: List[str], count: int, start: datetime) -> List[Dict[str, Any]]:
+    events = []
+    for _ in range(count):
+        event_type = random.choice(EVENT_TYPES)
+        if event_type == "api_call":
+            metadata = {
+                "endpoint": random.choice(ENDPOINTS),
+                "response_code": random.choice([200, 200, 200, 201, 404, 500]),
+                "response_time_ms": random.randint(20, 900)
+            }
+        elif event_type == "feature_used":
+            metadata = {"feature_name": random.choice(FEATURES)}
+        else:
+            metadata = {}
+        events.append({
+            "customer_id": random.choice(customer_ids),
+            "event_type": event_type,
+            "ts": (start + timedelta(seconds=random.randint(0, 30 * 86400))).isoformat(),
+            "metadata": metadata
+        })
+    return events
+
+
+def post_json(url: str, body: bytes, content_type: str) -> Dict[str, Any]:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--method", choices=["copy", "insert"], default="copy")
+    parser.add_argument("--url", help="API base URL; benchmarks the service directly when omitted")
+    parser.add_argument("--mode", choices=["batch", "ndjson"], default="batch")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    db = SessionLocal()
+    try:
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers")).fetchall()]
+        if not customer_ids:
+            raise SystemExit("No customers found; load customers before benchmarking ingestion")
+
+        start = datetime(2024, 9, 1)
+        inserted = 0
+        elapsed = 0.0
+        for offset in range(0, args.events, args.batch_size):
+            batch = make_events(customer_ids, min(args.batch_size, args.events - offset), start)
+            began = time.perf_counter()
+            if args.url and args.mode == "ndjson":
+                body = "\n".join(json.dumps(event) for event in batch).encode()
+                result = post_json(f"{args.url}/api/events/ndjson?method={args.method}", body, "application/x-ndjson")
+            elif args.url:
+                body = json.dumps({"events": batch}).encode()
+                result = post_json(f"{args.url}/api/events/batch?method={args.method}", body, "application/json")
+            else:
+                result = ingest_events(db, batch, method=args.method)
+            elapsed += time.perf_counter() - began
+            inserted += result["inserted"]
+
+        derived_rows = derived_elapsed = None
+        if not args.url:
+            began = time.perf_counter()
+            derived_rows = apply_pending_derived_state(db, limit=None)
+            db.commit()
+            derived_elapsed = time.perf_counter() - began
+    finally:
+        db.close()
+
+    print(json.dumps({
+        "benchmark": "ingestion",
+        "target": args.url or "service",
+        "mode": args.mode if args.url else "direct",
+        "method": args.method,
+        "batch_size": args.batch_size,
+        "events": inserted,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(inserted / elapsed, 1) if elapsed else None,
+        "derived_rows": derived_rows,
+        "derived_seconds": round(derived_elapsed, 3) if derived_elapsed is not None else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Segment sketch accuracy check
+
+Computes the segment figures exactly from raw events (COUNT(DISTINCT ...) and
+percentile_disc per segment over the range) and from the merged daily
+sketches, prints both timings and the relative error of every figure, and
+exits non-zero if an error exceeds its bound (1% for percentiles, three
+standard errors for distinct counts). Run from the backend directory after
+`python -m app.services.segment_analytics rebuild --all`:
+
+    python -m benchmarks.check_segment_sketches
+    python -m benchmarks.check_segment_sketches --start 2024-07-01 --end 2024-09-30
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services.health_scoring import get_period_dates
+from app.services.segment_analytics import ERROR_BOUNDS, get_segment_analytics
+
+EXACT_SEGMENT_SQL = text("""
+    SELECT
+        c.segment,
+        COUNT(DISTINCT e.endpoint) FILTER (WHERE e.event_type = 'api_call') as distinct_endpoints,
+        COUNT(DISTINCT e.feature_name) FILTER (WHERE e.event_type = 'feature_used') as distinct_features,
+        percentile_disc(0.5) WITHIN GROUP (ORDER BY e.response_time_ms)
+            FILTER (WHERE e.event_type = 'api_call') as p50,
+        percentile_disc(0.95) WITHIN GROUP (ORDER BY e.response_time_ms)
+            FILTER (WHERE e.event_type = 'api_call') as p95,
+        percentile_disc(0.99) WITHIN GROUP (ORDER BY e.response_time_ms)
+            FILTER (WHERE e.event_type = 'api_call') as p99
+    FROM events e
+    JOIN customers c ON c.id = e.customer_id
+    WHERE e.ts >= :start_day AND e.ts < :end_exclusive
+      AND e.event_type IN ('api_call', 'feature_used')
+    GROUP BY c.segment
+""")
+
+
+def relative_error(expected, actual):
+    if expected is None or actual is None:
+        return 0.0 if expected == actual else None
+    if expected == 0:
+        return 0.0 if actual == 0 else None
+    return abs(actual - expected) / abs(expected)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare segment sketches against exact event queries")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    end_day = args.end or get_period_dates(30)[1].date()
+    start_day = args.start or end_day - timedelta(days=89)
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        start = time.perf_counter()
+        exact_rows = db.execute(EXACT_SEGMENT_SQL, {
+            'start_day': start_day, 'end_exclusive': end_day + timedelta(days=1)
+        }).fetchall()
+        exact_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = get_segment_analytics(db, start_day, end_day, 'total')
+        sketch_seconds = time.perf_counter() - start
+    finally:
+        db.close()
+
+    sketched = {group['segment']: group for group in report['groups']}
+    # Percentiles may also be off by 1 ms, for integer response times near zero
+    percentile_bound = ERROR_BOUNDS['response_time_percentiles_relative_error']
+    distinct_bound = 3 * ERROR_BOUNDS['distinct_counts_relative_standard_error']
+    segments, failures = {}, []
+    for segment, distinct_endpoints, distinct_features, p50, p95, p99 in exact_rows:
+        group = sketched.get(segment, {'response_time_ms': {}})
+        figures = {
+            'distinct_endpoints': (distinct_endpoints, group.get('distinct_endpoints'), distinct_bound),
+            'distinct_features': (distinct_features, group.get('distinct_features'), distinct_bound),
+            'p50': (p50, group['response_time_ms'].get('p50'), percentile_bound),
+            'p95': (p95, group['response_time_ms'].get('p95'), percentile_bound),
+            'p99': (p99, group['response_time_ms'].get('p99'), percentile_bound)
+        }
+        segments[segment] = {}
+        for name, (expected, actual, bound) in figures.items():
+            error = relative_error(expected, actual)
+            within = error is not None and (error <= bound or (name.startswith('p') and abs(actual - expected) <= 1))
+            segments[segment][name] = {'exact': expected, 'sketch': actual,
+                                       'relative_error': round(error, 5) if error is not None else None}
+            if not within:
+                failures.append(f"{segment}.{name}")
+
+    json.dump({
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
+        "exact_seconds": round(exact_seconds, 3),
+        "sketch_seconds": round(sketch_seconds, 3),
+        "segments": segments,
+        "out_of_bounds": failures
+    }, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
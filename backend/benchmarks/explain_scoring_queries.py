@@ -0,0 +1,161 @@
+"""
+Scoring query plan check
+
+Runs EXPLAIN on every per-customer scoring query for a real customer and fails
+if any of them reads the events table (or the invoice ledger or ticket states)
+with a sequential scan or through an index other than the ones tuned for it
+(EXPECTED_INDEXES), i.e. if the indexes from migrations 0002/0004/0006/0007
+stopped being used. Run from the backend directory after `alembic upgrade head`
+and loading data (tiny tables are always seq scanned, so use a realistically
+sized database):
+
+    python -m benchmarks.explain_scoring_queries
+    python -m benchmarks.explain_scoring_queries --customer-id cust_001 --verbose
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.db.partitions import DEFAULT_PARTITION, PARTITION_NAME
+from app.services.health_scoring import (
+    API_GROWTH_SQL,
+    API_METRICS_SQL,
+    COMBINED_METRICS_SQL,
+    FEATURE_METRICS_SQL,
+    LOGIN_DAYS_SQL,
+    PAYMENT_METRICS_SQL,
+    SUPPORT_METRICS_SQL,
+    get_period_dates,
+)
+
+SCORING_QUERIES = {
+    'login_days': LOGIN_DAYS_SQL,
+    'feature_metrics': FEATURE_METRICS_SQL,
+    'support_metrics': SUPPORT_METRICS_SQL,
+    'payment_metrics': PAYMENT_METRICS_SQL,
+    'api_metrics': API_METRICS_SQL,
+    'api_growth': API_GROWTH_SQL,
+    'combined_metrics': COMBINED_METRICS_SQL,
+}
+INDEX_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+
+TICKET_STATE_INDEXES = {'idx_ticket_states_resolved', 'ticket_states_pkey'}
+# Query -> scored table -> indexes that serve it. Where an event type's partial index
+# and (customer_id, event_type, ts) both cover a query the planner may pick either.
+EXPECTED_INDEXES = {
+    'login_days': {'events': {'idx_events_login', 'idx_events_customer_type_ts'}},
+    'feature_metrics': {'events': {'idx_events_feature', 'idx_events_customer_type_ts'}},
+    'support_metrics': {'ticket_states': TICKET_STATE_INDEXES},
+    'payment_metrics': {'invoice_ledger': {'idx_invoice_ledger_issued'}},
+    'api_metrics': {'events': {'idx_events_api', 'idx_events_customer_type_ts'}},
+    'api_growth': {'events': {'idx_events_api', 'idx_events_customer_type_ts'}},
+    # Every event type of the customer in the range
+    'combined_metrics': {
+        'events': {'idx_events_customer_id_ts'},
+        'ticket_states': TICKET_STATE_INDEXES,
+        'invoice_ledger': {'idx_invoice_ledger_issued'},
+    },
+}
+
+# Partition index -> the partitioned index it belongs to
+PARENT_INDEXES_SQL = text("""
+    SELECT child.relname, parent.relname
+    FROM pg_inherits i
+    JOIN pg_class child ON child.oid = i.inhrelid
+    JOIN pg_class parent ON parent.oid = i.inhparent
+    WHERE child.relkind = 'i'
+""")
+SCORED_TABLES = {'events', 'invoice_ledger', 'ticket_states'}
+
+
+def plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def scored_table(relation: str) -> str:
+    """The scored table a relation belongs to (monthly events partitions count as events)."""
+    return 'events' if relation == DEFAULT_PARTITION or PARTITION_NAME.match(relation) else relation
+
+
+def parent_indexes(db) -> Dict[str, str]:
+    """Name of the partitioned index each partition's index belongs to."""
+    return dict(db.execute(PARENT_INDEXES_SQL).fetchall())
+
+
+def table_scans(plan: Dict[str, Any], parents: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Scan nodes that read the scored tables, with the indexes each one used (a bitmap
+    heap scan's come from its bitmap index scans). Partition indexes are reported
+    under the partitioned index they belong to when parents (parent_indexes) is given.
+    """
+    parents = parents or {}
+    scans = []
+    for node in plan_nodes(plan):
+        relation = node.get('Relation Name', '')
+        if scored_table(relation) not in SCORED_TABLES:
+            continue
+        sources = plan_nodes(node) if node['Node Type'] == 'Bitmap Heap Scan' else [node]
+        indexes = {parents.get(source['Index Name'], source['Index Name'])
+                   for source in sources if 'Index Name' in source}
+        scans.append({'node': node['Node Type'], 'table': scored_table(relation), 'relation': relation,
+                      'indexes': sorted(indexes)})
+    return scans
+
+
+def unexpected_scans(name: str, scans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Scans of a SCORING_QUERIES entry that are sequential or use an index not tuned for it."""
+    expected = EXPECTED_INDEXES[name]
+    return [
+        scan for scan in scans
+        if scan['node'] not in INDEX_SCANS or not scan['indexes']
+        or not set(scan['indexes']) <= expected.get(scan['table'], set())
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that scoring queries use index scans")
+    parser.add_argument("--customer-id", help="Customer to plan for (default: the one with the most events)")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan")
+    args = parser.parse_args()
+
+    period_start, period_end = get_period_dates(30)
+    db = SessionLocal()
+    try:
+        customer_id = args.customer_id or db.execute(text("""
+            SELECT customer_id FROM events GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT 1
+        """)).scalar()
+        params = {
+            'customer_id': customer_id,
+            'period_start': period_start,
+            'period_end': period_end,
+            'previous_period_start': period_start - (period_end - period_start)
+        }
+
+        parents = parent_indexes(db)
+        report = {}
+        failures = []
+        for name, query in SCORING_QUERIES.items():
+            plan = db.execute(text("EXPLAIN (FORMAT JSON) " + query.text), params).scalar()
+            plan = plan[0]['Plan'] if isinstance(plan, list) else json.loads(plan)[0]['Plan']
+            scans = table_scans(plan, parents)
+            report[name] = scans
+            if not scans or unexpected_scans(name, scans):
+                failures.append(name)
+            if args.verbose:
+                print(f"-- {name}\n{json.dumps(plan, indent=2)}", file=sys.stderr)
+    finally:
+        db.close()
+
+    json.dump({'customer_id': customer_id, 'queries': report, 'failures': failures}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Synthetic customers/events generator
+
+Writes customers.csv and events.csv in the format app.loader reads. Every event
+type the scoring uses is generated with the metadata the factor queries read:
+tickets are created and (mostly) resolved under the same ticket_id, invoices
+are paid or fail under the same invoice_id, onboarding reports a completion
+percentage, API calls carry endpoint, response code and latency. Each
+customer has a latent health that drives all of them, so the scores spread
+across Healthy, At Risk and Unhealthy.
+
+Output is deterministic for a given seed and scale. Run from the backend
+directory, then load with the resumable loader:
+
+    python -m benchmarks.generate_data --scale small --out-dir /tmp/bench
+    python -m benchmarks.generate_data --customers 5000 --events 2000000 --out-dir /tmp/bench
+    python -m app.loader customers /tmp/bench/customers.csv
+    python -m app.loader events /tmp/bench/events.csv --workers 4
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Named scales: (customers, events)
+SCALES = {
+    'tiny': (1000, 200_000),
+    'small': (1000, 1_000_000),
+    'medium': (10_000, 10_000_000),
+    'large': (100_000, 100_000_000),
+}
+SEGMENTS = (('SMB', 0.5), ('enterprise', 0.3), ('startup', 0.2))
+# Beta(a, b) of the latent health per segment
+SEGMENT_HEALTH = {'SMB': (3.0, 2.0), 'enterprise': (4.0, 1.8), 'startup': (2.2, 2.2)}
+INVOICE_AMOUNTS = {'SMB': (200, 2000), 'enterprise': (5000, 50000), 'startup': (50, 800)}
+FEATURES = ('reports', 'dashboards', 'alerts', 'exports', 'integrations', 'workflows', 'sso', 'audit_log',
+            'api_keys', 'webhooks', 'billing', 'user_roles')
+ENDPOINTS = ('/v1/orders', '/v1/customers', '/v1/invoices', '/v1/reports', '/v1/search', '/v1/users',
+             '/v1/webhooks', '/v1/exports')
+PRIORITIES = ('low', 'medium', 'high', 'critical')
+RESOLUTIONS = ('solved', 'workaround', 'escalated', 'duplicate')
+NAME_PARTS = (
+    ('Bright', 'Cedar', 'North', 'Blue', 'Iron', 'Silver', 'Maple', 'Summit', 'Harbor', 'Atlas', 'Nova', 'Oak'),
+    ('Path', 'Pine', 'Star', 'River', 'Forge', 'Leaf', 'Peak', 'Bridge', 'Field', 'Works', 'Labs', 'Point'),
+    ('Legal', 'Retail', 'Health', 'Logistics', 'Analytics', 'Foods', 'Capital', 'Media', 'Energy', 'Systems'),
+)
+# Share of a customer's free-form event budget by type
+ACTIVITY_MIX = (('api_call', 0.6), ('feature_used', 0.25), ('user_login', 0.15))
+
+
+def _iso(ts: datetime) -> str:
+    return ts.astimezone(timezone.utc).isoformat()
+
+
+def _at(day: date, rng: random.Random) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(seconds=rng.randrange(86400))
+
+
+def make_customer(index: int, rng: random.Random, start: date) -> Dict[str, Any]:
+    segment = rng.choices([s for s, _ in SEGMENTS], [w for _, w in SEGMENTS])[0]
+    name = " ".join(rng.choice(part) for part in NAME_PARTS)
+    created = start - timedelta(days=rng.randrange(30, 720))
+    return {
+        'id': f"c_{index:06d}",
+        'name': f"{name} {index}",
+        'segment': segment,
+        'created_at': _iso(_at(created, rng)),
+    }
+
+
+def customer_events(customer: Dict[str, Any], rng: random.Random, start: date, end: date,
+                    budget: int) -> Iterator[Tuple[str, datetime, Dict[str, Any]]]:
+    """
+    Yield (event_type, ts, metadata) for one customer between start and end
+    (inclusive), roughly budget events in total.
+    """
+    segment = customer['segment']
+    health = rng.betavariate(*SEGMENT_HEALTH[segment])
+    days = (end - start).days + 1
+    day_list = [start + timedelta(days=i) for i in range(days)]
+
+    # Onboarding: healthier customers finish more features
+    onboarded = rng.sample(FEATURES, k=max(1, int(len(FEATURES) * (0.2 + 0.6 * health))))
+    for feature in onboarded:
+        completion = 100 if rng.random() < 0.4 + 0.6 * health else rng.choice((25, 50, 75))
+        yield 'feature_onboarded', _at(rng.choice(day_list), rng), {
+            'feature_name': feature, 'completion_percentage': completion
+        }
+
+    # Monthly invoices with payments, late payments and failures
+    low, high = INVOICE_AMOUNTS[segment]
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        issued = _at(max(month, start), rng)
+        invoice_id = f"inv_{customer['id']}_{month.year:04d}{month.month:02d}"
+        due = (issued + timedelta(days=30)).date()
+        yield 'invoice_generated', issued, {
+            'invoice_id': invoice_id, 'amount_usd': round(rng.uniform(low, high), 2), 'due_date': due.isoformat()
+        }
+        for _ in range(int(rng.random() < (1 - health) * 0.6) + int(rng.random() < (1 - health) * 0.2)):
+            yield 'payment_failed', issued + timedelta(days=rng.randrange(1, 30)), {
+                'invoice_id': invoice_id, 'failure_reason': rng.choice(('card_declined', 'insufficient_funds'))
+            }
+        if rng.random() < 0.55 + 0.45 * health:
+            delay = int(round(rng.gauss(-3 + 15 * (1 - health), 5)))
+            paid = due + timedelta(days=delay)
+            yield 'payment_received', _at(paid, rng), {
+                'invoice_id': invoice_id, 'payment_date': paid.isoformat(), 'days_early_late': delay
+            }
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    # Support tickets: unhealthy customers open more, and more of them stay open
+    months = days / 30.0
+    for number in range(_poisson(rng, months * (0.5 + 4 * (1 - health)))):
+        ticket_id = f"t_{customer['id']}_{number:05d}"
+        opened = _at(rng.choice(day_list), rng)
+        yield 'support_ticket_created', opened, {
+            'ticket_id': ticket_id,
+            'priority': rng.choices(PRIORITIES, (4, 3, 2 * (1.5 - health), 1 - health))[0]
+        }
+        if rng.random() < 0.6 + 0.35 * health:
+            yield 'support_ticket_resolved', opened + timedelta(hours=rng.expovariate(1 / 30.0)), {
+                'ticket_id': ticket_id,
+                'resolution_type': rng.choices(RESOLUTIONS, (6, 2, 2 * (1 - health) + 0.2, 1))[0],
+                'satisfaction_score': round(min(5.0, max(1.0, rng.gauss(2 + 3 * health, 0.7))), 1)
+            }
+
+    # Free-form activity fills the rest of the budget
+    active_days = [day for day in day_list if rng.random() < 0.15 + 0.8 * health] or [rng.choice(day_list)]
+    used_features = rng.sample(FEATURES, k=max(1, int(len(FEATURES) * (0.1 + 0.8 * health))))
+    endpoints = ENDPOINTS[:max(1, int(len(ENDPOINTS) * (0.3 + 0.7 * health)))]
+    success_rate = 0.85 + 0.14 * health
+    for event_type, share in ACTIVITY_MIX:
+        for _ in range(int(budget * share)):
+            ts = _at(rng.choice(active_days), rng)
+            if event_type == 'api_call':
+                if rng.random() < 0.02 * (1 - health):
+                    yield 'api_rate_limit_exceeded', ts, {'endpoint': rng.choice(endpoints)}
+                    continue
+                yield 'api_call', ts, {
+                    'endpoint': rng.choice(endpoints),
+                    'response_code': rng.choice((200, 200, 201)) if rng.random() < success_rate
+                    else rng.choice((400, 404, 429, 500, 503)),
+                    'response_time_ms': int(rng.lognormvariate(5.0 + (1 - health), 0.5))
+                }
+            elif event_type == 'feature_used':
+                yield 'feature_used', ts, {'feature_name': rng.choice(used_features)}
+            else:
+                yield 'user_login', ts, {}
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method is fine for the small means used here
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def event_budgets(rng: random.Random, customers: int, events: int) -> List[int]:
+    """Split the event total across customers with a long-tailed (lognormal) size distribution."""
+    weights = [rng.lognormvariate(0, 1) for _ in range(customers)]
+    total = sum(weights)
+    return [max(20, int(events * weight / total)) for weight in weights]
+
+
+def generate(out_dir: str, customers: int, events: int, start: date, end: date, seed: int) -> Dict[str, Any]:
+    """Write customers.csv and events.csv into out_dir. Returns counts and timings."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    budgets = event_budgets(rng, customers, events)
+    began = time.perf_counter()
+    written = 0
+    counts: Dict[str, int] = {}
+
+    with open(os.path.join(out_dir, 'customers.csv'), 'w', newline='') as customers_file, \
+            open(os.path.join(out_dir, 'events.csv'), 'w', newline='') as events_file:
+        customer_writer = csv.writer(customers_file)
+        customer_writer.writerow(('id', 'name', 'segment', 'created_at'))
+        event_writer = csv.writer(events_file)
+        event_writer.writerow(('id', 'customer_id', 'event_type', 'ts', 'event_metadata'))
+        for index in range(customers):
+            # One generator per customer: any customer can be regenerated on its own
+            customer_rng = random.Random(f"{seed}:{index}")
+            customer = make_customer(index + 1, customer_rng, start)
+            customer_writer.writerow((customer['id'], customer['name'], customer['segment'], customer['created_at']))
+            for event_type, ts, metadata in customer_events(customer, customer_rng, start, end, budgets[index]):
+                event_writer.writerow((
+                    str(uuid.UUID(int=customer_rng.getrandbits(128), version=4)),
+                    customer['id'], event_type, _iso(ts), json.dumps(metadata, separators=(',', ':'))
+                ))
+                counts[event_type] = counts.get(event_type, 0) + 1
+                written += 1
+            if (index + 1) % 1000 == 0:
+                print(f"{index + 1}/{customers} customers, {written} events", file=sys.stderr)
+
+    return {
+        'customers': customers,
+        'events': written,
+        'events_by_type': dict(sorted(counts.items())),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'seed': seed,
+        'seconds': round(time.perf_counter() - began, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic customers and events CSVs")
+    parser.add_argument("--scale", choices=SCALES, default="tiny", help="Preset customers/events counts")
+    parser.add_argument("--customers", type=int, help="Overrides the scale's customer count")
+    parser.add_argument("--events", type=int, help="Overrides the scale's (approximate) event count")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 6, 1))
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2024, 9, 30),
+                        help="Last day (the default scoring period ends 2024-09-30)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out-dir", default="benchmark_data")
+    args = parser.parse_args()
+
+    customers, events = SCALES[args.scale]
+    report = generate(args.out_dir, args.customers or customers, args.events or events,
+                      args.start, args.end, args.seed)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Single-pass scoring parity check
+
+Scores a sample of customers with the single-statement query
+(COMBINED_METRICS_SQL) and with the six per-factor queries, reports any
+customer whose score or breakdown differs, and prints the per-customer
+latency of both. Exits non-zero on a mismatch. Run from the backend directory:
+
+    python -m benchmarks.parity_single_pass
+    python -m benchmarks.parity_single_pass --sample 1000 --days 90
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services.health_scoring import (
+    COMBINED_METRICS_SQL,
+    calculate_customer_health_score_per_factor,
+    combined_metrics_params,
+    get_period_dates,
+    health_score_from_combined_metrics,
+)
+
+from .parity_vectorized import diff
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare single-pass scores against the per-factor queries")
+    parser.add_argument("--sample", type=int, default=200, help="Customers to score")
+    parser.add_argument("--days", type=int, help="Window length ending now (default: the demo period)")
+    parser.add_argument("--show", type=int, default=10, help="Mismatching customers to print")
+    args = parser.parse_args()
+
+    if args.days:
+        period_end = datetime.now()
+        period_start = period_end - timedelta(days=args.days)
+    else:
+        period_start, period_end = get_period_dates(30)
+
+    db = SessionLocal()
+    mismatches = {}
+    per_factor_seconds, single_pass_seconds = [], []
+    try:
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers ORDER BY id")).fetchall()]
+        customer_ids = random.sample(customer_ids, min(args.sample, len(customer_ids)))
+        for customer_id in customer_ids:
+            start = time.perf_counter()
+            expected = calculate_customer_health_score_per_factor(db, customer_id, period_start, period_end)
+            per_factor_seconds.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            row = db.execute(COMBINED_METRICS_SQL,
+                             combined_metrics_params(customer_id, period_start, period_end)).fetchone()
+            actual = health_score_from_combined_metrics(row, period_start, period_end)
+            single_pass_seconds.append(time.perf_counter() - start)
+
+            problems = diff(expected, actual)
+            if problems:
+                mismatches[customer_id] = problems
+    finally:
+        db.close()
+
+    report = {
+        "customers": len(customer_ids),
+        "per_factor_ms_median": round(statistics.median(per_factor_seconds) * 1000, 3) if customer_ids else None,
+        "single_pass_ms_median": round(statistics.median(single_pass_seconds) * 1000, 3) if customer_ids else None,
+        "mismatched_customers": len(mismatches),
+        "examples": dict(list(mismatches.items())[:args.show])
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
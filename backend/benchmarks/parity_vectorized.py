@@ -0,0 +1,92 @@
+"""
+Vectorized scoring parity check
+
+Scores every customer (or a sample) with the SQL bulk path and the vectorized
+NumPy engine, reports any customer whose score or breakdown differs, and
+prints timings for both. Exits non-zero on a mismatch. Run from the backend
+directory:
+
+    python -m benchmarks.parity_vectorized
+    python -m benchmarks.parity_vectorized --sample 500 --days 90
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, List
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services.health_scoring import calculate_bulk_health_scores
+
+TOLERANCE = 1e-6
+
+
+def diff(expected: Any, actual: Any, path: str = "") -> List[str]:
+    """Differences between two score structures, ignoring last_updated."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        problems = []
+        for key in sorted(set(expected) | set(actual)):
+            if key == "last_updated":
+                continue
+            if key not in expected or key not in actual:
+                problems.append(f"{path}.{key}: missing on one side")
+            else:
+                problems.extend(diff(expected[key], actual[key], f"{path}.{key}"))
+        return problems
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return [] if abs(float(expected) - float(actual)) <= TOLERANCE else [f"{path}: {expected} != {actual}"]
+    return [] if expected == actual else [f"{path}: {expected!r} != {actual!r}"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare vectorized scores against the SQL engine")
+    parser.add_argument("--sample", type=int, help="Score a random sample of customers instead of all")
+    parser.add_argument("--days", type=int, default=30, help="Window length ending now")
+    parser.add_argument("--show", type=int, default=10, help="Mismatching customers to print")
+    args = parser.parse_args()
+
+    period_end = datetime.now()
+    period_start = period_end - timedelta(days=args.days)
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET statement_timeout = 0"))
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers ORDER BY id")).fetchall()]
+        if args.sample:
+            customer_ids = random.sample(customer_ids, min(args.sample, len(customer_ids)))
+
+        start = time.perf_counter()
+        expected = calculate_bulk_health_scores(db, customer_ids, period_start, period_end, source="events")
+        sql_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = calculate_bulk_health_scores(db, customer_ids, period_start, period_end, source="vectorized")
+        vectorized_seconds = time.perf_counter() - start
+    finally:
+        db.close()
+
+    mismatches = {}
+    for customer_id in customer_ids:
+        problems = diff(expected.get(customer_id), actual.get(customer_id))
+        if problems:
+            mismatches[customer_id] = problems
+
+    report = {
+        "customers": len(customer_ids),
+        "window_days": args.days,
+        "sql_seconds": round(sql_seconds, 3),
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "mismatched_customers": len(mismatches),
+        "examples": dict(list(mismatches.items())[:args.show])
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmark harness
+
+Measures the scoring functions, the read endpoints and event ingestion against
+whatever dataset is loaded (see benchmarks.generate_data), and writes one JSON
+file per run. Files are stable-keyed so two runs can be diffed with `compare`,
+which flags every metric that got worse by more than the threshold and exits
+non-zero if any did.
+
+Metric names say which way is better: *_per_second is higher-is-better,
+*_ms and *_seconds are lower-is-better. Run from the backend directory:
+
+    python -m benchmarks.run_benchmarks run --label small --url http://localhost:8000 \\
+        --output benchmarks/results/small.json
+    python -m benchmarks.run_benchmarks compare benchmarks/results/small.json /tmp/small-new.json
+
+Ingestion runs last because it adds events (and so changes scores); pass
+--skip-ingestion to keep the dataset untouched.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.models import Customer
+from app.services.health_scoring import calculate_bulk_health_scores, calculate_customer_health_score
+from app.services.ingestion import ingest_events
+
+from .generate_data import customer_events
+
+RESULTS_SCHEMA = 1
+SCORING_SOURCES = ('events', 'rollup', 'vectorized')
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Percentiles of per-call latencies given in seconds, reported in ms."""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000
+
+    return {
+        'calls': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(calls: List[Callable[[], Any]], concurrency: int = 1, warmup: int = 1) -> Dict[str, float]:
+    """Run each call once (after warmup calls) and report latency and throughput."""
+    for call in calls[:warmup]:
+        call()
+
+    def timed(call: Callable[[], Any]) -> float:
+        began = time.perf_counter()
+        call()
+        return time.perf_counter() - began
+
+    began = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, calls))
+    else:
+        samples = [timed(call) for call in calls]
+    elapsed = time.perf_counter() - began
+    return {**latency_stats(samples), 'calls_per_second': round(len(samples) / elapsed, 2)}
+
+
+def http_get(url: str) -> Callable[[], Any]:
+    def call():
+        with urllib.request.urlopen(url) as response:
+            return response.read()
+    return call
+
+
+def http_post_json(url: str, body: Dict[str, Any]) -> Callable[[], Any]:
+    data = json.dumps(body).encode()
+
+    def call():
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    return call
+
+
+def dataset_stats(db) -> Dict[str, Any]:
+    customers = db.execute(text("SELECT COUNT(*) FROM customers")).scalar()
+    # Planner estimate; an exact COUNT(*) over 100M rows would dominate the run
+    events = db.execute(text("""
+        SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+        FROM pg_class c
+        WHERE c.oid = 'events'::regclass
+           OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'events'::regclass)
+    """)).scalar()
+    return {'customers': customers, 'events_estimate': events}
+
+
+def bench_scoring(db, customer_ids: List[str], sample: List[str], repeat: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for source in SCORING_SOURCES:
+        try:
+            timings = []
+            for _ in range(repeat):
+                began = time.perf_counter()
+                calculate_bulk_health_scores(db, customer_ids, source=source)
+                timings.append(time.perf_counter() - began)
+        except ImportError as e:
+            results[f'scoring.bulk.{source}'] = {'skipped': str(e)}
+            continue
+        seconds = statistics.median(timings)
+        results[f'scoring.bulk.{source}'] = {
+            'customers': len(customer_ids),
+            'seconds': round(seconds, 4),
+            'customers_per_second': round(len(customer_ids) / seconds, 1) if seconds else None,
+        }
+
+    customers = db.query(Customer).filter(Customer.id.in_(sample)).all()
+    for source in ('events', 'rollup'):
+        results[f'scoring.customer.{source}'] = measure(
+            [lambda c=c: calculate_customer_health_score(db, c, source=source) for c in customers]
+        )
+    return results
+
+
+def bench_http(url: str, sample: List[str], requests: int, concurrency: int) -> Dict[str, Dict[str, Any]]:
+    ids = [sample[i % len(sample)] for i in range(requests)]
+    return {
+        'http.customers_default_page': measure([http_get(f"{url}/api/customers")] * requests, concurrency),
+        'http.customers_page': measure(
+            [http_get(f"{url}/api/customers?sort=score&limit=50&page={i % 5 + 1}") for i in range(requests)],
+            concurrency
+        ),
+        'http.customers_summary': measure([http_get(f"{url}/api/customers/summary")] * requests, concurrency),
+        'http.customer_health': measure(
+            [http_get(f"{url}/api/customers/{customer_id}/health") for customer_id in ids], concurrency
+        ),
+        'http.customer_health_fresh': measure(
+            [http_get(f"{url}/api/customers/{customer_id}/health?fresh=true") for customer_id in ids[:requests // 4 or 1]],
+            concurrency
+        ),
+    }
+
+
+def synthetic_batch(rng: random.Random, customer_ids: List[str], size: int) -> List[Dict[str, Any]]:
+    """About size raw events for random existing customers, in the scoring period."""
+    batch: List[Dict[str, Any]] = []
+    while len(batch) < size:
+        customer = {'id': rng.choice(customer_ids), 'segment': 'SMB'}
+        for event_type, ts, metadata in customer_events(customer, rng, date(2024, 9, 1), date(2024, 9, 30), 50):
+            batch.append({'customer_id': customer['id'], 'event_type': event_type,
+                          'ts': ts.isoformat(), 'metadata': metadata})
+    return batch[:size]
+
+
+def bench_ingestion(db, url: Optional[str], customer_ids: List[str], events: int,
+                    batch_size: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(seed)
+    results = {}
+    targets = [('copy', lambda batch: ingest_events(db, batch, method='copy')),
+               ('insert', lambda batch: ingest_events(db, batch, method='insert'))]
+    if url:
+        targets.append(('http_batch', lambda batch: http_post_json(f"{url}/api/events/batch", {'events': batch})()))
+    for name, ingest in targets:
+        inserted, elapsed = 0, 0.0
+        for _ in range(max(1, events // batch_size)):
+            batch = synthetic_batch(rng, customer_ids, batch_size)
+            began = time.perf_counter()
+            inserted += ingest(batch)['inserted']
+            elapsed += time.perf_counter() - began
+        results[f'ingestion.{name}'] = {
+            'events': inserted,
+            'batch_size': batch_size,
+            'seconds': round(elapsed, 3),
+            'events_per_second': round(inserted / elapsed, 1) if elapsed else None,
+        }
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    db = SessionLocal()
+    try:
+        db.execute(text("SET statement_timeout = 0"))
+        customer_ids = [row[0] for row in db.execute(text("SELECT id FROM customers ORDER BY id")).fetchall()]
+        if not customer_ids:
+            raise SystemExit("No customers found; load a dataset first (benchmarks.generate_data)")
+        sample = rng.sample(customer_ids, min(args.sample, len(customer_ids)))
+        report = {
+            'schema': RESULTS_SCHEMA,
+            'label': args.label,
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'dataset': dataset_stats(db),
+            'settings': {
+                'score_source': os.getenv('HEALTH_SCORE_SOURCE', 'events'),
+                'sample': len(sample),
+                'repeat': args.repeat,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'seed': args.seed,
+            },
+            'results': {},
+        }
+        results = report['results']
+        results.update(bench_scoring(db, customer_ids, sample, args.repeat))
+        if args.url:
+            results.update(bench_http(args.url.rstrip('/'), sample, args.requests, args.concurrency))
+        if not args.skip_ingestion:
+            results.update(bench_ingestion(db, args.url and args.url.rstrip('/'), customer_ids,
+                                           args.ingest_events, args.batch_size, args.seed))
+    finally:
+        db.close()
+    return report
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """Relative change of every shared metric; a regression is a change for the worse beyond threshold."""
+    changes, regressions = {}, []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        before, after = baseline['results'][name], current['results'][name]
+        for metric in sorted(set(before) & set(after)):
+            higher_is_better = metric.endswith('_per_second')
+            if not (higher_is_better or metric.endswith(('_ms', 'seconds'))):
+                continue
+            old, new = before[metric], after[metric]
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+                continue
+            change = (new - old) / old
+            key = f"{name}.{metric}"
+            changes[key] = {'baseline': old, 'current': new, 'change': round(change, 4)}
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(key)
+    return {
+        'baseline': {'label': baseline.get('label'), 'commit': baseline.get('commit')},
+        'current': {'label': current.get('label'), 'commit': current.get('commit')},
+        'threshold': threshold,
+        'regressions': regressions,
+        'changes': changes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run or compare health API benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Benchmark the loaded dataset")
+    run_parser.add_argument("--label", default="local", help="Name of the dataset/scale, stored in the results")
+    run_parser.add_argument("--url", help="API base URL; HTTP benchmarks are skipped without it")
+    run_parser.add_argument("--output", help="Results file (default: stdout)")
+    run_parser.add_argument("--sample", type=int, default=200, help="Customers used for per-customer timings")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Bulk scoring passes per source (median kept)")
+    run_parser.add_argument("--requests", type=int, default=200, help="Requests per HTTP benchmark")
+    run_parser.add_argument("--concurrency", type=int, default=1, help="Parallel HTTP clients")
+    run_parser.add_argument("--skip-ingestion", action="store_true", help="Do not write events")
+    run_parser.add_argument("--ingest-events", type=int, default=50000, help="Events written per ingestion path")
+    run_parser.add_argument("--batch-size", type=int, default=5000)
+    run_parser.add_argument("--seed", type=int, default=42)
+    compare_parser = subparsers.add_parser("compare", help="Diff two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        output = run(args)
+        exit_code = 0
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        output = compare(baseline, current, args.threshold)
+        exit_code = 1 if output['regressions'] else 0
+
+    body = json.dumps(output, indent=2, sort_keys=True) + "\n"
+    if getattr(args, 'output', None):
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(body)
+    else:
+        sys.stdout.write(body)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
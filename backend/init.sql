@@ -12,7 +12,8 @@ CREATE TABLE IF NOT EXISTS customers (
     created_at TIMESTAMP WITH TIME ZONE
 );
 
--- Create events table
+-- Create events table (migration 0003 converts it to monthly range partitions on ts;
+-- see app/db/partitions.py for partition creation and archival)
 CREATE TABLE IF NOT EXISTS events (
     id TEXT PRIMARY KEY,
     customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
@@ -21,15 +22,45 @@ CREATE TABLE IF NOT EXISTS events (
     event_metadata JSONB
 );
 
+-- Create daily rollup table (per customer x day x event_type aggregates used for scoring)
+CREATE TABLE IF NOT EXISTS customer_daily_rollups (
+    customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    event_type TEXT NOT NULL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    match_count INTEGER NOT NULL DEFAULT 0,
+    value_sum DOUBLE PRECISION,
+    value_count INTEGER NOT NULL DEFAULT 0,
+    key_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+    key_values JSONB NOT NULL DEFAULT '{}'::jsonb,
+    PRIMARY KEY (customer_id, day, event_type)
+);
+
+-- Create health score snapshot table (maintained by the background recomputation worker)
+CREATE TABLE IF NOT EXISTS health_scores (
+    customer_id TEXT PRIMARY KEY REFERENCES customers(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION,
+    label TEXT,
+    breakdown JSONB,
+    computed_at TIMESTAMP WITH TIME ZONE,
+    dirty_at TIMESTAMP WITH TIME ZONE
+);
 
 -- Import CSV data directly
+-- For large or incremental loads use the resumable loader instead: python -m app.loader events <file>
+-- After a raw COPY, rebuild rollups with: python -m app.services.rollups --start <day> --end <day>
 COPY customers FROM '/app/customers.csv' DELIMITER ',' CSV HEADER;
 COPY events FROM '/app/events.csv' DELIMITER ',' CSV HEADER;
 
 
 
 
+-- Scoring-query indexes are managed by Alembic (backend/migrations); the API container
+-- runs `alembic upgrade head` on startup.
 CREATE INDEX IF NOT EXISTS idx_customers_segment ON customers(segment);
 CREATE INDEX IF NOT EXISTS idx_events_customer_id_ts ON events(customer_id, ts); 
 CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type);
-CREATE INDEX IF NOT EXISTS idx_events_metadata_gin ON events USING GIN (event_metadata);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_events_metadata_gin ON events USING GIN (event_metadata);
+CREATE INDEX IF NOT EXISTS idx_rollups_day_type ON customer_daily_rollups(day, event_type);
+CREATE INDEX IF NOT EXISTS idx_health_scores_dirty ON health_scores(dirty_at) WHERE dirty_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_health_scores_computed_at ON health_scores(computed_at);
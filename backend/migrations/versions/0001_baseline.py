@@ -0,0 +1,74 @@
+"""Baseline schema (tables and indexes created by init.sql)
+
+Every statement is IF NOT EXISTS, so databases created from init.sql can run
+`alembic upgrade head` directly without stamping.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            event_type TEXT NOT NULL,
+            ts TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            event_metadata JSONB
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS customer_daily_rollups (
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            event_type TEXT NOT NULL,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            match_count INTEGER NOT NULL DEFAULT 0,
+            value_sum DOUBLE PRECISION,
+            value_count INTEGER NOT NULL DEFAULT 0,
+            key_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+            key_values JSONB NOT NULL DEFAULT '{}'::jsonb,
+            PRIMARY KEY (customer_id, day, event_type)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS health_scores (
+            customer_id TEXT PRIMARY KEY REFERENCES customers(id) ON DELETE CASCADE,
+            score DOUBLE PRECISION,
+            label TEXT,
+            breakdown JSONB,
+            computed_at TIMESTAMP WITH TIME ZONE,
+            dirty_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_customers_segment ON customers(segment)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_events_customer_id_ts ON events(customer_id, ts)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_events_metadata_gin ON events USING GIN (event_metadata)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_rollups_day_type ON customer_daily_rollups(day, event_type)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_health_scores_dirty ON health_scores(dirty_at) WHERE dirty_at IS NOT NULL")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_health_scores_computed_at ON health_scores(computed_at)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS health_scores")
+    op.execute("DROP TABLE IF EXISTS customer_daily_rollups")
+    op.execute("DROP TABLE IF EXISTS events")
+    op.execute("DROP TABLE IF EXISTS customers")
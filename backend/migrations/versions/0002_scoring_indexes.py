@@ -0,0 +1,61 @@
+"""Indexes tuned to the scoring queries
+
+Every calc_* query filters on customer_id + event_type + ts and reads a few
+extracted JSONB keys, which the GIN index on event_metadata cannot serve:
+
+  - (customer_id, event_type, ts) for the API growth and invoice queries
+  - per-event-type partial indexes on (customer_id, ts, <extracted key>) so
+    the login, feature, support and API queries read only their own rows
+  - an expression index on invoice_id for the invoice/payment/failure joins
+
+Indexes are built CONCURRENTLY so ingestion keeps running during the upgrade.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+SCORING_INDEXES = {
+    'idx_events_customer_type_ts': """
+        ON events (customer_id, event_type, ts)
+    """,
+    'idx_events_login': """
+        ON events (customer_id, ts)
+        WHERE event_type = 'user_login'
+    """,
+    'idx_events_feature': """
+        ON events (customer_id, ts, (event_metadata->>'feature_name'))
+        WHERE event_type IN ('feature_onboarded', 'feature_used')
+    """,
+    'idx_events_support': """
+        ON events (customer_id, ts, (event_metadata->>'ticket_id'))
+        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+    """,
+    'idx_events_api': """
+        ON events (customer_id, ts, (event_metadata->>'endpoint'), ((event_metadata->>'response_code')::int))
+        WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+    """,
+    'idx_events_invoice': """
+        ON events (customer_id, (event_metadata->>'invoice_id'))
+        WHERE event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+    """,
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, definition in SCORING_INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+        op.execute("ANALYZE events")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in SCORING_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
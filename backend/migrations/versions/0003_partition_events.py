@@ -0,0 +1,145 @@
+"""Range-partition events by month on ts
+
+Rebuilds events as a table partitioned by month (events_YYYY_MM, UTC bounds)
+plus a DEFAULT partition, copies every row across and recreates the indexes
+on the partitioned parent so each partition gets its own copy. The primary key
+becomes (id, ts) because a partitioned table's unique constraints must include
+the partition key, and ts becomes NOT NULL.
+
+The copy runs in the migration transaction; on a large table schedule it for a
+maintenance window. Later months are created by app.db.partitions.
+
+The downgrade restores id as the primary key, so it refuses to run while two
+events share an id (possible once ts is part of the key) instead of dropping
+one of them; give those events new ids first.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-10-01
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+from sqlalchemy import text
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+EVENT_INDEXES = {
+    'idx_events_customer_id_ts': "ON events (customer_id, ts)",
+    'idx_events_type': "ON events (event_type)",
+    'idx_events_metadata_gin': "ON events USING GIN (event_metadata)",
+    'idx_events_customer_type_ts': "ON events (customer_id, event_type, ts)",
+    'idx_events_login': "ON events (customer_id, ts) WHERE event_type = 'user_login'",
+    'idx_events_feature': """
+        ON events (customer_id, ts, (event_metadata->>'feature_name'))
+        WHERE event_type IN ('feature_onboarded', 'feature_used')
+    """,
+    'idx_events_support': """
+        ON events (customer_id, ts, (event_metadata->>'ticket_id'))
+        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+    """,
+    'idx_events_api': """
+        ON events (customer_id, ts, (event_metadata->>'endpoint'), ((event_metadata->>'response_code')::int))
+        WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+    """,
+    'idx_events_invoice': """
+        ON events (customer_id, (event_metadata->>'invoice_id'))
+        WHERE event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+    """,
+}
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _move_aside(table: str) -> None:
+    """Rename the current events table and free the index/constraint names it holds."""
+    op.execute(f"ALTER TABLE events RENAME TO {table}")
+    for name in EVENT_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT events_pkey TO {table}_pkey")
+    op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT events_customer_id_fkey TO {table}_customer_id_fkey")
+
+
+def _create_indexes() -> None:
+    for name, definition in EVENT_INDEXES.items():
+        op.execute(f"CREATE INDEX {name} {definition}")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.execute(text("SELECT relkind FROM pg_class WHERE oid = 'events'::regclass")).scalar() == 'p':
+        return
+
+    _move_aside('events_unpartitioned')
+    op.execute("""
+        CREATE TABLE events (
+            id TEXT NOT NULL,
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            event_type TEXT NOT NULL,
+            ts TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            event_metadata JSONB,
+            PRIMARY KEY (id, ts)
+        ) PARTITION BY RANGE (ts)
+    """)
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+    # One partition per month from the oldest event through MONTHS_AHEAD months from now
+    now = datetime.now(timezone.utc)
+    oldest = bind.execute(text("SELECT MIN(ts) FROM events_unpartitioned")).scalar() or now
+    oldest = oldest.astimezone(timezone.utc)
+    month = date(oldest.year, oldest.month, 1)
+    last = _add_months(date(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        next_month = _add_months(month, 1)
+        op.execute(f"""
+            CREATE TABLE events_{month.year:04d}_{month.month:02d} PARTITION OF events
+            FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month.isoformat()} 00:00:00+00')
+        """)
+        month = next_month
+
+    op.execute("""
+        INSERT INTO events (id, customer_id, event_type, ts, event_metadata)
+        SELECT id, customer_id, event_type, COALESCE(ts, NOW()), event_metadata
+        FROM events_unpartitioned
+    """)
+    op.execute("DROP TABLE events_unpartitioned")
+    _create_indexes()
+    op.execute("ANALYZE events")
+
+
+def downgrade() -> None:
+    duplicates = op.get_bind().execute(text("""
+        SELECT id FROM events GROUP BY id HAVING COUNT(*) > 1 ORDER BY id LIMIT 10
+    """)).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            "Cannot downgrade 0003: events share an id and events.id would become the "
+            f"primary key again (e.g. {', '.join(duplicates)}). Give them new ids first."
+        )
+
+    _move_aside('events_partitioned')
+    op.execute("""
+        CREATE TABLE events (
+            id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            event_type TEXT NOT NULL,
+            ts TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            event_metadata JSONB
+        )
+    """)
+    op.execute("""
+        INSERT INTO events (id, customer_id, event_type, ts, event_metadata)
+        SELECT id, customer_id, event_type, ts, event_metadata
+        FROM events_partitioned
+    """)
+    op.execute("DROP TABLE events_partitioned")
+    _create_indexes()
+    op.execute("ANALYZE events")
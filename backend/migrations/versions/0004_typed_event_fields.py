@@ -0,0 +1,145 @@
+"""Typed columns for the event metadata keys the scoring queries read
+
+Adds one nullable column per key (adding nullable columns does not rewrite the
+table), fills them from event_metadata month by month, and swaps the JSONB
+expression indexes from 0002 for plain column indexes. New events get the
+columns filled at write time by app.services.event_fields.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-10-01
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# Guarded casts from metadata text, used by the backfill below and kept after the
+# upgrade for app.services.event_fields.BACKFILL_SQL, so both fill the columns the
+# same way. Values not matching the pattern return NULL without entering the
+# exception block (a subtransaction per call); the block catches the rest
+# (2024-13-45, integers out of range) instead of failing the backfill.
+CAST_FUNCTIONS = {
+    'event_field_int': ('INTEGER', r'^\s*-?\d+(\.0*)?\s*$', "value::numeric::integer"),
+    'event_field_float': ('DOUBLE PRECISION', r'^\s*-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$',
+                          "value::double precision"),
+    'event_field_date': ('DATE', r'^\d\d\d\d-\d\d-\d\d', "substr(value, 1, 10)::date"),
+}
+
+# column -> (type, guarded cast function or None for text)
+COLUMNS = {
+    'feature_name': ('TEXT', None),
+    'completion_percentage': ('INTEGER', 'event_field_int'),
+    'ticket_id': ('TEXT', None),
+    'priority': ('TEXT', None),
+    'resolution_type': ('TEXT', None),
+    'satisfaction_score': ('DOUBLE PRECISION', 'event_field_float'),
+    'invoice_id': ('TEXT', None),
+    'amount_usd': ('DOUBLE PRECISION', 'event_field_float'),
+    'due_date': ('DATE', 'event_field_date'),
+    'payment_date': ('DATE', 'event_field_date'),
+    'days_early_late': ('INTEGER', 'event_field_int'),
+    'endpoint': ('TEXT', None),
+    'response_code': ('INTEGER', 'event_field_int'),
+    'response_time_ms': ('INTEGER', 'event_field_int'),
+}
+
+JSONB_INDEXES = {
+    'idx_events_feature': """
+        ON events (customer_id, ts, (event_metadata->>'feature_name'))
+        WHERE event_type IN ('feature_onboarded', 'feature_used')
+    """,
+    'idx_events_support': """
+        ON events (customer_id, ts, (event_metadata->>'ticket_id'))
+        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+    """,
+    'idx_events_api': """
+        ON events (customer_id, ts, (event_metadata->>'endpoint'), ((event_metadata->>'response_code')::int))
+        WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+    """,
+    'idx_events_invoice': """
+        ON events (customer_id, (event_metadata->>'invoice_id'))
+        WHERE event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+    """,
+}
+
+COLUMN_INDEXES = {
+    'idx_events_feature': """
+        ON events (customer_id, ts, feature_name)
+        WHERE event_type IN ('feature_onboarded', 'feature_used')
+    """,
+    'idx_events_support': """
+        ON events (customer_id, ts, ticket_id)
+        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+    """,
+    'idx_events_api': """
+        ON events (customer_id, ts, endpoint, response_code)
+        WHERE event_type IN ('api_call', 'api_rate_limit_exceeded')
+    """,
+    'idx_events_invoice': """
+        ON events (customer_id, invoice_id)
+        WHERE event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+    """,
+}
+
+
+def _replace_indexes(indexes) -> None:
+    for name, definition in indexes.items():
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+        op.execute(f"CREATE INDEX {name} {definition}")
+
+
+def create_cast_functions() -> None:
+    for name, (return_type, pattern, cast) in CAST_FUNCTIONS.items():
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION {name}(value TEXT) RETURNS {return_type}
+            LANGUAGE plpgsql IMMUTABLE STRICT AS $$
+            BEGIN
+                IF value !~ '{pattern}' THEN
+                    RETURN NULL;
+                END IF;
+                BEGIN
+                    RETURN {cast};
+                EXCEPTION WHEN others THEN
+                    RETURN NULL;
+                END;
+            END
+            $$
+        """)
+
+
+def upgrade() -> None:
+    create_cast_functions()
+    for column, (column_type, _) in COLUMNS.items():
+        op.execute(f"ALTER TABLE events ADD COLUMN IF NOT EXISTS {column} {column_type}")
+
+    # Backfill a month at a time so each UPDATE stays within one partition
+    bind = op.get_bind()
+    months = bind.execute(text("""
+        SELECT DISTINCT date_trunc('month', ts) FROM events WHERE event_metadata IS NOT NULL ORDER BY 1
+    """)).scalars().all()
+    assignments = ",\n".join(
+        f"{column} = {function}(event_metadata->>'{column}')" if function
+        else f"{column} = event_metadata->>'{column}'"
+        for column, (_, function) in COLUMNS.items()
+    )
+    for month in months:
+        bind.execute(text(f"""
+            UPDATE events SET {assignments}
+            WHERE ts >= :month AND ts < :month + interval '1 month'
+              AND event_metadata IS NOT NULL
+        """), {'month': month})
+
+    _replace_indexes(COLUMN_INDEXES)
+    op.execute("ANALYZE events")
+
+
+def downgrade() -> None:
+    _replace_indexes(JSONB_INDEXES)
+    for column in COLUMNS:
+        op.execute(f"ALTER TABLE events DROP COLUMN IF EXISTS {column}")
+    for name in CAST_FUNCTIONS:
+        op.execute(f"DROP FUNCTION IF EXISTS {name}(TEXT)")
@@ -0,0 +1,35 @@
+"""Indexes for the filtered, sorted customer list
+
+/api/customers filters and sorts health_scores by score and label and pages
+through the result; these indexes let a sorted page stop after LIMIT rows
+instead of sorting every snapshot. Segment filters use the existing
+idx_customers_segment.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+LIST_INDEXES = {
+    'idx_health_scores_score': "ON health_scores (score, customer_id)",
+    'idx_health_scores_label_score': "ON health_scores (label, score, customer_id)",
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, definition in LIST_INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+        op.execute("ANALYZE health_scores")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in LIST_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
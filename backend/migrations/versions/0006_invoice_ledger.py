@@ -0,0 +1,91 @@
+"""Invoice ledger for the payment factor
+
+One row per (customer, invoice) with amount, due date, latest payment, failure
+count and payment status, kept current at ingest time by
+app.services.invoice_ledger. The payment factor reads the invoices issued in
+its window from here instead of joining every payment event the customer has.
+Existing events are folded in by the upgrade.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS invoice_ledger (
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            invoice_id TEXT NOT NULL,
+            issued_at TIMESTAMP WITH TIME ZONE,
+            amount_usd DOUBLE PRECISION,
+            due_date DATE,
+            payment_date DATE,
+            days_early_late INTEGER,
+            failure_count INTEGER NOT NULL DEFAULT 0,
+            status TEXT,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (customer_id, invoice_id)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_invoice_ledger_issued
+        ON invoice_ledger (customer_id, issued_at)
+        WHERE issued_at IS NOT NULL
+    """)
+    # Same rules as REFRESH_LEDGER_SQL: latest issue, latest payment, every failure
+    op.execute("""
+        WITH inv AS (
+            SELECT DISTINCT ON (customer_id, invoice_id) customer_id, invoice_id, ts, amount_usd, due_date
+            FROM events
+            WHERE event_type = 'invoice_generated' AND invoice_id IS NOT NULL
+            ORDER BY customer_id, invoice_id, ts DESC
+        ),
+        pay AS (
+            SELECT DISTINCT ON (customer_id, invoice_id) customer_id, invoice_id, payment_date, days_early_late
+            FROM events
+            WHERE event_type = 'payment_received' AND invoice_id IS NOT NULL
+            ORDER BY customer_id, invoice_id, ts DESC
+        ),
+        fail AS (
+            SELECT customer_id, invoice_id, COUNT(*) as failure_count
+            FROM events
+            WHERE event_type = 'payment_failed' AND invoice_id IS NOT NULL
+            GROUP BY customer_id, invoice_id
+        ),
+        invoice_keys AS (
+            SELECT customer_id, invoice_id FROM inv
+            UNION SELECT customer_id, invoice_id FROM pay
+            UNION SELECT customer_id, invoice_id FROM fail
+        )
+        INSERT INTO invoice_ledger (
+            customer_id, invoice_id, issued_at, amount_usd, due_date,
+            payment_date, days_early_late, failure_count, status, updated_at
+        )
+        SELECT
+            k.customer_id, k.invoice_id, inv.ts, inv.amount_usd, inv.due_date,
+            pay.payment_date, pay.days_early_late, COALESCE(fail.failure_count, 0),
+            CASE
+                WHEN pay.payment_date IS NULL THEN 'unpaid'
+                WHEN pay.days_early_late <= 0 THEN 'on_time_or_early'
+                WHEN pay.days_early_late BETWEEN 1 AND 10 THEN 'late_acceptable'
+                WHEN pay.days_early_late > 10 THEN 'late_concerning'
+            END,
+            NOW()
+        FROM invoice_keys k
+        LEFT JOIN inv USING (customer_id, invoice_id)
+        LEFT JOIN pay USING (customer_id, invoice_id)
+        LEFT JOIN fail USING (customer_id, invoice_id)
+        ON CONFLICT (customer_id, invoice_id) DO NOTHING
+    """)
+    op.execute("ANALYZE invoice_ledger")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS invoice_ledger")
@@ -0,0 +1,78 @@
+"""Support ticket states for the support factor
+
+One row per (customer, ticket) with opened/resolved times, priority,
+resolution type and satisfaction, kept current at ingest time by
+app.services.ticket_states. The support factor reads its counts and open
+tickets from here, which also counts tickets opened before the window that
+are still open. Adds an events index for looking up a ticket's events, and
+folds in existing events.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_ticket
+        ON events (customer_id, ticket_id)
+        WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_states (
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            ticket_id TEXT NOT NULL,
+            opened_at TIMESTAMP WITH TIME ZONE,
+            resolved_at TIMESTAMP WITH TIME ZONE,
+            priority TEXT,
+            resolution_type TEXT,
+            satisfaction_score DOUBLE PRECISION,
+            updated_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (customer_id, ticket_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_ticket_states_resolved ON ticket_states (customer_id, resolved_at)")
+    # Same rules as REFRESH_TICKETS_SQL: first opening, latest resolution unless reopened after it
+    op.execute("""
+        WITH ticket_events AS (
+            SELECT
+                customer_id,
+                ticket_id,
+                MIN(ts) FILTER (WHERE event_type = 'support_ticket_created') as opened_at,
+                MAX(ts) FILTER (WHERE event_type = 'support_ticket_created') as last_opened_at,
+                MAX(ts) FILTER (WHERE event_type = 'support_ticket_resolved') as resolved_at,
+                (array_agg(priority ORDER BY ts)
+                    FILTER (WHERE event_type = 'support_ticket_created'))[1] as priority,
+                (array_agg(resolution_type ORDER BY ts DESC)
+                    FILTER (WHERE event_type = 'support_ticket_resolved'))[1] as resolution_type,
+                (array_agg(satisfaction_score ORDER BY ts DESC)
+                    FILTER (WHERE event_type = 'support_ticket_resolved'))[1] as satisfaction_score
+            FROM events
+            WHERE event_type IN ('support_ticket_created', 'support_ticket_resolved')
+              AND ticket_id IS NOT NULL
+            GROUP BY customer_id, ticket_id
+        )
+        INSERT INTO ticket_states (
+            customer_id, ticket_id, opened_at, resolved_at, priority,
+            resolution_type, satisfaction_score, updated_at
+        )
+        SELECT
+            customer_id, ticket_id, opened_at,
+            CASE WHEN last_opened_at IS NULL OR resolved_at >= last_opened_at THEN resolved_at END,
+            priority, resolution_type, satisfaction_score, NOW()
+        FROM ticket_events
+        ON CONFLICT (customer_id, ticket_id) DO NOTHING
+    """)
+    op.execute("ANALYZE ticket_states")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS ticket_states")
+    op.execute("DROP INDEX IF EXISTS idx_events_ticket")
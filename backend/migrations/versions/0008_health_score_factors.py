@@ -0,0 +1,34 @@
+"""Per-factor scores on health score snapshots
+
+Stores the five factor scores next to each snapshot's weighted score, so
+what-if weights and label thresholds can be applied to every customer from
+these columns (app.services.reweighting) without rescoring from events.
+Existing snapshots are filled from their breakdown.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+FACTORS = ('login_frequency', 'feature_adoption', 'support_tickets', 'payment_health', 'api_usage')
+
+
+def upgrade() -> None:
+    for factor in FACTORS:
+        op.execute(f"ALTER TABLE health_scores ADD COLUMN IF NOT EXISTS {factor}_score DOUBLE PRECISION")
+    assignments = ",\n".join(f"{factor}_score = (breakdown->'{factor}'->>'score')::float" for factor in FACTORS)
+    op.execute(f"""
+        UPDATE health_scores SET {assignments}
+        WHERE breakdown IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    for factor in FACTORS:
+        op.execute(f"ALTER TABLE health_scores DROP COLUMN IF EXISTS {factor}_score")
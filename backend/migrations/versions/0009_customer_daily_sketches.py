@@ -0,0 +1,39 @@
+"""Daily sketches for segment analytics
+
+One row per (customer, day) with login and API call counts and mergeable
+sketches of response times, endpoints and features used, maintained at
+ingest time by app.services.segment_analytics. The sketches are built in
+Python, so existing events are folded in by a post-deploy job rather than
+here: `python -m app.services.segment_analytics rebuild --all` (see
+UPGRADING.md).
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS customer_daily_sketches (
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            login_count INTEGER NOT NULL DEFAULT 0,
+            api_call_count INTEGER NOT NULL DEFAULT 0,
+            response_time_sketch BYTEA,
+            endpoint_hll BYTEA,
+            feature_hll BYTEA,
+            PRIMARY KEY (customer_id, day)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_customer_daily_sketches_day ON customer_daily_sketches (day)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS customer_daily_sketches")
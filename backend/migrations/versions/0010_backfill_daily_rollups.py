@@ -0,0 +1,104 @@
+"""Backfill customer_daily_rollups
+
+0001 created customer_daily_rollups empty and ingest only fills the buckets of
+new events, so rollup scoring undercounted every day written before it unless
+`python -m app.services.rollups` was run by hand. The upgrade aggregates all existing events with the same rules as
+app.services.rollups.REFRESH_ROLLUPS_SQL; buckets the ingest path already
+maintains are left as they are.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        WITH bucket_events AS (
+            SELECT
+                e.customer_id,
+                DATE(e.ts) as day,
+                e.event_type,
+                CASE
+                    WHEN e.event_type = 'feature_used' THEN e.feature_name
+                    WHEN e.event_type = 'feature_onboarded'
+                      AND e.completion_percentage = 100
+                    THEN e.feature_name
+                    WHEN e.event_type = 'api_call' THEN e.endpoint
+                    WHEN e.event_type IN ('support_ticket_created', 'support_ticket_resolved')
+                    THEN e.ticket_id
+                    WHEN e.event_type IN ('invoice_generated', 'payment_received', 'payment_failed')
+                    THEN e.invoice_id
+                END as rollup_key,
+                CASE
+                    WHEN e.event_type = 'api_call'
+                    THEN e.response_code BETWEEN 200 AND 299
+                    WHEN e.event_type = 'feature_onboarded'
+                    THEN e.completion_percentage = 100
+                    WHEN e.event_type = 'support_ticket_resolved'
+                    THEN e.resolution_type = 'escalated'
+                    WHEN e.event_type = 'support_ticket_created'
+                    THEN e.priority IN ('high', 'critical')
+                    ELSE false
+                END as is_match,
+                CASE
+                    WHEN e.event_type = 'api_call'
+                    THEN e.response_time_ms::float
+                    WHEN e.event_type = 'support_ticket_resolved'
+                    THEN e.satisfaction_score
+                END as value,
+                CASE
+                    WHEN e.event_type = 'invoice_generated'
+                    THEN to_jsonb(e.amount_usd)
+                    WHEN e.event_type = 'payment_received'
+                    THEN jsonb_build_array(
+                        e.payment_date,
+                        e.days_early_late
+                    )
+                END as key_value
+            FROM events e
+        ),
+        keyed AS (
+            SELECT
+                customer_id,
+                day,
+                event_type,
+                rollup_key,
+                COUNT(*) as n,
+                COUNT(*) FILTER (WHERE is_match) as matches,
+                SUM(value) as value_sum,
+                COUNT(value) as value_count,
+                jsonb_agg(key_value) FILTER (WHERE key_value IS NOT NULL) as vals
+            FROM bucket_events
+            GROUP BY customer_id, day, event_type, rollup_key
+        )
+        INSERT INTO customer_daily_rollups (
+            customer_id, day, event_type, event_count, match_count,
+            value_sum, value_count, key_counts, key_values
+        )
+        SELECT
+            customer_id,
+            day,
+            event_type,
+            SUM(n),
+            SUM(matches),
+            SUM(value_sum),
+            SUM(value_count),
+            COALESCE(jsonb_object_agg(rollup_key, n) FILTER (WHERE rollup_key IS NOT NULL), '{}'::jsonb),
+            COALESCE(jsonb_object_agg(rollup_key, vals) FILTER (WHERE rollup_key IS NOT NULL AND vals IS NOT NULL), '{}'::jsonb)
+        FROM keyed
+        GROUP BY customer_id, day, event_type
+        ON CONFLICT (customer_id, day, event_type) DO NOTHING
+    """)
+    op.execute("ANALYZE customer_daily_rollups")
+
+
+def downgrade() -> None:
+    # The rows are derived from events; nothing to undo
+    pass
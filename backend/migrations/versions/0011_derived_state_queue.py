@@ -0,0 +1,35 @@
+"""Queue of derived rows to recompute
+
+Ingest used to recompute the invoice ledger, ticket state and daily sketch rows
+of every event in the ingest transaction. It now records their keys in
+derived_state_queue and the health score worker recomputes them
+(app.services.derived_state), keeping ingest cost independent of how many
+events those rows aggregate.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2024-10-01
+"""
+from alembic import op
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS derived_state_queue (
+            customer_id TEXT NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            queued_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (customer_id, kind, key)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_derived_state_queue_queued ON derived_state_queue (queued_at)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS derived_state_queue")
@@ -0,0 +1,48 @@
+"""Helpers shared by the database tests."""
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+def insert_event(db: Session, customer_id: str, event_type: str, ts: datetime, **fields: Any) -> None:
+    """Write one event row with typed columns (no side effects)."""
+    columns = ["id", "customer_id", "event_type", "ts", *fields]
+    db.execute(
+        text(f"INSERT INTO events ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"),
+        {"id": str(uuid.uuid4()), "customer_id": customer_id, "event_type": event_type, "ts": ts, **fields}
+    )
+
+
+def race(session_factory, first_write: Callable[[Session], Any], second_write: Callable[[Session], Any]) -> None:
+    """
+    Run first_write, then start second_write in another transaction while the first
+    is still open, and commit the first only once the second is waiting on it.
+    """
+    first, second = session_factory(), session_factory()
+    errors = []
+
+    def run_second():
+        try:
+            second_write(second)
+            second.commit()
+        except Exception as e:  # surfaced in the main thread
+            errors.append(e)
+
+    try:
+        first_write(first)
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        thread.join(0.5)
+        assert thread.is_alive(), "second write should wait for the first transaction"
+        first.commit()
+        thread.join(10)
+        assert not thread.is_alive()
+    finally:
+        first.close()
+        second.close()
+    if errors:
+        raise errors[0]
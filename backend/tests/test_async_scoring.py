@@ -0,0 +1,70 @@
+"""Async single-customer scoring: engine parity and the per-call connection cap on per-factor queries."""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import to_async_url
+from app.services.async_health_scoring import calculate_customer_health_score_async
+from app.services.health_scoring import calculate_customer_health_score_per_factor
+from benchmarks.parity_vectorized import diff
+
+from .test_engine_parity import PERIOD_END, PERIOD_START, crafted  # noqa: F401  (fixture)
+
+
+def _score_concurrently(customer_ids, requests: int, source=None):
+    """Score every customer `requests` times at once; returns the scores and the most connections held."""
+    async def run():
+        engine = create_async_engine(to_async_url(os.environ['TEST_DATABASE_URL']), pool_size=20)
+        held = peak = 0
+
+        def checkout(*args):
+            nonlocal held, peak
+            held += 1
+            peak = max(peak, held)
+
+        def checkin(*args):
+            nonlocal held
+            held -= 1
+
+        event.listen(engine.sync_engine, 'checkout', checkout)
+        event.listen(engine.sync_engine, 'checkin', checkin)
+        sessions = async_sessionmaker(bind=engine)
+
+        async def score(customer_id):
+            async with sessions() as db:
+                return customer_id, await calculate_customer_health_score_async(
+                    db, customer_id, PERIOD_START, PERIOD_END, source=source)
+        try:
+            results = await asyncio.gather(*(score(customer_id)
+                                             for customer_id in customer_ids for _ in range(requests)))
+        finally:
+            await engine.dispose()
+        return results, peak
+    return asyncio.run(run())
+
+
+def test_per_factor_queries_are_capped_per_call(db, crafted, monkeypatch):  # noqa: F811
+    monkeypatch.setenv('HEALTH_SCORE_SINGLE_PASS', 'false')
+    monkeypatch.setenv('ASYNC_SCORING_CONNECTIONS', '2')
+    db.commit()  # visible to the async engine; make_customer still deletes it
+    _, peak = _score_concurrently(crafted[:1], requests=1)
+    assert peak <= 2
+
+    results, peak = _score_concurrently(crafted, requests=3)
+    assert peak <= 2 * len(crafted) * 3
+    for customer_id, actual in results:
+        expected = calculate_customer_health_score_per_factor(db, customer_id, PERIOD_START, PERIOD_END)
+        assert diff(expected, actual) == []
+
+
+@pytest.mark.parametrize('source', ['events', 'rollup', 'vectorized'])
+def test_source_selects_the_engine(db, crafted, source, monkeypatch):  # noqa: F811
+    monkeypatch.setenv('HEALTH_SCORE_SOURCE', 'events' if source != 'events' else 'rollup')
+    db.commit()
+    results, _ = _score_concurrently(crafted, requests=1, source=source)
+    for customer_id, actual in results:
+        expected = calculate_customer_health_score_per_factor(db, customer_id, PERIOD_START, PERIOD_END)
+        assert diff(expected, actual) == []
@@ -0,0 +1,61 @@
+"""Concurrent ingests touching the same invoice or ticket must not lose each other's events."""
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from app.services.invoice_ledger import refresh_invoice_ledger
+from app.services.ticket_states import refresh_ticket_states
+
+from .helpers import insert_event, race
+
+
+def test_concurrent_invoice_and_payment_both_reach_the_ledger(db_engine, session_factory, make_customer):
+    customer_id = make_customer()
+    key = {(customer_id, 'inv_race')}
+
+    def issue(db):
+        insert_event(db, customer_id, 'invoice_generated', datetime(2024, 9, 10, 12), invoice_id='inv_race',
+                     amount_usd=250.0, due_date=date(2024, 9, 20))
+        refresh_invoice_ledger(db, key)
+
+    def pay(db):
+        insert_event(db, customer_id, 'payment_received', datetime(2024, 9, 22, 12), invoice_id='inv_race',
+                     payment_date=date(2024, 9, 22), days_early_late=2)
+        refresh_invoice_ledger(db, key)
+
+    race(session_factory, issue, pay)
+
+    with db_engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT amount_usd, payment_date, status FROM invoice_ledger
+            WHERE customer_id = :customer_id AND invoice_id = 'inv_race'
+        """), {'customer_id': customer_id}).one()
+    assert row.amount_usd == 250.0
+    assert row.payment_date == date(2024, 9, 22)
+    assert row.status == 'late_acceptable'
+
+
+def test_concurrent_ticket_events_both_reach_the_ticket_state(db_engine, session_factory, make_customer):
+    customer_id = make_customer()
+    key = {(customer_id, 'tkt_race')}
+
+    def open_ticket(db):
+        insert_event(db, customer_id, 'support_ticket_created', datetime(2024, 9, 10, 12), ticket_id='tkt_race',
+                     priority='high')
+        refresh_ticket_states(db, key)
+
+    def resolve_ticket(db):
+        insert_event(db, customer_id, 'support_ticket_resolved', datetime(2024, 9, 11, 12), ticket_id='tkt_race',
+                     resolution_type='resolved', satisfaction_score=4.0)
+        refresh_ticket_states(db, key)
+
+    race(session_factory, open_ticket, resolve_ticket)
+
+    with db_engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT opened_at, resolved_at, priority FROM ticket_states
+            WHERE customer_id = :customer_id AND ticket_id = 'tkt_race'
+        """), {'customer_id': customer_id}).one()
+    assert row.opened_at is not None
+    assert row.resolved_at is not None
+    assert row.priority == 'high'
@@ -0,0 +1,91 @@
+"""Ingest queues ledger, ticket and sketch rows; scoring applies them first."""
+from sqlalchemy import text
+
+from app.services.derived_state import apply_pending_derived_state
+from app.services.ingestion import ingest_events
+from app.services.score_snapshots import recompute_scores
+
+QUEUE_SQL = "SELECT kind, key FROM derived_state_queue WHERE customer_id = :customer_id ORDER BY kind, key"
+
+
+def _count(db, table, customer_id):
+    return db.execute(text(f"SELECT COUNT(*) FROM {table} WHERE customer_id = :customer_id"),
+                      {'customer_id': customer_id}).scalar()
+
+
+def _ingest(db, customer_id, *events):
+    rows = [{'customer_id': customer_id, 'event_type': event_type, 'ts': ts, 'metadata': metadata}
+            for event_type, ts, metadata in events]
+    assert ingest_events(db, rows)['inserted'] == len(rows)
+
+
+def test_ingest_queues_derived_rows_and_scoring_applies_them(db, make_customer):
+    customer_id = make_customer()
+    _ingest(db, customer_id,
+            ('support_ticket_created', '2024-09-02T10:00:00+00:00', {'ticket_id': 't1', 'priority': 'high'}),
+            ('invoice_generated', '2024-09-02T11:00:00+00:00', {'invoice_id': 'i1', 'amount_usd': 10}),
+            ('user_login', '2024-09-02T12:00:00+00:00', {}))
+    _ingest(db, customer_id,
+            ('support_ticket_resolved', '2024-09-03T10:00:00+00:00', {'ticket_id': 't1'}),
+            ('api_call', '2024-09-03T11:00:00+00:00', {'endpoint': '/a', 'response_time_ms': 20}))
+
+    params = {'customer_id': customer_id}
+    assert [tuple(row) for row in db.execute(text(QUEUE_SQL), params)] == [
+        ('invoice', 'i1'), ('sketch', '2024-09-02'), ('sketch', '2024-09-03'), ('ticket', 't1')
+    ]
+    assert _count(db, 'ticket_states', customer_id) == 0
+    assert _count(db, 'customer_daily_sketches', customer_id) == 0
+
+    recompute_scores(db, [customer_id])
+    db.commit()
+
+    assert _count(db, 'derived_state_queue', customer_id) == 0
+    assert _count(db, 'invoice_ledger', customer_id) == 1
+    assert _count(db, 'customer_daily_sketches', customer_id) == 2
+    resolved_at = db.execute(text("SELECT resolved_at FROM ticket_states WHERE customer_id = :customer_id"),
+                             params).scalar()
+    assert resolved_at is not None
+
+
+def test_drain_leaves_keys_of_uncommitted_ingests(db, session_factory, make_customer):
+    customer_id = make_customer()
+    _ingest(db, customer_id, ('user_login', '2024-09-02T12:00:00+00:00', {}))
+
+    ingesting = session_factory()
+    try:
+        # Re-queues the committed key and holds it until this ingest commits
+        ingesting.execute(text("""
+            INSERT INTO derived_state_queue (customer_id, kind, key) VALUES (:customer_id, 'sketch', '2024-09-02')
+            ON CONFLICT (customer_id, kind, key) DO UPDATE SET queued_at = derived_state_queue.queued_at
+        """), {'customer_id': customer_id})
+        apply_pending_derived_state(db, limit=None)
+        db.commit()
+        assert _count(db, 'derived_state_queue', customer_id) == 1
+        ingesting.commit()
+    finally:
+        ingesting.close()
+
+    apply_pending_derived_state(db, limit=None)
+    db.commit()
+    assert _count(db, 'derived_state_queue', customer_id) == 0
+    assert _count(db, 'customer_daily_sketches', customer_id) == 1
+
+
+def test_sketch_days_are_queued_in_the_session_time_zone(db, make_customer):
+    customer_id = make_customer()
+    db.execute(text("SET TIME ZONE 'America/New_York'"))
+    try:
+        # 02:00 UTC on Sep 3 is still Sep 2 in New York, where DATE(ts) buckets it
+        _ingest(db, customer_id,
+                ('api_call', '2024-09-03T02:00:00+00:00', {'endpoint': '/a', 'response_time_ms': 20}))
+        params = {'customer_id': customer_id}
+        assert [tuple(row) for row in db.execute(text(QUEUE_SQL), params)] == [('sketch', '2024-09-02')]
+
+        apply_pending_derived_state(db, [customer_id])
+        days = db.execute(text("SELECT day FROM customer_daily_sketches WHERE customer_id = :customer_id"),
+                          params).scalars().all()
+        assert [day.isoformat() for day in days] == ['2024-09-02']
+    finally:
+        db.rollback()
+        db.execute(text("RESET TIME ZONE"))
+        db.commit()
@@ -0,0 +1,170 @@
+"""
+Every scoring engine must return what calculate_customer_health_score_per_factor
+returns, factor by factor, for the same window.
+
+The crafted customer exercises the rules the engines have to share: tickets
+opened before the window and still open, a ticket reopened after its
+resolution, a ticket resolved after the window, invoices paid twice, issued
+twice or paid after the window, failed payments, and events missing the key a
+factor groups by.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.models import Customer
+from app.services.health_scoring import (
+    calculate_bulk_health_scores,
+    calculate_customer_health_score,
+    calculate_customer_health_score_per_factor,
+)
+from app.services.invoice_ledger import rebuild_invoice_ledger
+from app.services.rollups import refresh_rollups_for_range
+from app.services.score_history import PERIOD_END_TIME, calculate_score_history
+from app.services.ticket_states import rebuild_ticket_states
+from benchmarks.parity_vectorized import diff
+
+from .helpers import insert_event
+
+# The window history and get_period_dates use: 30 days ending 23:59. Day-granular
+# factors avoid the partial first and last days, which rollups count whole.
+PERIOD_END = datetime.combine(date(2024, 9, 30), PERIOD_END_TIME)
+PERIOD_START = PERIOD_END - timedelta(days=30)
+
+
+def _at(month: int, day: int, hour: int = 12) -> datetime:
+    return datetime(2024, month, day, hour)
+
+
+def _write_events(db, customer_id: str) -> None:
+    def add(event_type, ts, **fields):
+        insert_event(db, customer_id, event_type, ts, **fields)
+
+    # Login: three distinct days in the window, one in the look-back
+    for ts in (_at(9, 2, 9), _at(9, 2, 17), _at(9, 5), _at(9, 29), _at(8, 15)):
+        add('user_login', ts)
+
+    # Features: a partial onboarding, a repeated one and a usage without a feature name
+    add('feature_onboarded', _at(9, 3), feature_name='reports', completion_percentage=100)
+    add('feature_onboarded', _at(9, 4), feature_name='alerts', completion_percentage=60)
+    add('feature_onboarded', _at(9, 6), feature_name='reports', completion_percentage=100)
+    add('feature_used', _at(9, 3), feature_name='reports')
+    add('feature_used', _at(9, 10), feature_name='reports')
+    add('feature_used', _at(9, 12), feature_name='export')
+    add('feature_used', _at(9, 13))
+
+    # Support
+    add('support_ticket_created', _at(8, 20), ticket_id='t1', priority='high')        # before, still open
+    add('support_ticket_created', _at(8, 25), ticket_id='t2', priority='low')         # before, resolved in
+    add('support_ticket_resolved', _at(9, 3), ticket_id='t2', resolution_type='resolved', satisfaction_score=5.0)
+    add('support_ticket_created', _at(9, 5), ticket_id='t3', priority='critical')     # reopened
+    add('support_ticket_resolved', _at(9, 7), ticket_id='t3', resolution_type='escalated', satisfaction_score=2.0)
+    add('support_ticket_created', _at(9, 9), ticket_id='t3', priority='low')
+    add('support_ticket_created', _at(9, 10), ticket_id='t4', priority='low')
+    add('support_ticket_resolved', _at(9, 12), ticket_id='t4', resolution_type='resolved', satisfaction_score=4.0)
+    add('support_ticket_created', _at(9, 14), ticket_id='t5', priority='medium')      # resolved after
+    add('support_ticket_resolved', _at(10, 2), ticket_id='t5', resolution_type='resolved', satisfaction_score=3.0)
+    add('support_ticket_created', _at(9, 15), priority='high')                        # no ticket id
+
+    # Payment
+    add('invoice_generated', _at(9, 1), invoice_id='i1', amount_usd=100.0, due_date=date(2024, 9, 10))
+    add('payment_received', _at(9, 5), invoice_id='i1', payment_date=date(2024, 9, 7), days_early_late=-3)
+    add('payment_received', _at(9, 8), invoice_id='i1', payment_date=date(2024, 9, 22), days_early_late=12)
+    add('invoice_generated', _at(9, 10), invoice_id='i2', amount_usd=200.0, due_date=date(2024, 9, 20))
+    add('payment_failed', _at(9, 15), invoice_id='i2')
+    add('payment_failed', _at(9, 16), invoice_id='i2')
+    add('invoice_generated', _at(8, 10), invoice_id='i3', amount_usd=40.0, due_date=date(2024, 8, 20))
+    add('payment_received', _at(9, 2), invoice_id='i3', payment_date=date(2024, 9, 2), days_early_late=13)
+    add('payment_failed', _at(9, 2), invoice_id='i3')
+    add('invoice_generated', _at(9, 3), invoice_id='i4', amount_usd=50.0, due_date=date(2024, 9, 15))
+    add('invoice_generated', _at(9, 20), invoice_id='i4', amount_usd=75.0, due_date=date(2024, 9, 20))
+    add('payment_received', _at(9, 25), invoice_id='i4', payment_date=date(2024, 9, 25), days_early_late=5)
+    add('invoice_generated', _at(9, 18), invoice_id='i5', amount_usd=80.0, due_date=date(2024, 10, 3))
+    add('payment_received', _at(10, 3), invoice_id='i5', payment_date=date(2024, 10, 3), days_early_late=0)
+    add('payment_received', _at(9, 6), payment_date=date(2024, 9, 6), days_early_late=1)  # no invoice id
+
+    # API: mixed status codes, a missing endpoint and response time, look-back calls
+    add('api_call', _at(9, 2), endpoint='/a', response_code=200, response_time_ms=120)
+    add('api_call', _at(9, 2, 13), endpoint='/b', response_code=500, response_time_ms=300)
+    add('api_call', _at(9, 20), endpoint='/a', response_code=201, response_time_ms=80)
+    add('api_call', _at(9, 21), response_code=200)
+    add('api_rate_limit_exceeded', _at(9, 22))
+    add('api_call', _at(8, 10), endpoint='/a', response_code=200, response_time_ms=90)
+    add('api_call', _at(8, 12), endpoint='/a', response_code=200, response_time_ms=95)
+
+
+@pytest.fixture
+def crafted(db, make_customer):
+    """A customer with every edge case and a customer with no events, with derived tables built."""
+    busy, idle = make_customer(), make_customer()
+    _write_events(db, busy)
+    refresh_rollups_for_range(db, date(2024, 8, 1), date(2024, 10, 31), [busy, idle])
+    rebuild_invoice_ledger(db, [busy, idle])
+    rebuild_ticket_states(db, [busy, idle])
+    return [busy, idle]
+
+
+def test_reference_applies_ticket_and_ledger_rules(db, crafted):
+    breakdown = calculate_customer_health_score_per_factor(db, crafted[0], PERIOD_START, PERIOD_END)['breakdown']
+
+    support = breakdown['support_tickets']
+    assert support['tickets_created'] == 3           # t3, t4, t5
+    assert support['tickets_resolved'] == 2          # t2, t4; t3 was reopened
+    assert support['currently_open_tickets'] == 3    # t1 from before the window, t3, t5
+
+    payment = breakdown['payment_health']
+    assert payment['total_invoices'] == 4            # i1, i2, i4 (latest issue), i5
+    assert payment['unpaid_invoices'] == 1
+    assert payment['on_time_rate'] == 25.0           # i5, paid after the window; i1's latest payment is late
+    assert payment['unpaid_amount'] == 200.0
+    # 25% on time, one unpaid, one concerning, two failures, average delay (12 + 5 + 0) / 3
+    assert payment['score'] == 57.7
+
+
+@pytest.mark.parametrize('source', ['events', 'rollup', 'vectorized'])
+def test_bulk_engines_match_reference(db, crafted, source):
+    scores = calculate_bulk_health_scores(db, crafted, PERIOD_START, PERIOD_END, source=source)
+    for customer_id in crafted:
+        expected = calculate_customer_health_score_per_factor(db, customer_id, PERIOD_START, PERIOD_END)
+        assert diff(expected, scores[customer_id]) == []
+
+
+def test_single_pass_matches_reference(db, crafted, monkeypatch):
+    monkeypatch.setenv('HEALTH_SCORE_SINGLE_PASS', 'true')
+    for customer_id in crafted:
+        expected = calculate_customer_health_score_per_factor(db, customer_id, PERIOD_START, PERIOD_END)
+        actual = calculate_customer_health_score(db, db.get(Customer, customer_id), PERIOD_START, PERIOD_END,
+                                                 source='events')
+        assert diff(expected, actual) == []
+
+
+def test_history_matches_reference(db, crafted):
+    history = calculate_score_history(db, crafted, PERIOD_END.date(), PERIOD_END.date(), include_breakdown=True)
+    for customer_id in crafted:
+        expected = calculate_customer_health_score_per_factor(db, customer_id, PERIOD_START, PERIOD_END)
+        point = history[customer_id][0]
+        assert diff({key: expected[key] for key in ('score', 'label', 'breakdown')},
+                    {key: point[key] for key in ('score', 'label', 'breakdown')}) == []
+
+
+@pytest.mark.parametrize('start, end, step_days, window_days', [
+    (date(2024, 9, 1), date(2024, 10, 5), 1, 30),    # daily, sliding past every crafted event
+    (date(2024, 8, 20), date(2024, 10, 20), 7, 30),  # weekly
+    (date(2024, 9, 1), date(2024, 10, 5), 1, 14),
+])
+def test_sliding_history_matches_single_window_scores(db, crafted, start, end, step_days, window_days):
+    # Each point must equal scoring its window on its own; the rollup engine shares
+    # history's day-granular windows, and test_bulk_engines_match_reference ties it
+    # to the reference.
+    history = calculate_score_history(db, crafted, start, end, window_days, step_days, include_breakdown=True)
+    points = [start + timedelta(days=offset) for offset in range(0, (end - start).days + 1, step_days)]
+    window = timedelta(days=window_days)
+    for customer_id in crafted:
+        assert [point['date'] for point in history[customer_id]] == [day.isoformat() for day in points]
+    for index, day in enumerate(points):
+        period_end = datetime.combine(day, PERIOD_END_TIME)
+        expected = calculate_bulk_health_scores(db, crafted, period_end - window, period_end, source='rollup')
+        for customer_id in crafted:
+            point = history[customer_id][index]
+            assert diff({key: expected[customer_id][key] for key in ('score', 'label', 'breakdown')},
+                        {key: point[key] for key in ('score', 'label', 'breakdown')}) == [], day
@@ -0,0 +1,49 @@
+"""Typed event fields: the Python parsers and their SQL backfill must agree."""
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.services.event_fields import BACKFILL_SQL, extract_event_fields
+
+METADATA = [
+    {'due_date': '2024-09-30', 'payment_date': '2024-09-30T12:00:00Z', 'response_code': '200',
+     'days_early_late': -3, 'amount_usd': '12.5', 'completion_percentage': 100.0},
+    {'due_date': '2024-13-45', 'payment_date': '2024-02-30', 'response_code': 99999999999,
+     'days_early_late': '1.5', 'amount_usd': '1e400', 'completion_percentage': 'all'},
+    {'due_date': 20240930, 'response_time_ms': True, 'satisfaction_score': 'NaN', 'endpoint': 7},
+    {},
+]
+
+
+@pytest.mark.parametrize('metadata, expected', [
+    (METADATA[0], {'due_date': date(2024, 9, 30), 'payment_date': date(2024, 9, 30), 'response_code': 200,
+                   'days_early_late': -3, 'amount_usd': 12.5, 'completion_percentage': 100}),
+    (METADATA[1], {'due_date': None, 'payment_date': None, 'response_code': None,
+                   'days_early_late': None, 'amount_usd': None, 'completion_percentage': None}),
+    (METADATA[2], {'due_date': None, 'response_time_ms': None, 'satisfaction_score': None, 'endpoint': '7'}),
+])
+def test_extract_event_fields(metadata, expected):
+    fields = extract_event_fields(metadata)
+    assert {column: fields[column] for column in expected} == expected
+    assert all(value is None for column, value in fields.items() if column not in metadata)
+
+
+def test_backfill_sql_matches_python_parsers(db, make_customer):
+    customer_id = make_customer()
+    for index, metadata in enumerate(METADATA):
+        db.execute(text("""
+            INSERT INTO events (id, customer_id, event_type, ts, event_metadata)
+            VALUES (:id, :customer_id, 'api_call', '2024-09-02', CAST(:metadata AS jsonb))
+        """), {'id': f'{customer_id}_{index}', 'customer_id': customer_id, 'metadata': json.dumps(metadata)})
+    db.execute(text(BACKFILL_SQL + " AND customer_id = :customer_id"),
+               {'start': date(2024, 9, 2), 'end': date(2024, 9, 3), 'customer_id': customer_id})
+
+    columns = list(extract_event_fields({}))
+    rows = db.execute(text(f"SELECT id, {', '.join(columns)} FROM events WHERE customer_id = :customer_id"),
+                      {'customer_id': customer_id}).fetchall()
+    by_id = {row.id: row for row in rows}
+    for index, metadata in enumerate(METADATA):
+        row = by_id[f'{customer_id}_{index}']
+        assert {column: getattr(row, column) for column in columns} == extract_event_fields(metadata)
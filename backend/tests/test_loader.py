@@ -0,0 +1,148 @@
+"""Bulk loader: row normalization, partitions created before writing, and resuming after an interrupted derived-state rebuild."""
+import csv
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import loader
+from app.db.partitions import partition_name
+from app.loader import RowError, normalize_customer, normalize_event, normalize_metadata, normalize_timestamp
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-10-01T02:00:00Z', datetime(2024, 10, 1, 2, tzinfo=timezone.utc)),
+    (' 2024-10-01T02:00:00 ', datetime(2024, 10, 1, 2, tzinfo=timezone.utc)),    # naive is UTC
+    ('2024-09-30T22:00:00-04:00', datetime(2024, 10, 1, 2, tzinfo=timezone.utc)),
+    (datetime(2024, 10, 1, 4, tzinfo=timezone(timedelta(hours=2))), datetime(2024, 10, 1, 2, tzinfo=timezone.utc)),
+    (date(2024, 10, 1), datetime(2024, 10, 1, tzinfo=timezone.utc)),
+])
+def test_normalize_timestamp_returns_utc(value, expected):
+    ts = normalize_timestamp(value, 'ts')
+    assert ts == expected and ts.utcoffset() == timedelta(0)
+
+
+def test_normalize_timestamp_rejects_missing_and_invalid():
+    assert normalize_timestamp('', 'created_at', required=False) is None
+    with pytest.raises(RowError, match='ts is required'):
+        normalize_timestamp(None, 'ts')
+    with pytest.raises(RowError, match='invalid ts'):
+        normalize_timestamp('yesterday', 'ts')
+
+
+def test_normalize_metadata():
+    assert normalize_metadata('') is None
+    assert normalize_metadata('{"ticket_id": "t1"}') == {'ticket_id': 't1'}
+    assert normalize_metadata({'a': 1}) == {'a': 1}
+    for bad in ('{not json', '[1, 2]', 3):
+        with pytest.raises(RowError):
+            normalize_metadata(bad)
+
+
+def test_normalize_customer():
+    assert normalize_customer({'id': ' c1 ', 'name': 'Acme', 'segment': 'smb', 'created_at': ''}) == \
+        ('c1', 'Acme', 'smb', None)
+    assert normalize_customer({'id': 'c1', 'name': 'Acme', 'segment': 'smb',
+                               'created_at': '2024-01-02T03:04:05Z'})[3] == '2024-01-02T03:04:05+00:00'
+    with pytest.raises(RowError):
+        normalize_customer({'id': 'c1', 'name': ' ', 'segment': 'smb'})
+
+
+def test_normalize_event_ids_fields_and_metadata():
+    row = {'customer_id': 'c1', 'event_type': 'api_call', 'ts': '2024-10-01T02:00:00Z',
+           'event_metadata': '{"endpoint": "/a", "response_code": "200", "response_time_ms": 120}'}
+    event = normalize_event(row, 'events.csv', 7)
+    assert event[:4] == (str(uuid.uuid5(uuid.NAMESPACE_URL, 'events.csv#7')), 'c1', 'api_call',
+                         '2024-10-01T02:00:00+00:00')
+    assert event == normalize_event(row, 'events.csv', 7)           # reloading keeps the id
+    assert event[0] != normalize_event(row, 'events.csv', 8)[0]
+    assert json.loads(event[4]) == {'endpoint': '/a', 'response_code': '200', 'response_time_ms': 120}
+    assert len(event) == len(loader.EVENT_COLUMNS)
+    fields = dict(zip(loader.EVENT_COLUMNS, event))
+    assert (fields['endpoint'], fields['response_code'], fields['response_time_ms']) == ('/a', 200, 120)
+
+    # An explicit id wins, and metadata may come as "metadata"
+    renamed = {key: value for key, value in row.items() if key != 'event_metadata'}
+    explicit = normalize_event({**renamed, 'id': 'e1', 'metadata': {'x': 1}}, 'events.csv', 7)
+    assert explicit[0] == 'e1' and json.loads(explicit[4]) == {'x': 1}
+    with pytest.raises(RowError):
+        normalize_event({'customer_id': 'c1', 'ts': '2024-10-01'}, 'events.csv', 1)
+
+
+@pytest.fixture
+def new_york_engine(db_engine, monkeypatch):
+    """Point the loader at the test database with a session time zone west of UTC."""
+    engine = create_engine(db_engine.url, connect_args={"options": "-c timezone=America/New_York"})
+    monkeypatch.setattr(loader, "engine", engine)
+    monkeypatch.setattr(loader, "SessionLocal", sessionmaker(bind=engine))
+    yield engine
+    engine.dispose()
+
+
+def test_resumed_load_rebuilds_derived_state_for_finished_chunks(tmp_path, monkeypatch, new_york_engine,
+                                                                  make_customer):
+    customer_id = make_customer()
+    path = tmp_path / "events.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["customer_id", "event_type", "ts", "event_metadata"])
+        # 02:00 UTC on Oct 1 is still Sep 30 in New York
+        writer.writerow([customer_id, "user_login", "2024-10-01T02:00:00Z", ""])
+        writer.writerow([customer_id, "support_ticket_created", "2024-10-01T03:00:00Z",
+                         json.dumps({"ticket_id": "t1", "priority": "high"})])
+        writer.writerow([customer_id, "user_login", "2024-10-02T15:00:00Z", ""])
+    checkpoint_path = str(tmp_path / "events.checkpoint.json")
+
+    def interrupted(*args, **kwargs):
+        raise RuntimeError("interrupted")
+
+    original = loader.rebuild_invoice_ledger
+    monkeypatch.setattr(loader, "rebuild_invoice_ledger", interrupted)
+    with pytest.raises(RuntimeError):
+        loader.run_load("events", str(path), chunk_size=2, checkpoint_path=checkpoint_path)
+    monkeypatch.setattr(loader, "rebuild_invoice_ledger", original)
+
+    stats = loader.run_load("events", str(path), chunk_size=2, checkpoint_path=checkpoint_path)
+    assert stats["skipped_chunks"] == 2
+    assert stats["customers_affected"] == 1
+
+    with new_york_engine.connect() as conn:
+        days = {row[0] for row in conn.execute(text("""
+            SELECT day FROM customer_daily_rollups WHERE customer_id = :customer_id AND event_type = 'user_login'
+        """), {"customer_id": customer_id})}
+        tickets = conn.execute(text("SELECT COUNT(*) FROM ticket_states WHERE customer_id = :customer_id"),
+                               {"customer_id": customer_id}).scalar()
+    assert days == {date(2024, 9, 30), date(2024, 10, 2)}
+    assert tickets == 1
+
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    assert state["customers"] == []
+
+
+def test_event_partitions_are_created_before_rows_are_written(tmp_path, new_york_engine, make_customer):
+    customer_id = make_customer()
+    months = [date(2091, 3, 1), date(2091, 4, 1)]
+    path = tmp_path / "events.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["customer_id", "event_type", "ts", "event_metadata"])
+        writer.writerow([customer_id, "user_login", "2091-03-31T23:30:00Z", ""])
+        # Still Mar 31 in New York, but partitions are bounded on UTC months
+        writer.writerow([customer_id, "user_login", "2091-04-01T02:00:00Z", ""])
+    try:
+        stats = loader.run_load("events", str(path), chunk_size=1,
+                                checkpoint_path=str(tmp_path / "events.checkpoint.json"), refresh_derived=False)
+        assert stats["written"] == 2
+        with new_york_engine.connect() as conn:
+            partitions = conn.execute(text("""
+                SELECT tableoid::regclass::text, COUNT(*) FROM events WHERE customer_id = :customer_id GROUP BY 1
+            """), {"customer_id": customer_id}).fetchall()
+        assert dict(partitions) == {partition_name(month): 1 for month in months}
+    finally:
+        with new_york_engine.begin() as conn:
+            for month in months:
+                conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(month)}"))
@@ -0,0 +1,24 @@
+"""Event partition maintenance."""
+from datetime import date
+
+from sqlalchemy import text
+
+from app.db.partitions import ensure_event_partitions, partition_name
+
+from .helpers import race
+
+MONTH = date(2090, 1, 1)
+
+
+def test_concurrent_startups_create_each_partition_once(db_engine, session_factory):
+    created = []
+
+    def ensure(db):
+        created.extend(ensure_event_partitions(db, MONTH, MONTH))
+
+    try:
+        race(session_factory, ensure, ensure)
+        assert created == [partition_name(MONTH)]
+    finally:
+        with db_engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(MONTH)}"))
@@ -0,0 +1,191 @@
+"""
+Read-your-writes across workers, against a simulated replica: a second session
+factory on the test database. Not being a standby, it has replayed everything
+the primary committed, so a write token past the primary's position stands in
+for a write the replica has not replayed yet.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Response
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app import database
+from app.db.replicas import (
+    WRITE_LSN_COOKIE,
+    WRITE_LSN_HEADER,
+    ReadRouter,
+    WriteMarks,
+    client_write_lsn,
+    current_wal_lsn,
+    latest_lsn,
+    set_write_lsn,
+)
+from app.services.ingestion import ingest_events
+
+
+def _role(db) -> str:
+    return db.info['role']
+
+
+def _ahead(lsn: str) -> str:
+    """A position 4 GB of WAL past lsn."""
+    high, low = lsn.split('/')
+    return f"{int(high, 16) + 1:X}/{low}"
+
+
+def _request(headers=None, path_params=None) -> Request:
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': raw,
+                    'path_params': path_params or {}})
+
+
+@pytest.fixture
+def worker(db_engine):
+    """A ReadRouter as one worker process builds it: its own write marks, one replica."""
+    def build() -> ReadRouter:
+        primary = sessionmaker(bind=db_engine, info={'role': 'primary'})
+        replica = sessionmaker(bind=db_engine, info={'role': 'replica'})
+        return ReadRouter(primary, [replica], WriteMarks())
+    return build
+
+
+def test_latest_lsn_compares_positions_not_text():
+    assert latest_lsn('9/FFFFFFFF', '10/0') == '10/0'
+    assert latest_lsn('0/A0', '0/9F') == '0/A0'
+    assert latest_lsn(None, '0/1') == '0/1'
+    assert latest_lsn() is None
+
+
+def test_client_write_lsn_reads_header_then_cookie():
+    assert client_write_lsn(_request({WRITE_LSN_HEADER: '1/A0'})) == '1/A0'
+    assert client_write_lsn(_request({'Cookie': f'{WRITE_LSN_COOKIE}=2/B0'})) == '2/B0'
+    assert client_write_lsn(_request({WRITE_LSN_HEADER: '1/A0', 'Cookie': f'{WRITE_LSN_COOKIE}=2/B0'})) == '1/A0'
+    assert client_write_lsn(_request({WRITE_LSN_HEADER: "0/1'; DROP"})) is None
+    assert client_write_lsn(_request()) is None
+
+
+def test_set_write_lsn_sets_header_and_cookie(monkeypatch):
+    monkeypatch.setenv('DB_READ_YOUR_WRITES_SECONDS', '60')
+    response = Response()
+    set_write_lsn(response, '3/C0')
+    assert response.headers[WRITE_LSN_HEADER] == '3/C0'
+    cookie = response.headers['set-cookie']
+    assert 'Max-Age=60' in cookie and 'HttpOnly' in cookie
+    # The value is quoted in the cookie; reading it back unquotes it
+    assert client_write_lsn(_request({'Cookie': cookie.split(';')[0]})) == '3/C0'
+
+    untouched = Response()
+    set_write_lsn(untouched, None)
+    assert WRITE_LSN_HEADER not in untouched.headers
+
+
+def test_write_marks_expire_and_keep_newer_writes():
+    expired = WriteMarks(ttl_seconds=-1)
+    expired.record(['a'], '0/1')
+    assert expired.pending('a') is None
+    assert len(expired) == 0
+
+    marks = WriteMarks(ttl_seconds=60)
+    marks.record(['a', 'b'], '0/2')
+    assert marks.pending('a') == '0/2'
+
+    marks.record(['a'], '0/3')
+    assert marks.pending('a') == '0/3'
+    assert marks.pending('b') == '0/2'
+    assert len(marks) == 2
+
+
+class _FakeSession:
+    """A session on a replica that has (or has not) replayed every position it is asked about."""
+
+    def __init__(self, role: str, replayed: bool):
+        self.info = {'role': role}
+        self.replayed = replayed
+
+    def execute(self, statement, params=None):
+        return SimpleNamespace(scalar=lambda: self.replayed)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_customer_mark_outlives_one_caught_up_replica():
+    router = ReadRouter(lambda: _FakeSession('primary', True),
+                        [lambda: _FakeSession('caught_up', True), lambda: _FakeSession('lagging', False)],
+                        WriteMarks(ttl_seconds=60))
+    router.marks.record(['test_customer'], '0/10')
+    # Round-robin alternates the replicas; the lagging one never serves the customer
+    roles = [_role(router.session('test_customer')) for _ in range(4)]
+    assert roles == ['caught_up', 'primary', 'caught_up', 'primary']
+    assert router.stats['replica_behind'] == 2
+
+
+def test_token_from_another_worker_waits_for_the_replica(db, worker):
+    writer, reader = worker(), worker()
+    lsn = current_wal_lsn(db)
+    db.rollback()
+    writer.marks.record(['test_customer'], lsn)
+    assert len(reader.marks) == 0
+
+    # Without the token the reader knows nothing of the write
+    behind = _ahead(lsn)
+    session = reader.session('test_customer')
+    assert _role(session) == 'replica'
+    session.close()
+
+    session = reader.session('test_customer', behind)
+    assert _role(session) == 'primary'
+    session.close()
+    assert reader.stats['replica_behind'] == 1
+
+    session = reader.session('test_customer', lsn)
+    assert _role(session) == 'replica'
+    session.close()
+
+
+def test_customer_mark_still_applies_without_a_token(db, worker):
+    router = worker()
+    lsn = _ahead(current_wal_lsn(db))
+    db.rollback()
+    router.marks.record(['test_customer'], lsn)
+
+    session = router.session('test_customer')
+    assert _role(session) == 'primary'
+    session.close()
+    # An older client token does not lower the customer's mark
+    session = router.session('test_customer', '0/1')
+    assert _role(session) == 'primary'
+    session.close()
+
+
+def test_get_read_db_uses_the_client_token(db, worker, monkeypatch):
+    router = worker()
+    monkeypatch.setattr(database, 'read_router', router)
+    behind = _ahead(current_wal_lsn(db))
+    db.rollback()
+
+    for request, role in ((_request({WRITE_LSN_HEADER: behind}, {'id': 'test_customer'}), 'primary'),
+                          (_request({'Cookie': f'{WRITE_LSN_COOKIE}={behind}'}), 'primary'),
+                          (_request(), 'replica')):
+        dependency = database.get_read_db(request)
+        assert _role(next(dependency)) == role
+        dependency.close()
+
+
+def test_ingest_returns_the_commit_position(db, make_customer, monkeypatch):
+    customer_id = make_customer()
+    rows = [{'customer_id': customer_id, 'event_type': 'user_login', 'ts': datetime(2024, 9, 2).isoformat()}]
+
+    assert ingest_events(db, rows)['write_lsn'] is None
+
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', 'postgresql://replica.invalid/customer_health')
+    before = current_wal_lsn(db)
+    db.rollback()
+    lsn = ingest_events(db, rows)['write_lsn']
+    assert lsn is not None and latest_lsn(before, lsn) == lsn
@@ -0,0 +1,95 @@
+"""What-if re-weighting of stored factor scores (no database)."""
+import numpy as np
+import pytest
+
+from app.services.health_scoring import HEALTH_FACTORS, build_health_score, get_health_weights
+from app.services.reweighting import FactorMatrix, resolve_thresholds, resolve_weights, reweight_scores
+
+THRESHOLDS = {'healthy': 80.0, 'at_risk': 60.0}
+
+# One row per customer in HEALTH_FACTORS order
+FACTORS = [
+    [100.0, 100.0, 100.0, 100.0, 100.0],
+    [90.0, 80.0, 70.0, 60.0, 50.0],
+    [0.0, 20.0, 40.0, 60.0, 80.0],
+    [79.96, 79.96, 79.96, 79.96, 79.96],   # just under Healthy before rounding
+    [10.0, 10.0, 100.0, 100.0, 10.0],
+]
+
+
+def _matrix(labels=None, segments=None, unscored=0) -> FactorMatrix:
+    ids = [f'c{i}' for i in range(len(FACTORS))]
+    return FactorMatrix(ids, segments or ['smb', 'smb', 'enterprise', 'enterprise', 'smb'],
+                        labels or [None] * len(FACTORS), np.array(FACTORS), unscored)
+
+
+def _stored(factors, weights=None):
+    """What build_health_score stores for these factor scores."""
+    return build_health_score(*({'score': score, 'days_logged_in': 0, 'total_days_in_period': 30,
+                                 'login_frequency_percentage': 0, 'features_onboarded': 0, 'features_used': 0,
+                                 'total_feature_usage': 0, 'tickets_created': 0, 'tickets_resolved': 0,
+                                 'currently_open_tickets': 0, 'resolution_rate': 0, 'total_invoices': 0,
+                                 'unpaid_invoices': 0, 'on_time_rate': 0, 'unpaid_amount': 0,
+                                 'total_api_calls': 0, 'active_api_days': 0, 'success_rate': 0,
+                                 'unique_endpoints_used': 0} for score in factors), weights)
+
+
+def test_configured_weights_reproduce_stored_snapshots():
+    stored = [_stored(row) for row in FACTORS]
+    matrix = _matrix(labels=[s['label'] for s in stored])
+    result = reweight_scores(matrix, get_health_weights(), resolve_thresholds(None), changed_limit=len(FACTORS))
+
+    assert result['label_changes'] == 0
+    assert result['changed_customers'] == []
+    assert result['customers'] == len(FACTORS)
+    assert result['average_score'] == round(float(np.mean([s['score'] for s in stored])), 1)
+    expected_labels = {label: sum(s['label'] == label for s in stored) for label in ('Healthy', 'At Risk', 'Unhealthy')}
+    assert result['labels'] == expected_labels
+
+
+def test_new_weights_relabel_and_rank_changes_by_score_move():
+    weights = dict.fromkeys(HEALTH_FACTORS, 0.0)
+    weights['support_tickets'] = weights['payment_health'] = 0.5
+    baseline = [_stored(row) for row in FACTORS]
+    result = reweight_scores(_matrix(labels=[s['label'] for s in baseline]), weights,
+                             {'healthy': 70.0, 'at_risk': 50.0}, changed_limit=2)
+
+    # c2: 37 -> 50, c3: 79.96 -> 79.96, c4: 46 -> 100
+    assert result['label_changes'] == 3
+    assert result['transitions'] == {'At Risk -> Healthy': 1, 'Unhealthy -> At Risk': 1, 'Unhealthy -> Healthy': 1}
+    moved = result['changed_customers']
+    assert [customer['customer_id'] for customer in moved] == ['c4', 'c2']
+    assert moved[0]['score'] == 100.0 and moved[0]['label'] == 'Healthy'
+    assert moved[0]['baseline_score'] == baseline[4]['score']
+
+
+def test_segment_and_thresholds():
+    result = reweight_scores(_matrix(unscored=3), get_health_weights(), {'healthy': 95.0, 'at_risk': 0.0},
+                             segment='enterprise')
+    assert result['customers'] == 2
+    assert result['unscored_customers'] is None
+    assert set(result['segments']) == {'enterprise'}
+    assert result['labels'] == {'Healthy': 0, 'At Risk': 2, 'Unhealthy': 0}
+
+    overall = reweight_scores(_matrix(unscored=3), get_health_weights(), THRESHOLDS)
+    assert overall['unscored_customers'] == 3
+    assert sum(segment['customers'] for segment in overall['segments'].values()) == len(FACTORS)
+
+
+def test_empty_matrix():
+    matrix = FactorMatrix([], [], [], np.zeros((0, len(HEALTH_FACTORS))), unscored=2)
+    result = reweight_scores(matrix, get_health_weights(), THRESHOLDS)
+    assert result['customers'] == 0 and result['average_score'] is None
+    assert result['segments'] == {}
+
+
+@pytest.mark.parametrize('weights', [{'logins': 1.0}, {'api_usage': -1.0}, dict.fromkeys(HEALTH_FACTORS, 0.0)])
+def test_resolve_weights_rejects_bad_input(weights):
+    with pytest.raises(ValueError):
+        resolve_weights(weights)
+
+
+@pytest.mark.parametrize('thresholds', [{'warning': 50.0}, {'healthy': 50.0, 'at_risk': 70.0}, {'healthy': 120.0}])
+def test_resolve_thresholds_rejects_bad_input(thresholds):
+    with pytest.raises(ValueError):
+        resolve_thresholds(thresholds)
@@ -0,0 +1,48 @@
+"""Rollup deltas applied at ingest must equal a full rebuild of the buckets."""
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from app.services.ingestion import ingest_events
+from app.services.rollups import refresh_rollups_for_range
+
+ROLLUP_SQL = """
+    SELECT day, event_type, event_count, match_count, value_sum, value_count, key_counts
+    FROM customer_daily_rollups
+    WHERE customer_id = :customer_id
+    ORDER BY day, event_type
+"""
+
+
+def _rollups(db, customer_id):
+    return [tuple(row) for row in db.execute(text(ROLLUP_SQL), {'customer_id': customer_id})]
+
+
+def test_ingested_batches_add_up_to_a_rebuild(db, make_customer):
+    customer_id = make_customer()
+
+    def event(event_type, hour, **metadata):
+        return {'customer_id': customer_id, 'event_type': event_type,
+                'ts': datetime(2024, 9, 2, hour, tzinfo=timezone.utc).isoformat(), 'metadata': metadata}
+
+    batches = [
+        [event('api_call', 9, endpoint='/a', response_code=200, response_time_ms=100),
+         event('api_call', 10, endpoint='/b', response_code=500),
+         event('user_login', 9)],
+        [event('api_call', 11, endpoint='/a', response_code=201, response_time_ms=50),
+         event('feature_used', 11, feature_name='reports'),
+         event('support_ticket_resolved', 12, ticket_id='t1', resolution_type='escalated', satisfaction_score=4)],
+        [event('api_call', 13, endpoint='/a', response_code=200, response_time_ms=25),
+         event('user_login', 14)],
+    ]
+    for batch in batches:
+        assert ingest_events(db, batch)['inserted'] == len(batch)
+
+    incremental = _rollups(db, customer_id)
+    refresh_rollups_for_range(db, date(2024, 9, 1), date(2024, 9, 3), [customer_id])
+    rebuilt = _rollups(db, customer_id)
+    db.commit()
+
+    assert incremental == rebuilt
+    api_calls = next(row for row in rebuilt if row[1] == 'api_call')
+    assert api_calls[2:] == (4, 3, 175.0, 3, {'/a': 3, '/b': 1})
@@ -0,0 +1,123 @@
+"""LocalScoreCache and the read-through helpers in front of the scoring engines."""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import score_cache
+from app.services.score_cache import LocalScoreCache, make_cache_key
+
+PERIOD_START = datetime(2024, 9, 1)
+PERIOD_END = datetime(2024, 9, 30, 23, 59, 59)
+WEIGHTS = {'login_frequency': 0.25, 'feature_adoption': 0.25}
+
+
+def _key(customer_id: str = 'c1', source: str = 'events'):
+    return make_cache_key(customer_id, PERIOD_START, PERIOD_END, WEIGHTS, source)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(score_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LocalScoreCache(maxsize=3, ttl=60)
+    monkeypatch.setattr(score_cache, '_score_cache', cache)
+    return cache
+
+
+def test_key_includes_source_and_weight_order_does_not_matter():
+    assert _key(source='events') != _key(source='rollup')
+    reordered = dict(reversed(list(WEIGHTS.items())))
+    assert make_cache_key('c1', PERIOD_START, PERIOD_END, reordered, 'events') == _key()
+
+
+def test_get_returns_copies(cache):
+    value = {'score': 50.0, 'breakdown': {'login_frequency': {'score': 40}}}
+    cache.set(_key(), value)
+    value['breakdown']['login_frequency']['score'] = 0
+    first = cache.get(_key())
+    first['breakdown']['login_frequency']['score'] = 1
+    assert cache.get(_key())['breakdown']['login_frequency']['score'] == 40
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.set(_key(), {'score': 1})
+    clock[0] += 59
+    assert cache.get(_key()) == {'score': 1}
+    clock[0] += 2
+    assert cache.get(_key()) is None
+    assert cache.expirations == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for customer_id in ('c1', 'c2', 'c3'):
+        cache.set(_key(customer_id), {'score': customer_id})
+    cache.get(_key('c1'))
+    cache.set(_key('c4'), {'score': 'c4'})
+    assert cache.get(_key('c2')) is None
+    assert cache.get(_key('c1')) == {'score': 'c1'}
+    assert cache.evictions == 1
+    assert cache.stats()['size'] == 3
+
+
+def test_invalidation_drops_only_that_customer(cache):
+    cache.set(_key('c1', 'events'), {'score': 1})
+    cache.set(_key('c1', 'rollup'), {'score': 1})
+    cache.set(_key('c2'), {'score': 2})
+    cache.invalidate_customer('c1')
+    assert cache.get(_key('c1', 'events')) is None
+    assert cache.get(_key('c1', 'rollup')) is None
+    assert cache.get(_key('c2')) == {'score': 2}
+    assert cache.invalidations == 1
+
+
+def test_set_with_outdated_generation_is_dropped(cache):
+    generation = cache.generation('c1')
+    cache.invalidate_customer('c1')  # an event lands while the score is computed
+    cache.set(_key(), {'score': 'before the event'}, generation)
+    assert cache.get(_key()) is None
+    assert cache.stale_writes == 1
+
+    cache.set(_key(), {'score': 'after the event'}, cache.generation('c1'))
+    assert cache.get(_key()) == {'score': 'after the event'}
+
+
+def test_read_through_does_not_cache_a_score_invalidated_mid_computation(cache, monkeypatch):
+    customer = SimpleNamespace(id='c1')
+    calls = []
+
+    def calculate(db, customer, period_start, period_end, source=None):
+        calls.append(source)
+        if len(calls) == 1:
+            cache.invalidate_customer(customer.id)
+        return {'score': len(calls)}
+
+    monkeypatch.setattr(score_cache, 'calculate_customer_health_score', calculate)
+    monkeypatch.setattr(score_cache, 'get_health_weights', lambda: WEIGHTS)
+
+    def cached(**kwargs):
+        return score_cache.cached_customer_health_score(None, customer, PERIOD_START, PERIOD_END, **kwargs)
+
+    assert cached(source='events') == {'score': 1}
+    assert cached(source='events') == {'score': 2}  # the first result was not cached
+    assert cached(source='events') == {'score': 2}
+    assert cached(source='events', fresh=True) == {'score': 3}
+    assert cached(source='events') == {'score': 3}
+    assert cached(source='rollup') == {'score': 4}
+    assert calls == ['events', 'events', 'events', 'rollup']
+
+
+def test_lookup_only_reads_the_cache(cache, monkeypatch):
+    monkeypatch.setattr(score_cache, 'get_health_weights', lambda: WEIGHTS)
+    assert score_cache.get_cached_customer_health_score('c1', PERIOD_START, PERIOD_END, 'events') is None
+    cache.set(_key(), {'score': 1})
+    assert score_cache.get_cached_customer_health_score('c1', PERIOD_START, PERIOD_END, 'events') == {'score': 1}
+    assert score_cache.get_cached_customer_health_score('c1', PERIOD_START, PERIOD_END, 'rollup') is None
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,46 @@
+"""Score export rows: flattening the breakdown into columns and the Parquet column types."""
+from app.services.score_export import (
+    BREAKDOWN_FIELDS,
+    EXPORT_COLUMNS,
+    INTEGER_FIELDS,
+    _column_type,
+    flatten_record,
+)
+
+
+def _record():
+    breakdown = {
+        factor: {field: index for index, field in enumerate(fields)}
+        for factor, fields in BREAKDOWN_FIELDS.items()
+    }
+    breakdown['api_usage']['note'] = 'not exported'
+    del breakdown['payment_health']['unpaid_amount']
+    return {
+        'customer_id': 'c1', 'customer_name': 'Acme', 'segment': 'smb', 'score': 71.5, 'label': 'At Risk',
+        'breakdown': breakdown, 'last_updated': '2024-09-30T23:59:59'
+    }
+
+
+def test_flatten_record_has_one_column_per_breakdown_field():
+    row = flatten_record(_record())
+    assert tuple(row) == EXPORT_COLUMNS
+    assert row['customer_name'] == 'Acme' and row['label'] == 'At Risk'
+    assert row['support_tickets_currently_open_tickets'] == BREAKDOWN_FIELDS['support_tickets'].index(
+        'currently_open_tickets')
+    assert row['payment_health_unpaid_amount'] is None
+    assert 'api_usage_note' not in row
+    assert row['last_updated'] == '2024-09-30T23:59:59'
+
+
+def test_column_types():
+    assert _column_type('customer_id') == 'string'
+    assert _column_type('last_updated') == 'string'
+    assert _column_type('score') == 'float64'
+    assert _column_type('api_usage_total_api_calls') == 'int64'
+    assert _column_type('api_usage_success_rate') == 'float64'
+    # The field is what follows the factor prefix, not any suffix of the column
+    assert _column_type('login_frequency_login_frequency_percentage') == 'float64'
+    assert _column_type('login_frequency_days_logged_in') == 'int64'
+    integer_columns = {column for column in EXPORT_COLUMNS if _column_type(column) == 'int64'}
+    assert len(integer_columns) == sum(field in INTEGER_FIELDS for fields in BREAKDOWN_FIELDS.values()
+                                       for field in fields)
@@ -0,0 +1,80 @@
+"""Snapshot reads: customers not scored yet are served stale, reading never writes, and fresh reads use the cache."""
+import pytest
+from sqlalchemy import text
+
+from app.models import Customer
+from app.services import score_cache
+from app.services.score_cache import LocalScoreCache
+from app.services.score_snapshots import (
+    get_score_snapshot,
+    mark_scores_stale,
+    query_score_snapshots,
+    recompute_scores,
+    refresh_customer_score,
+    summarize_score_snapshots,
+)
+
+
+def _snapshot_rows(db, customer_ids) -> int:
+    return db.execute(text("SELECT COUNT(*) FROM health_scores WHERE customer_id = ANY(:ids)"),
+                      {'ids': customer_ids}).scalar()
+
+
+def test_unscored_customer_is_served_stale_without_scoring(db, make_customer):
+    customer_id = make_customer()
+
+    snapshot = get_score_snapshot(db, customer_id)
+    assert snapshot['id'] == customer_id
+    assert snapshot['score'] is None and snapshot['label'] is None and snapshot['breakdown'] is None
+    assert snapshot['last_updated'] is None and snapshot['age_seconds'] is None
+    assert snapshot['stale'] is True
+    assert _snapshot_rows(db, [customer_id]) == 0
+    assert get_score_snapshot(db, 'test_missing') is None
+
+
+def test_snapshot_queries_list_unscored_customers_without_scoring(db, make_customer):
+    segment = make_customer()  # a segment of its own, so other customers stay out of the counts
+    scored, unscored = make_customer(segment), make_customer(segment)
+    recompute_scores(db, [scored])
+
+    rows, total = query_score_snapshots(db, segment=segment, sort='score', order='desc')
+    assert total == 2
+    assert [row['id'] for row in rows] == [scored, unscored]
+    assert rows[1]['score'] is None and rows[1]['stale'] is True
+    assert rows[0]['score'] is not None and rows[0]['stale'] is False
+
+    label = rows[0]['label']
+    assert [row['id'] for row in query_score_snapshots(db, segment=segment, label=label)[0]] == [scored]
+    assert summarize_score_snapshots(db, segment=segment)['customers'] == 1
+    assert _snapshot_rows(db, [unscored]) == 0
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LocalScoreCache(maxsize=100, ttl=60)
+    monkeypatch.setattr(score_cache, '_score_cache', cache)
+    return cache
+
+
+def _computed_at(db, customer_id):
+    return db.execute(text("SELECT computed_at FROM health_scores WHERE customer_id = :id"),
+                      {'id': customer_id}).scalar()
+
+
+def test_fresh_reads_use_the_cache_until_the_snapshot_is_dirty(db, make_customer, cache):
+    customer = db.get(Customer, make_customer())
+
+    first = refresh_customer_score(db, customer)
+    computed_at = _computed_at(db, customer.id)
+    assert cache.misses == 0  # no snapshot yet, so the lookup was skipped
+
+    assert refresh_customer_score(db, customer)['score'] == first['score']
+    assert cache.hits == 1
+    assert _computed_at(db, customer.id) == computed_at  # a hit leaves the snapshot alone
+
+    # An event ingested by another worker never reaches this process' cache, only the dirty mark
+    mark_scores_stale(db, [customer.id])
+    refresh_customer_score(db, customer)
+    assert cache.hits == 1
+    assert _computed_at(db, customer.id) > computed_at
+    assert get_score_snapshot(db, customer.id)['stale'] is False
@@ -0,0 +1,41 @@
+"""
+Every per-customer scoring query must read events, invoice_ledger and
+ticket_states through the indexes tuned for it (migrations 0002, 0004, 0006,
+0007), so dropping or mis-defining one of them fails.
+
+Sequential scans are disabled for the EXPLAIN, so the planner falls back to
+one only when no index can serve the query; the result does not depend on how
+much data the test database holds.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks.explain_scoring_queries import (
+    EXPECTED_INDEXES,
+    SCORING_QUERIES,
+    parent_indexes,
+    table_scans,
+    unexpected_scans,
+)
+
+PERIOD_END = datetime(2024, 9, 30, 23, 59, 59)
+PERIOD_START = PERIOD_END - timedelta(days=30)
+
+
+@pytest.mark.parametrize('name', list(SCORING_QUERIES))
+def test_scoring_query_uses_indexes(db, make_customer, name):
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = db.execute(text("EXPLAIN (FORMAT JSON) " + SCORING_QUERIES[name].text), {
+        'customer_id': make_customer(),
+        'period_start': PERIOD_START,
+        'period_end': PERIOD_END,
+        'previous_period_start': PERIOD_START - (PERIOD_END - PERIOD_START)
+    }).scalar()
+    plan = plan[0]['Plan'] if isinstance(plan, list) else json.loads(plan)[0]['Plan']
+
+    scans = table_scans(plan, parent_indexes(db))
+    assert {scan['table'] for scan in scans} == set(EXPECTED_INDEXES[name]), scans
+    assert unexpected_scans(name, scans) == []
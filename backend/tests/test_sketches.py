@@ -0,0 +1,104 @@
+"""Mergeable sketches: documented error bounds, and merging equals sketching everything at once."""
+import math
+
+import numpy as np
+import pytest
+
+from app.services.sketches import (
+    HLL_PRECISION,
+    QUANTILE_MAX_VALUE,
+    QUANTILE_MIN_VALUE,
+    QUANTILE_RELATIVE_ACCURACY,
+    HyperLogLog,
+    QuantileSketch,
+)
+
+# Relative standard error of the distinct count; tests allow 4 of them
+HLL_ERROR = 1.04 / math.sqrt(1 << HLL_PRECISION)
+
+
+def _hll(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    sketch.update(values)
+    return sketch
+
+
+def _quantiles(values) -> QuantileSketch:
+    sketch = QuantileSketch()
+    sketch.update(values)
+    return sketch
+
+
+@pytest.mark.parametrize('distinct', [0, 1, 50, 3000, 100000])
+def test_hll_estimate_within_error_bound(distinct):
+    values = [f'/endpoint/{i}' for i in range(distinct)]
+    estimate = _hll(values + values[:distinct // 2]).estimate()   # repeats do not count
+    assert abs(estimate - distinct) <= max(4 * HLL_ERROR * distinct, 1)
+
+
+def test_hll_merge_equals_one_sketch_of_everything():
+    days = [[f'feature_{(day * 37 + i) % 5000}' for i in range(800)] for day in range(30)]
+    merged, merged_bytes = HyperLogLog(), HyperLogLog()
+    for values in days:
+        merged.merge(_hll(values))
+        merged_bytes.merge_bytes(_hll(values).to_bytes())
+    whole = _hll(value for values in days for value in values)
+    assert np.array_equal(merged.registers, whole.registers)
+    assert np.array_equal(merged_bytes.registers, whole.registers)
+
+
+@pytest.mark.parametrize('distinct', [10, 20000])   # sparse and dense encodings
+def test_hll_bytes_round_trip(distinct):
+    sketch = _hll(str(i) for i in range(distinct))
+    data = sketch.to_bytes()
+    assert data[1] == (0 if distinct == 10 else 1)
+    assert len(data) <= 2 + (1 << HLL_PRECISION)
+    assert np.array_equal(HyperLogLog.from_bytes(data).registers, sketch.registers)
+
+
+def test_hll_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog().merge_bytes(bytes((HLL_PRECISION + 1, 1)))
+
+
+def test_quantiles_within_relative_error_of_nearest_rank():
+    rng = np.random.default_rng(7)
+    values = np.concatenate([rng.lognormal(5, 1.5, 20000), np.zeros(500), [QUANTILE_MIN_VALUE, 5e6]])
+    sketch = _quantiles(values)
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0):
+        exact = np.percentile(values, q * 100, method='inverted_cdf')
+        estimate = sketch.quantile(q)
+        if exact == 0:
+            assert estimate == 0.0
+        else:
+            assert abs(estimate - exact) <= QUANTILE_RELATIVE_ACCURACY * exact
+
+
+def test_quantile_merge_equals_one_sketch_of_everything():
+    rng = np.random.default_rng(11)
+    days = [rng.exponential(200, 1000) for _ in range(14)] + [np.array([]), np.array([0.0, 0.0])]
+    merged = QuantileSketch()
+    for values in days:
+        merged.merge_bytes(_quantiles(values).to_bytes())
+    everything = np.concatenate(days)
+    whole = _quantiles(everything)
+
+    assert np.array_equal(merged.counts, whole.counts)
+    assert (merged.count, merged.zero_count) == (len(everything), 2)
+    assert merged.min == everything.min() and merged.max == everything.max()
+    assert merged.mean() == pytest.approx(everything.mean())
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_quantiles_clamp_out_of_range_values_and_skip_nan():
+    sketch = _quantiles([1e-9, 1e9, float('nan')])
+    assert sketch.count == 2
+    assert sketch.quantile(0.0) == pytest.approx(QUANTILE_MIN_VALUE, rel=QUANTILE_RELATIVE_ACCURACY)
+    assert sketch.quantile(1.0) == pytest.approx(QUANTILE_MAX_VALUE, rel=QUANTILE_RELATIVE_ACCURACY)
+    assert (sketch.min, sketch.max) == (1e-9, 1e9)   # exact, unlike the buckets
+
+
+def test_empty_quantile_sketch():
+    sketch = QuantileSketch.from_bytes(QuantileSketch().to_bytes())
+    assert sketch.quantile(0.5) is None and sketch.mean() is None